@@ -0,0 +1,173 @@
+# Admission control for concurrent watches and downloads
+import itertools
+import logging
+import threading
+from heapq import heappush, heappop
+
+admission_logger = logging.getLogger('showroom.admission')
+
+
+class AdmissionController(object):
+    """Caps the number of Watchers watching and downloading at once.
+
+    Watchers ask for a slot with acquire() before entering "watch" or "download"
+    mode. When a cap is reached they are queued by Room priority (lower value first)
+    and woken when a slot frees up. A room that wants to download while all
+    download slots are taken preempts the lowest priority download, if that room's
+    priority is lower (higher value) than its own; the preempted Watcher falls back
+    to "live" mode and is queued to resume downloading. A room that is already live,
+    according to onlives, is let watch past the cap rather than queued behind rooms
+    still waiting for their start time: its first live check moves it on to
+    "live" or "download", freeing the slot again.
+
+    Slots are released automatically as Watchers change mode, via on_mode_change(),
+    which each Watcher registers as a mode listener.
+
+    Only rooms with a priority up to max_priority preempt, or skip the watch cap.
+
+    A limit of None or 0 means unlimited.
+    """
+    KINDS = ("watch", "download")
+
+    def __init__(self, max_watches=None, max_downloads=None, max_priority=None):
+        self._lock = threading.RLock()
+        self._limits = {"watch": max_watches or None, "download": max_downloads or None}
+        self.max_priority = max_priority
+        # kind -> {id(watcher): watcher}
+        self._holders = {kind: {} for kind in self.KINDS}
+        # kind -> heap of [priority, count, watcher], and kind -> {id(watcher): entry}
+        self._queues = {kind: [] for kind in self.KINDS}
+        self._queued = {kind: {} for kind in self.KINDS}
+        self._counter = itertools.count()
+        self._preemptions = 0
+        # watch slots granted past the cap to rooms already live
+        self._overruns = 0
+
+    def set_limit(self, kind, limit):
+        with self._lock:
+            self._limits[kind] = limit or None
+            self._wake_next(kind)
+
+    def _has_room(self, kind):
+        limit = self._limits[kind]
+        return limit is None or len(self._holders[kind]) < limit
+
+    def _peek(self, kind):
+        queue = self._queues[kind]
+        while queue and queue[0][2] is None:
+            heappop(queue)
+        return queue[0][2] if queue else None
+
+    def _enqueue(self, watcher, kind):
+        if id(watcher) not in self._queued[kind]:
+            entry = [watcher.priority, next(self._counter), watcher]
+            self._queued[kind][id(watcher)] = entry
+            heappush(self._queues[kind], entry)
+            admission_logger.debug('Queued {} for {}'.format(watcher.name, kind))
+        watcher._set_queued(kind)
+
+    def _dequeue(self, watcher, kind):
+        entry = self._queued[kind].pop(id(watcher), None)
+        if entry is not None:
+            entry[2] = None
+            watcher._set_queued(None)
+
+    def _grant(self, watcher, kind):
+        self._dequeue(watcher, kind)
+        self._holders[kind][id(watcher)] = watcher
+
+    def _wake_next(self, kind):
+        if self._has_room(kind):
+            head = self._peek(kind)
+            if head is not None:
+                head.wake()
+
+    def _find_victim(self, watcher):
+        """Returns the lowest priority download that watcher outranks, if any."""
+        victim = None
+        for holder in self._holders["download"].values():
+            if holder.priority > watcher.priority:
+                if victim is None or holder.priority > victim.priority:
+                    victim = holder
+        return victim
+
+    def acquire(self, watcher, kind, live=False):
+        """Asks for a watch or download slot.
+
+        Args:
+            watcher: the Watcher asking
+            kind: "watch" or "download"
+            live: whether the room is already live, which skips the watch cap
+
+        Returns:
+            True if the Watcher may proceed, else False, in which case it has been
+            queued and will be woken when it should ask again.
+        """
+        with self._lock:
+            holders = self._holders[kind]
+            if id(watcher) in holders:
+                return True
+            head = self._peek(kind)
+            if self._has_room(kind) and (head is None or head is watcher or watcher.priority <= head.priority):
+                self._grant(watcher, kind)
+                # there may be room for the next one too
+                self._wake_next(kind)
+                return True
+            may_preempt = self.max_priority is None or watcher.priority <= self.max_priority
+            if kind == "watch" and live and may_preempt:
+                admission_logger.info('Admitting {} past the watch cap, it is already live'.format(watcher.name))
+                self._grant(watcher, kind)
+                self._overruns += 1
+                return True
+            victim = self._find_victim(watcher) if kind == "download" and may_preempt else None
+            if victim is None:
+                self._enqueue(watcher, kind)
+                return False
+            admission_logger.info('Preempting {} (priority {}) for {} (priority {})'.format(
+                victim.name, victim.priority, watcher.name, watcher.priority))
+            del holders[id(victim)]
+            self._grant(watcher, kind)
+            self._preemptions += 1
+            self._enqueue(victim, kind)
+        # outside the lock, as stopping the victim's ffmpeg can take a while
+        victim.preempt()
+        return True
+
+    def holds(self, watcher, kind):
+        with self._lock:
+            return id(watcher) in self._holders[kind]
+
+    def release(self, watcher, kind):
+        """Gives up a slot, waking the next queued Watcher if any."""
+        with self._lock:
+            if self._holders[kind].pop(id(watcher), None) is not None:
+                self._wake_next(kind)
+
+    def withdraw(self, watcher, kind):
+        """Removes a Watcher from the queue, e.g. because it no longer needs a slot."""
+        with self._lock:
+            self._dequeue(watcher, kind)
+            self._wake_next(kind)
+
+    def on_mode_change(self, watcher):
+        """Mode listener: releases slots and queue places the Watcher no longer needs."""
+        mode = watcher.mode
+        with self._lock:
+            if mode != "watch":
+                self.release(watcher, "watch")
+            if mode != "download":
+                self.release(watcher, "download")
+            if mode != "schedule" and id(watcher) in self._queued["watch"]:
+                self.withdraw(watcher, "watch")
+            if mode not in ("live", "download") and id(watcher) in self._queued["download"]:
+                self.withdraw(watcher, "download")
+
+    def get_info(self):
+        with self._lock:
+            info = {kind: {"limit": self._limits[kind],
+                           "active": len(self._holders[kind]),
+                           "queued": len(self._queued[kind])}
+                    for kind in self.KINDS}
+            info["preemptions"] = self._preemptions
+            info["overruns"] = self._overruns
+            return info
@@ -1 +1,2 @@
 from .client import ShowroomClient
+from .async_client import AsyncShowroomClient
@@ -0,0 +1,172 @@
+import asyncio
+import functools
+import inspect
+import logging
+from json import JSONDecodeError
+
+from requests.exceptions import HTTPError
+
+from showroom import codec
+from .async_session import AsyncClientSession
+from .endpoints import (
+    LiveEndpointsMixin,
+    VREndpointsMixin,
+    RoomEndpointsMixin,
+    UserEndpointsMixin,
+    OtherEndpointsMixin
+)
+
+_base_url = 'https://www.showroom-live.com'
+
+async_client_logger = logging.getLogger('showroom.client')
+
+_MIXINS = (
+    LiveEndpointsMixin,
+    UserEndpointsMixin,
+    RoomEndpointsMixin,
+    VREndpointsMixin,
+    OtherEndpointsMixin
+)
+
+
+class _Request(Exception):
+    """Raised by _Capture to hand an endpoint method's request back to the async client."""
+    def __init__(self, endpoint, params, kwargs):
+        super().__init__(endpoint)
+        self.endpoint = endpoint
+        self.params = params
+        self.kwargs = kwargs
+
+
+class _Capture(*_MIXINS):
+    """Runs an endpoint method up to its request, to find out which request it makes."""
+    _csrf_token = None
+
+    def _api_get(self, endpoint, params=None, **kwargs):
+        raise _Request(endpoint, params, kwargs)
+
+    def _api_post(self, endpoint, params=None, data=None, **kwargs):
+        raise NotImplementedError('AsyncShowroomClient only supports GET endpoints')
+
+
+class _Replay(_Capture):
+    """Runs an endpoint method again with the result of its request, to get its return value."""
+    def __init__(self, result):
+        self._result = result
+
+    def _api_get(self, endpoint, params=None, **kwargs):
+        return self._result
+
+
+class AsyncShowroomClient(object):
+    """
+    asyncio client for the Showroom API.
+
+    Has a coroutine version of every GET endpoint of ShowroomClient, taking the
+    same arguments and returning the same results. These aren't redefined here:
+    each call runs ShowroomClient's own endpoint method (from the endpoint mixins)
+    once to capture the request it makes, awaits that request on an
+    AsyncClientSession, then runs it again with the response to get the result.
+
+    e.g.
+        async with AsyncShowroomClient() as client:
+            infos = await client.fetch_many('live_info', room_ids)
+
+    :param concurrency: maximum number of requests in flight at once
+    :param session: optional AsyncClientSession to use
+    :param base_url: site to send requests to, e.g. a showroom.mock server
+    """
+    def __init__(self, concurrency=32, session=None, base_url=None):
+        self._base_url = base_url or _base_url
+        self._session = session or AsyncClientSession(limit=concurrency)
+        self._last_response = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        await self._session.close()
+
+    async def _api_get(self, endpoint, params=None, return_response=False, default=None, raise_error=True):
+        try:
+            r = await self._session.get(self._base_url + endpoint, params=params)
+        except HTTPError as e:
+            r = e.response
+            if raise_error:
+                raise
+        self._last_response = r
+
+        if return_response:
+            return r
+        else:
+            try:
+                return codec.loads(r.content)
+            except JSONDecodeError as e:
+                async_client_logger.error('JSON decoding error while getting {}: {}'.format(r.request.url, e))
+                return default or {}
+
+    async def _call(self, name, args, kwargs):
+        try:
+            # e.g. poll_result(), which only calls another endpoint method
+            return getattr(_Capture(), name)(*args, **kwargs)
+        except _Request as request:
+            result = await self._api_get(request.endpoint, request.params, **request.kwargs)
+        return getattr(_Replay(result), name)(*args, **kwargs)
+
+    async def fetch_many(self, name, arguments, return_exceptions=True):
+        """Calls one endpoint for many arguments at once, e.g. live_info for every room_id.
+
+        The session's concurrency limit applies, so this can be given any number
+        of arguments.
+
+        :param name: name of the endpoint method, e.g. 'live_info'
+        :param arguments: iterable of arguments, each either a single value or a
+            tuple of positional arguments
+        :param return_exceptions: return errors in place of results rather than raise
+        :return: list of results, in the order of arguments
+        """
+        method = getattr(self, name)
+        calls = [method(*(args if isinstance(args, tuple) else (args,))) for args in arguments]
+        return await asyncio.gather(*calls, return_exceptions=return_exceptions)
+
+
+def _async_endpoint(name, func):
+    @functools.wraps(func)
+    async def endpoint(self, *args, **kwargs):
+        return await self._call(name, args, kwargs)
+    return endpoint
+
+
+def _get_endpoints():
+    """Returns {name: method} of the endpoint methods that only ever GET.
+
+    A method qualifies if it calls _api_get and never _api_post, or only calls
+    other methods that qualify, e.g. poll_result. Those that POST, e.g. login
+    or send_comment, are left out, so the async client has no such attribute.
+    """
+    methods = {}
+    for mixin in _MIXINS:
+        for name, func in inspect.getmembers(mixin, inspect.isfunction):
+            if not name.startswith('_') and name not in methods:
+                methods[name] = func
+    endpoints = {name: func for name, func in methods.items()
+                 if '_api_get' in func.__code__.co_names and '_api_post' not in func.__code__.co_names}
+    added = True
+    while added:
+        added = False
+        for name, func in methods.items():
+            names = set(func.__code__.co_names)
+            calls = names & set(methods)
+            if (name not in endpoints and calls and calls <= set(endpoints)
+                    and not names & {'_api_get', '_api_post'}):
+                endpoints[name] = func
+                added = True
+    return endpoints
+
+
+for _name, _func in _get_endpoints().items():
+    if not hasattr(AsyncShowroomClient, _name):
+        setattr(AsyncShowroomClient, _name, _async_endpoint(_name, _func))
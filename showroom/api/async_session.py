@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+from urllib.parse import urlsplit
+
+from requests import Request, Response
+from requests.exceptions import ChunkedEncodingError, HTTPError
+from requests.structures import CaseInsensitiveDict
+
+from .breaker import get_breaker, is_failure
+from .limiter import get_limiter
+from .session import (
+    RetryState, DeadlineExceeded, ua_str, _http_requests, _http_seconds, _http_retries, _http_deadlines
+)
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+async_session_logger = logging.getLogger('showroom.session')
+
+
+def _clean_params(params):
+    """Drops None values and stringifies the rest, as requests does but aiohttp doesn't."""
+    if not params:
+        return None
+    return {key: value if isinstance(value, str) else str(value)
+            for key, value in params.items() if value is not None}
+
+
+def _to_response(resp, body):
+    """Wraps an aiohttp response in a requests.Response, so callers see the same types either way."""
+    r = Response()
+    r.status_code = resp.status
+    r.reason = resp.reason
+    r.url = str(resp.url)
+    r.headers = CaseInsensitiveDict(resp.headers)
+    r.encoding = resp.charset
+    r._content = body
+    r.request = Request('GET', r.url).prepare()
+    return r
+
+
+class AsyncClientSession(object):
+    """asyncio counterpart of ClientSession, built on aiohttp.
+
+    get() retries exactly like ClientSession.get (see RetryState), and returns,
+    or raises HTTPError with, a requests.Response, so code handling the results
+    of either session is the same.
+
+    At most limit requests are in flight at once, the rest wait their turn, and
+    all of them share the process-wide RateLimiter and CircuitBreaker with
+    ClientSession. Coroutines share a thread, so request_deadline() doesn't
+    apply here, pass get() a deadline instead.
+
+    Args:
+        limit: maximum number of concurrent requests
+
+    Raises:
+        ImportError: if aiohttp isn't installed
+    """
+    def __init__(self, limit=32):
+        if aiohttp is None:
+            raise ImportError('AsyncClientSession requires aiohttp')
+        self.limit = limit
+        self.headers = {"User-Agent": ua_str}
+        # created on first use, so they belong to the loop the session is used from
+        self._session = None
+        self._semaphore = None
+
+    def _ensure_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit)
+            timeout = aiohttp.ClientTimeout(sock_connect=3.0, sock_read=15.0)
+            self._session = aiohttp.ClientSession(headers=self.headers, connector=connector, timeout=timeout)
+            self._semaphore = asyncio.Semaphore(self.limit)
+        return self._session
+
+    async def get(self, url, params=None, max_delay=30.0, max_retries=20, priority=None, deadline=None):
+        session = self._ensure_session()
+        limiter = get_limiter()
+        breaker = get_breaker()
+        retry = RetryState(url, max_delay=max_delay, max_retries=max_retries, limiter=limiter, deadline=deadline)
+        endpoint = urlsplit(url).path or '/'
+        params = _clean_params(params)
+        while True:
+            if retry.expired() or (limiter is not None and
+                                   await limiter.acquire_async(url, priority=priority,
+                                                               timeout=retry.remaining()) is None):
+                _http_deadlines.inc(endpoint=endpoint)
+                raise DeadlineExceeded(url) from retry.error
+            if breaker is not None:
+                breaker.before(url)
+            started = time.time()
+            status = None
+            try:
+                connect, read = retry.request_timeout()
+                timeout = aiohttp.ClientTimeout(sock_connect=connect, sock_read=read,
+                                                total=retry.remaining())
+                async with self._semaphore:
+                    async with session.get(url, params=params, timeout=timeout) as resp:
+                        body = await resp.read()
+                r = _to_response(resp, body)
+                status = r.status_code
+                r.raise_for_status()
+            except asyncio.TimeoutError as e:
+                status = 'timeout'
+                retry.timeout(e)
+
+            except aiohttp.ClientPayloadError as e:
+                status = 'chunked_encoding_error'
+                if not retry.chunked_encoding_error(e):
+                    raise ChunkedEncodingError(e)
+
+            except HTTPError as e:
+                if not retry.http_error(e):
+                    raise
+
+            except aiohttp.ClientConnectionError as e:
+                status = 'connection_error'
+                retry.connection_error(e)
+
+            else:
+                if limiter is not None:
+                    limiter.succeeded(url)
+                return r
+
+            finally:
+                _http_requests.inc(endpoint=endpoint, status=status or 'error')
+                _http_seconds.observe(time.time() - started, endpoint=endpoint)
+                if breaker is not None:
+                    breaker.record(url, is_failure(status))
+
+            if retry.expired(retry.wait):
+                _http_deadlines.inc(endpoint=endpoint)
+                raise DeadlineExceeded(url) from retry.error
+            if breaker is not None:
+                breaker.check(url)
+            _http_retries.inc(endpoint=endpoint, reason=status)
+            async_session_logger.debug('Retrying in {} seconds...'.format(retry.wait))
+            await asyncio.sleep(retry.wait)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
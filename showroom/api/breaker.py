@@ -0,0 +1,165 @@
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+from requests.exceptions import HTTPError
+
+from showroom.metrics import REGISTRY
+from .utils import error_response
+
+breaker_logger = logging.getLogger('showroom.breaker')
+
+_circuit_opened = REGISTRY.counter('showroom_http_circuit_opened_total',
+                                   'Times an endpoint\'s circuit opened after repeated failures', ('endpoint',))
+_circuit_rejected = REGISTRY.counter('showroom_http_circuit_rejected_total',
+                                     'Requests failed fast because their endpoint\'s circuit was open',
+                                     ('endpoint',))
+
+STATES = ("closed", "open", "half_open")
+
+
+class CircuitOpenError(HTTPError):
+    """Raised in place of a request to an endpoint whose circuit is open.
+
+    An HTTPError carrying an empty 503 response, so callers handle it like any
+    other failed request.
+    """
+    def __init__(self, url, retry_in):
+        super().__init__('Circuit open for {}, retrying in {:.1f} seconds'.format(url, retry_in),
+                         response=error_response(url, 503, 'Circuit Open'))
+        self.retry_in = retry_in
+
+
+def is_failure(status):
+    """Returns whether an attempt's status (see ClientSession.get) counts against its endpoint.
+
+    Timeouts, connection errors and 5xx do. Other responses, even 404 or 429,
+    mean the endpoint is up and answering.
+    """
+    if isinstance(status, int):
+        return status >= 500
+    return True
+
+
+class _Circuit(object):
+    def __init__(self):
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.opens = 0
+        self.rejected = 0
+
+
+class CircuitBreaker(object):
+    """Per endpoint circuit breaker, shared by every ClientSession and AsyncClientSession.
+
+    After threshold consecutive failed attempts (see is_failure) an endpoint's
+    circuit opens, and requests to it fail fast with CircuitOpenError for
+    cooldown seconds, instead of each retrying through the outage. Then it
+    half-opens: a single probe request is let through, closing the circuit if
+    it succeeds and opening it for another cooldown if not, while other
+    requests keep failing fast.
+
+    Args:
+        threshold: consecutive failures that open a circuit
+        cooldown: seconds a circuit stays open before probing
+    """
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._circuits = {}
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Builds the breaker from http.breaker, or returns None if disabled."""
+        config = settings.http.breaker if settings.http else None
+        if config is None:
+            return cls()
+        if not config.enabled:
+            return None
+        return cls(threshold=config.threshold or 5, cooldown=config.cooldown or 30.0)
+
+    def before(self, url):
+        """Called before each attempt, raises CircuitOpenError if it shouldn't be made."""
+        endpoint = urlsplit(url).path or '/'
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if circuit is None or circuit.state == "closed":
+                return
+            retry_in = circuit.opened_at + self.cooldown - time.monotonic()
+            if circuit.state == "open" and retry_in <= 0:
+                circuit.state = "half_open"
+            if circuit.state == "half_open" and not circuit.probing:
+                circuit.probing = True
+                return
+            circuit.rejected += 1
+        _circuit_rejected.inc(endpoint=endpoint)
+        raise CircuitOpenError(url, max(retry_in, 0.0))
+
+    def check(self, url):
+        """Called before retrying, raises CircuitOpenError if the circuit isn't closed.
+
+        Unlike before(), never lets a probe through: a request whose failures
+        opened the circuit gives up rather than retrying through the outage.
+        """
+        endpoint = urlsplit(url).path or '/'
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if circuit is None or circuit.state == "closed":
+                return
+            retry_in = circuit.opened_at + self.cooldown - time.monotonic()
+        raise CircuitOpenError(url, max(retry_in, 0.0))
+
+    def record(self, url, failed):
+        """Called after each attempt made, with whether it failed."""
+        endpoint = urlsplit(url).path or '/'
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if circuit is None:
+                if not failed:
+                    return
+                circuit = self._circuits[endpoint] = _Circuit()
+            probe, circuit.probing = circuit.probing, False
+            if not failed:
+                if circuit.state != "closed":
+                    breaker_logger.info('Circuit for {} closed'.format(endpoint))
+                circuit.state = "closed"
+                circuit.failures = 0
+                return
+            circuit.failures += 1
+            if not probe and (circuit.state != "closed" or circuit.failures < self.threshold):
+                return
+            circuit.state = "open"
+            circuit.opened_at = time.monotonic()
+            circuit.opens += 1
+        _circuit_opened.inc(endpoint=endpoint)
+        breaker_logger.warning('{} failures in a row from {}, failing fast for {:.1f} seconds'.format(
+            circuit.failures, endpoint, self.cooldown))
+
+    def get_info(self):
+        """Returns every endpoint that has failed, with its state and counts."""
+        now = time.monotonic()
+        with self._lock:
+            return {endpoint: {"state": c.state, "failures": c.failures, "opens": c.opens,
+                               "rejected": c.rejected,
+                               "retry_in": round(max(c.opened_at + self.cooldown - now, 0.0), 3)
+                               if c.state == "open" else 0.0}
+                    for endpoint, c in self._circuits.items()}
+
+
+_breaker = CircuitBreaker()
+
+
+def get_breaker():
+    """Returns the process-wide CircuitBreaker, or None if circuit breaking is off."""
+    return _breaker
+
+
+def set_breaker(breaker):
+    """Replaces the process-wide CircuitBreaker, None turns it off. Returns the previous one."""
+    global _breaker
+    previous, _breaker = _breaker, breaker
+    return previous
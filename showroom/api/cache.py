@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+
+from showroom.metrics import REGISTRY
+from .utils import request_key
+
+_cache_lookups = REGISTRY.counter('showroom_http_cache_total',
+                                  'API responses by cache outcome (hit, miss, revalidated), by endpoint',
+                                  ('endpoint', 'outcome'))
+
+# seconds responses stay fresh, by endpoint; anything not listed isn't cached
+# is_live and streaming_url are left out on purpose, live detection needs them fresh
+DEFAULT_TTLS = {
+    "/api/live/onlives": 3.0,
+    "/api/live/onlive_num": 3.0,
+    "/api/live/upcoming": 30.0,
+    "/api/live/live_info": 5.0,
+    "/api/live/telop": 5.0,
+    "/api/room/next_live": 60.0,
+    "/api/room/event_and_support": 60.0,
+    "/api/room/banners": 3600.0,
+    "/api/room/profile": 3600.0,
+    "/api/room/settings": 3600.0,
+    "/api/user/profile": 3600.0,
+    "/api/avatar/server_settings": 3600.0,
+    "/api/radio_images": 3600.0,
+    "/api/service_settings/": 3600.0,
+}
+
+OUTCOMES = ("hit", "miss", "revalidated")
+
+
+class ResponseCache(object):
+    """LRU cache of API responses, each fresh for its endpoint's ttl.
+
+    Responses are kept as requests.Response objects, so every hit is decoded
+    anew and callers never share (and mutate) the same result.
+
+    Once a response goes stale it is kept until evicted, and if the server sent an
+    ETag or Last-Modified header it is revalidated with a conditional request:
+    a 304 Not Modified makes it fresh again without transferring the body.
+
+    Args:
+        ttls: {endpoint: seconds}, merged over DEFAULT_TTLS, 0 disables caching
+        max_entries: most responses kept, the least recently used are evicted first
+    """
+    def __init__(self, ttls=None, max_entries=1024):
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # (endpoint, params) -> [response, POSIX time it was stored or revalidated]
+        self._entries = OrderedDict()
+        self._counts = {}
+        self.evictions = 0
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Builds the cache from http.cache, or returns None if disabled."""
+        config = settings.http.cache if settings.http else None
+        if config is None:
+            return cls()
+        if not config.enabled:
+            return None
+        ttls = dict(config.ttl.items()) if config.ttl else None
+        return cls(ttls=ttls, max_entries=config.max_entries or 1024)
+
+    def ttl(self, endpoint):
+        return self.ttls.get(endpoint, 0)
+
+    def lookup(self, endpoint, params=None, now=None):
+        """Returns (response, fresh), or (None, False) if nothing is cached."""
+        now = now or time.time()
+        key = request_key(endpoint, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            self._entries.move_to_end(key)
+            return entry[0], now - entry[1] < self.ttl(endpoint)
+
+    @staticmethod
+    def conditional_headers(response):
+        """Returns the headers revalidating a stale response, or None if it can't be."""
+        headers = {}
+        if response.headers.get('ETag'):
+            headers['If-None-Match'] = response.headers['ETag']
+        if response.headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = response.headers['Last-Modified']
+        return headers or None
+
+    def store(self, endpoint, params, response, now=None):
+        now = now or time.time()
+        key = request_key(endpoint, params)
+        with self._lock:
+            self._entries[key] = [response, now]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def record(self, endpoint, outcome):
+        """Counts the outcome of a lookup, one of OUTCOMES."""
+        with self._lock:
+            counts = self._counts.setdefault(endpoint, dict.fromkeys(OUTCOMES, 0))
+            counts[outcome] += 1
+        _cache_lookups.inc(endpoint=endpoint, outcome=outcome)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_info(self):
+        """Returns totals and per endpoint counts of each outcome."""
+        with self._lock:
+            by_endpoint = {endpoint: dict(counts) for endpoint, counts in self._counts.items()}
+            info = {outcome: sum(c[outcome] for c in by_endpoint.values()) for outcome in OUTCOMES}
+            info.update(entries=len(self._entries), evictions=self.evictions, endpoints=by_endpoint)
+        return info
@@ -1,4 +1,7 @@
-from .session import ClientSession
+from .session import ClientSession, DeadlineExceeded, current_deadline
+from .cache import ResponseCache
+from .coalesce import FlightTimeout, SingleFlight
+from .hooks import instrument
 from .endpoints import (
     LiveEndpointsMixin,
     VREndpointsMixin,
@@ -8,7 +11,8 @@ from .endpoints import (
 )
 from json import JSONDecodeError
 import time
-from showroom.api.utils import get_csrf_token
+from showroom import codec
+from showroom.api.utils import get_csrf_token, request_key
 from requests.exceptions import HTTPError
 import logging
 _base_url = 'https://www.showroom-live.com'
@@ -30,11 +34,21 @@ class ShowroomClient(
     Client for interacting with the Showroom API.
     
     :param cookies: dict containing stored cookies
+    :param cache: ResponseCache for GET responses, True for a default one, None to disable
+    :param coalesce: whether concurrent identical GETs share one request
+    :param base_url: site to send requests to, e.g. a showroom.mock server
     
     :ivar cookies: Reference to the underlying session's cookies.
+    :ivar cache: the ResponseCache, or None
     """
-    def __init__(self, cookies=None):
-        self._session = ClientSession()
+    def __init__(self, cookies=None, cache=True, coalesce=True, base_url=None):
+        self._base_url = base_url or _base_url
+        self._session = ClientSession(base_url=self._base_url)
+        if cache is True:
+            cache = ResponseCache()
+        self.cache = cache or None
+        # e.g. a Watcher, its Downloader and CommentLogger all asking about a room that just went live
+        self.flights = SingleFlight() if coalesce else None
         self._auth = None
         self.cookies = self._session.cookies
 
@@ -58,7 +72,7 @@ class ShowroomClient(
     @property
     def _csrf_token(self):
         if not self.__csrf_token:
-            self._update_csrf_token(_base_url)
+            self._update_csrf_token(self._base_url)
         return self.__csrf_token
 
     def _update_csrf_token(self, url):
@@ -67,28 +81,73 @@ class ShowroomClient(
         self.__csrf_token = get_csrf_token(r.text)
 
     def _api_get(self, endpoint, params=None, return_response=False, default=None, raise_error=True):
-        try:
-            r = self._session.get(_base_url + endpoint, params=params)
-        except HTTPError as e:
-            r = e.response
-            if raise_error:
-                raise
+        with instrument("GET", endpoint, params) as event:
+            try:
+                if self.flights is not None:
+                    # unless this thread turns out to lead the flight, see _get
+                    event.cache = "coalesced"
+                    # the flight's leader may have no deadline, or a later one, so don't wait on it past ours
+                    deadline = current_deadline()
+                    try:
+                        r = self.flights.do(request_key(endpoint, params), lambda: self._get(endpoint, params, event),
+                                            label=endpoint,
+                                            timeout=deadline - time.time() if deadline is not None else None)
+                    except FlightTimeout:
+                        raise DeadlineExceeded(self._base_url + endpoint) from None
+                else:
+                    r = self._get(endpoint, params, event)
+            except HTTPError as e:
+                r = e.response
+                event.record(r, e)
+                if raise_error:
+                    raise
+            else:
+                event.record(r)
         self._last_response = r
 
         if return_response:
             return r
         else:
             try:
-                return r.json()
+                return codec.loads(r.content)
             except JSONDecodeError as e:
                 client_logger.error('JSON decoding error while getting {}: {}'.format(r.request.url, e))
                 return default or {}
 
+    def _get(self, endpoint, params, event):
+        event.cache = None
+        if self.cache is not None and self.cache.ttl(endpoint):
+            return self._cached_get(endpoint, params, event)
+        return self._session.get(self._base_url + endpoint, params=params)
+
+    def _cached_get(self, endpoint, params, event):
+        """GETs through the response cache, revalidating stale responses where possible."""
+        cached, fresh = self.cache.lookup(endpoint, params)
+        if fresh:
+            self.cache.record(endpoint, "hit")
+            event.cache = "hit"
+            return cached
+        headers = self.cache.conditional_headers(cached) if cached is not None else None
+        r = self._session.get(self._base_url + endpoint, params=params, headers=headers)
+        if r.status_code == 304 and cached is not None:
+            event.cache = "revalidated"
+            r = cached
+        else:
+            event.cache = "miss"
+        self.cache.record(endpoint, event.cache)
+        if r.status_code == 200:
+            self.cache.store(endpoint, params, r)
+        return r
+
     def _api_post(self, endpoint, params=None, data=None, return_response=None, default=None):
-        try:
-            r = self._session.post(_base_url + endpoint, params=params, data=data)
-        except HTTPError as e:
-            r = e.response
+        with instrument("POST", endpoint, params) as event:
+            try:
+                r = self._session.post(self._base_url + endpoint, params=params, data=data)
+            except HTTPError as e:
+                r = e.response
+                event.record(r, e)
+            else:
+                event.record(r)
         self._last_response = r
 
         # TODO: check for expired csrf_token
@@ -96,7 +155,7 @@ class ShowroomClient(
             return r
         else:
             try:
-                return r.json()
+                return codec.loads(r.content)
             except JSONDecodeError as e:
                 client_logger.error('JSON decoding error while posting to {}: {}'.format(r.request.url, e))
                 return default or {}
@@ -0,0 +1,79 @@
+import threading
+
+from showroom.metrics import REGISTRY
+
+_coalesced = REGISTRY.counter('showroom_http_coalesced_total',
+                              'API calls answered by an identical request already in flight, by endpoint',
+                              ('endpoint',))
+
+
+class FlightTimeout(TimeoutError):
+    """Raised to a caller that gave up waiting on someone else's identical call."""
+
+
+class _Flight(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Collapses concurrent identical calls into one.
+
+    The first caller for a key runs the call, anyone asking for the same key
+    before it finishes waits and gets the same result, or the same exception.
+    Nothing is remembered once the call finishes, that's ResponseCache's job.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, func, label=None, timeout=None):
+        """Returns func(), or the result of an identical call already in flight.
+
+        Args:
+            key: hashable identifying the call, e.g. from request_key()
+            func: callable making the call
+            label: name the call is counted under in metrics, e.g. the endpoint
+            timeout: seconds to wait at most on a call already in flight, None for
+                as long as it takes. Doesn't apply to running func() itself.
+
+        Raises:
+            FlightTimeout: if the call in flight didn't finish within timeout
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            _coalesced.inc(endpoint=label or '')
+            if not flight.done.wait(timeout):
+                raise FlightTimeout('Gave up waiting on {} after {:.1f} seconds'.format(label or key, timeout))
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def get_info(self):
+        with self._lock:
+            in_flight = len(self._flights)
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": in_flight}
@@ -0,0 +1,243 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from showroom.latency import percentile
+
+hooks_logger = logging.getLogger('showroom.hooks')
+
+_local = threading.local()
+
+
+class RequestEvent(object):
+    """One request, as passed to hooks.
+
+    Attributes:
+        method: "GET" or "POST"
+        endpoint: the url's path, e.g. "/room/is_live"
+        params: query parameters, or None
+        status: status code of the final response, None if there was none
+        error: name of the exception the request failed with, None if it didn't
+        bytes: size of the final response's body
+        latency: seconds from the start of the request to the end of its last
+            attempt, rate limiter waits and retries included
+        retries: attempts made after the first
+        cache: "hit", "revalidated" or "miss" if the response cache was looked in,
+            "coalesced" if the response was shared by an identical request in flight,
+            else None
+    """
+    def __init__(self, method, endpoint, params=None):
+        self.method = method
+        self.endpoint = endpoint
+        self.params = params
+        self.status = None
+        self.error = None
+        self.bytes = 0
+        self.latency = 0.0
+        self.retries = 0
+        self.cache = None
+
+    def record(self, response, error=None):
+        """Records the final response, and the error raised for it if any."""
+        if response is not None:
+            self.status = response.status_code
+            self.bytes = len(response.content or b'')
+        if error is not None:
+            self.error = type(error).__name__
+
+    def get_info(self):
+        return {"method": self.method, "endpoint": self.endpoint, "params": self.params,
+                "status": self.status, "error": self.error, "bytes": self.bytes,
+                "latency": self.latency, "retries": self.retries, "cache": self.cache}
+
+
+class RequestHook(object):
+    """Base class for hooks, which see every request ShowroomClient and ClientSession make.
+
+    Register one with add_hook(). Both methods are called on the thread making
+    the request, so should be quick; exceptions they raise are logged and
+    otherwise ignored.
+
+    AsyncShowroomClient's requests aren't reported.
+    """
+    def request_started(self, event):
+        """Called before the request, with only method, endpoint and params set."""
+
+    def request_finished(self, event):
+        """Called once the request has its final response, or has failed."""
+
+
+_hooks = ()
+_hooks_lock = threading.Lock()
+
+
+def add_hook(hook):
+    """Registers a RequestHook for every request this process makes."""
+    global _hooks
+    with _hooks_lock:
+        if hook not in _hooks:
+            _hooks = _hooks + (hook,)
+
+
+def remove_hook(hook):
+    global _hooks
+    with _hooks_lock:
+        _hooks = tuple(e for e in _hooks if e is not hook)
+
+
+def get_hooks():
+    return _hooks
+
+
+def _call(hooks, name, event):
+    for hook in hooks:
+        try:
+            getattr(hook, name)(event)
+        except Exception as e:
+            hooks_logger.exception('{} failed in {}: {}'.format(name, type(hook).__name__, e))
+
+
+def current_event():
+    """Returns the RequestEvent of the request this thread is making, or None."""
+    return getattr(_local, 'event', None)
+
+
+@contextmanager
+def instrument(method, endpoint, params=None):
+    """Reports the block to every hook as one request, yielding its RequestEvent to fill in.
+
+    A block inside another on the same thread, e.g. ClientSession.get inside
+    ShowroomClient._api_get, yields the outer block's event instead, so each
+    request is reported once, with what both layers know about it.
+    """
+    outer = current_event()
+    if outer is not None:
+        yield outer
+        return
+    event = RequestEvent(method, endpoint, params)
+    hooks = _hooks
+    _call(hooks, 'request_started', event)
+    _local.event = event
+    started = time.perf_counter()
+    try:
+        yield event
+    except BaseException as e:
+        if event.error is None:
+            event.error = type(e).__name__
+        raise
+    finally:
+        event.latency = time.perf_counter() - started
+        _local.event = None
+        _call(hooks, 'request_finished', event)
+
+
+class _Endpoint(object):
+    def __init__(self, max_samples):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.statuses = {}
+        self.cache = {}
+        # (monotonic time finished, latency, failed, retries)
+        self.samples = deque(maxlen=max_samples)
+
+
+class EndpointStats(RequestHook):
+    """The default hook: per endpoint totals, and latency percentiles and error rates over a rolling window.
+
+    A request counts as an error if it raised, or its final response was 4xx or
+    5xx, whether or not the caller let it raise.
+
+    Args:
+        window: seconds of requests the percentiles and rates are over
+        max_samples: most requests kept per endpoint, the oldest dropped first
+    """
+    def __init__(self, window=300.0, max_samples=2000):
+        self.window = window
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._started = time.monotonic()
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Builds the aggregator from http.stats, or returns None if disabled."""
+        config = settings.http.stats if settings.http else None
+        if config is None:
+            return cls()
+        if not config.enabled:
+            return None
+        return cls(window=config.window or 300.0, max_samples=config.max_samples or 2000)
+
+    def request_finished(self, event):
+        failed = event.error is not None or event.status is None or event.status >= 400
+        outcome = str(event.status) if event.status is not None else event.error
+        with self._lock:
+            endpoint = self._endpoints.get(event.endpoint)
+            if endpoint is None:
+                endpoint = self._endpoints[event.endpoint] = _Endpoint(self.max_samples)
+            endpoint.requests += 1
+            endpoint.errors += failed
+            endpoint.retries += event.retries
+            endpoint.bytes += event.bytes
+            endpoint.statuses[outcome] = endpoint.statuses.get(outcome, 0) + 1
+            if event.cache is not None:
+                endpoint.cache[event.cache] = endpoint.cache.get(event.cache, 0) + 1
+            endpoint.samples.append((time.monotonic(), event.latency, failed, event.retries))
+
+    def get_info(self):
+        """Returns per endpoint totals, and the window's rates and latency percentiles in ms.
+
+        e.g.
+            {"/room/is_live": {"requests": 1200, "errors": 3, "retries": 5, "bytes": 9600,
+                               "statuses": {"200": 1197, "503": 3}, "cache": {},
+                               "window": {"requests": 300, "per_second": 1.0, "error_rate": 0.0,
+                                          "retry_rate": 0.003,
+                                          "latency_ms": {"p50": 41.2, "p90": 80.5, "p99": 310.0,
+                                                         "max": 512.3}}}}
+        """
+        now = time.monotonic()
+        info = {}
+        with self._lock:
+            for name, endpoint in self._endpoints.items():
+                samples = endpoint.samples
+                while samples and samples[0][0] < now - self.window:
+                    samples.popleft()
+                latencies = sorted(sample[1] * 1e3 for sample in samples)
+                count = len(latencies)
+                if count and count == samples.maxlen:
+                    # older requests were dropped, so only the ones kept count towards the rate
+                    span = now - samples[0][0]
+                else:
+                    span = min(self.window, now - self._started)
+                span = max(span, 1e-3)
+                failures = sum(sample[2] for sample in samples)
+                retries = sum(sample[3] for sample in samples)
+                info[name] = {
+                    "requests": endpoint.requests,
+                    "errors": endpoint.errors,
+                    "retries": endpoint.retries,
+                    "bytes": endpoint.bytes,
+                    "statuses": dict(endpoint.statuses),
+                    "cache": dict(endpoint.cache),
+                    "window": {
+                        "requests": count,
+                        "per_second": round(count / span, 3),
+                        "error_rate": round(failures / count, 4) if count else 0.0,
+                        "retry_rate": round(retries / count, 4) if count else 0.0,
+                        "latency_ms": {key: round(value, 1) if value is not None else None
+                                       for key, value in (("p50", percentile(latencies, 50)),
+                                                          ("p90", percentile(latencies, 90)),
+                                                          ("p99", percentile(latencies, 99)),
+                                                          ("max", latencies[-1] if latencies else None))},
+                    },
+                }
+        return info
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+            self._started = time.monotonic()
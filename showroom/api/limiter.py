@@ -0,0 +1,359 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from showroom.metrics import REGISTRY
+
+limiter_logger = logging.getLogger('showroom.limiter')
+
+_limiter_waits = REGISTRY.counter('showroom_http_limiter_wait_seconds_total',
+                                  'Time requests spent waiting on the rate limiter, by endpoint class',
+                                  ('endpoint_class',))
+_limiter_backoffs = REGISTRY.counter('showroom_http_limiter_backoffs_total',
+                                     'Times the whole process backed off a host after a 429 or Retry-After',
+                                     ('host',))
+
+# endpoints are grouped into classes, each with its own bucket per host
+# the rest of /api/live/ is "live", and everything else "profile"
+ENDPOINT_CLASSES = {
+    "/room/is_live": "detection",
+    "/api/live/streaming_url": "detection",
+    "/api/live/onlives": "detection",
+    "/api/live/onlive_num": "detection",
+    "/api/live/upcoming": "schedule",
+    "/api/time_table/time_tables": "schedule",
+    "/api/room/next_live": "schedule",
+}
+
+# lower goes first: when requests of several classes are waiting on the same
+# host, e.g. after a backoff, go-live checks are let through before profile scrapes
+PRIORITIES = {
+    "detection": 0,
+    "schedule": 1,
+    "live": 2,
+    "profile": 3,
+}
+
+# streaming_url polled ahead of a scheduled start, see Watcher.prewarm: shares the
+# detection bucket, but waits behind is_live and onlives
+PREWARM_PRIORITY = 0.5
+
+# how many requests may be made at once after a quiet spell, for classes given a
+# rate; no class is held to a rate unless one is set, e.g. in http.limiter.rate
+DEFAULT_BURSTS = {
+    "detection": 20,
+    "schedule": 10,
+    "live": 20,
+    "profile": 5,
+}
+
+
+def endpoint_class(url):
+    """Returns (host, endpoint class) of a url."""
+    parts = urlsplit(url)
+    path = parts.path or '/'
+    if path in ENDPOINT_CLASSES:
+        return parts.netloc, ENDPOINT_CLASSES[path]
+    elif path.startswith('/api/live/'):
+        return parts.netloc, "live"
+    return parts.netloc, "profile"
+
+
+def retry_after(response):
+    """Returns the seconds asked for by a response's Retry-After header, or None."""
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket(object):
+    """Lets through rate requests per second on average, and up to burst at once.
+
+    A rate of None lets every request through, only counting them."""
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self.granted = 0
+        self.throttled = 0
+        self.wait_seconds = 0.0
+
+    def delay(self, now):
+        """Returns seconds until a token is available, 0 if one is now."""
+        if self.rate is None:
+            self.tokens = float(self.burst)
+            return 0
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def get_info(self):
+        return {"rate": self.rate, "burst": self.burst, "tokens": round(self.tokens, 2),
+                "granted": self.granted, "throttled": self.throttled,
+                "wait_seconds": round(self.wait_seconds, 3)}
+
+
+class _Host(object):
+    def __init__(self):
+        self.buckets = {}
+        # waiting requests, as [priority, sequence, bucket]
+        self.waiters = []
+        self.blocked_until = 0.0
+        # consecutive backoffs without a success in between
+        self.strikes = 0
+        self.backoffs = 0
+
+
+class RateLimiter(object):
+    """Process-wide rate limiter, shared by every ClientSession and AsyncClientSession.
+
+    Each host has a TokenBucket per endpoint class (see ENDPOINT_CLASSES), which
+    only limits classes given a rate, so e.g. profile scrapes can be kept from
+    using up the requests go-live checks need. Requests waiting on the same host
+    are let through in order of priority.
+
+    A 429, or a Retry-After header, from a host backs off every request to it,
+    not just the one that got it: for as long as Retry-After asks, or else for
+    backoff seconds, doubling with each 429 in a row up to max_backoff.
+
+    Args:
+        rates: {endpoint class: requests per second}, classes left out aren't limited
+        bursts: {endpoint class: requests}, merged over DEFAULT_BURSTS
+        backoff: seconds to back off after a 429 without Retry-After
+        max_backoff: longest backoff after repeated 429s
+    """
+    def __init__(self, rates=None, bursts=None, backoff=30.0, max_backoff=300.0):
+        self.rates = dict(rates or {})
+        self.bursts = dict(DEFAULT_BURSTS)
+        self.bursts.update(bursts or {})
+        self.backoff_seconds = backoff
+        self.max_backoff = max_backoff
+        self._cond = threading.Condition()
+        self._hosts = {}
+        self._seq = itertools.count()
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Builds the limiter from http.limiter, or returns None if disabled."""
+        config = settings.http.limiter if settings.http else None
+        if config is None:
+            return cls()
+        if not config.enabled:
+            return None
+        return cls(rates=dict(config.rate.items()) if config.rate else None,
+                   bursts=dict(config.burst.items()) if config.burst else None,
+                   backoff=config.backoff or 30.0,
+                   max_backoff=config.max_backoff or 300.0)
+
+    def _host(self, host):
+        if host not in self._hosts:
+            self._hosts[host] = _Host()
+        return self._hosts[host]
+
+    def _bucket(self, host, cls):
+        if cls not in host.buckets:
+            bucket = TokenBucket(self.rates.get(cls), self.bursts.get(cls, DEFAULT_BURSTS["profile"]))
+            if host.blocked_until > time.monotonic():
+                # created during a backoff, which empties every bucket
+                bucket.tokens = 0.0
+            host.buckets[cls] = bucket
+        return host.buckets[cls]
+
+    @staticmethod
+    def _first_ready(host, waiter, now):
+        # nothing ahead of waiter could go right now
+        for other in host.waiters:
+            if other[:2] < waiter[:2] and other[2].delay(now) <= 0:
+                return False
+        return True
+
+    def _take(self, host, bucket, waiter, now):
+        """Takes a token for waiter if it may go now, else returns seconds to wait, None if unknown."""
+        wait = host.blocked_until - now
+        if wait > 0:
+            return wait
+        wait = bucket.delay(now)
+        if wait > 0:
+            return wait
+        if not self._first_ready(host, waiter, now):
+            return None
+        bucket.tokens -= 1
+        bucket.granted += 1
+        return 0
+
+    def acquire(self, url, priority=None, timeout=None):
+        """Blocks until a request to url may be made, returns seconds waited.
+
+        Args:
+            url: the request's url, which decides its host and endpoint class
+            priority: overrides the endpoint class's priority, lower goes first
+            timeout: seconds to wait at most, after which None is returned
+        """
+        host_name, cls = endpoint_class(url)
+        if priority is None:
+            priority = PRIORITIES[cls]
+        started = time.monotonic()
+        with self._cond:
+            host = self._host(host_name)
+            bucket = self._bucket(host, cls)
+            waiter = [priority, next(self._seq), bucket]
+            heapq.heappush(host.waiters, waiter)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._take(host, bucket, waiter, now)
+                    if wait == 0:
+                        break
+                    # wakes early whenever another waiter goes or a backoff starts
+                    wait = min(wait or 1.0, 1.0)
+                    if timeout is not None:
+                        if now - started >= timeout:
+                            return None
+                        wait = min(wait, started + timeout - now)
+                    self._cond.wait(wait)
+            finally:
+                host.waiters.remove(waiter)
+                heapq.heapify(host.waiters)
+                self._cond.notify_all()
+            waited = time.monotonic() - started
+            if waited > 0.001:
+                bucket.throttled += 1
+                bucket.wait_seconds += waited
+        if waited > 0.001:
+            _limiter_waits.inc(waited, endpoint_class=cls)
+        return waited
+
+    async def acquire_async(self, url, priority=None, timeout=None):
+        """Coroutine version of acquire, for AsyncClientSession.
+
+        Doesn't queue, so unlike acquire only takes priority into account against
+        requests already waiting in acquire.
+        """
+        host_name, cls = endpoint_class(url)
+        if priority is None:
+            priority = PRIORITIES[cls]
+        started = time.monotonic()
+        while True:
+            with self._cond:
+                host = self._host(host_name)
+                bucket = self._bucket(host, cls)
+                wait = self._take(host, bucket, [priority, next(self._seq), bucket], time.monotonic())
+            if wait == 0:
+                break
+            if timeout is not None and time.monotonic() - started >= timeout:
+                return None
+            await asyncio.sleep(min(wait or 0.05, 1.0))
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            with self._cond:
+                bucket.throttled += 1
+                bucket.wait_seconds += waited
+            _limiter_waits.inc(waited, endpoint_class=cls)
+        return waited
+
+    def set_rate(self, cls, rate, burst=None):
+        """Changes an endpoint class's rate, and burst if given, on every host. None lifts the limit.
+
+        e.g. for a bulk job that's meant to go faster than the class's everyday rate.
+
+        Returns:
+            the previous (rate, burst), to set back afterwards
+        """
+        with self._cond:
+            previous = (self.rates.get(cls), self.bursts.get(cls, DEFAULT_BURSTS["profile"]))
+            self.rates[cls] = rate
+            if burst is not None:
+                self.bursts[cls] = burst
+            now = time.monotonic()
+            for host in self._hosts.values():
+                bucket = host.buckets.get(cls)
+                if bucket is None:
+                    continue
+                # tokens earned so far are at the old rate
+                bucket.delay(now)
+                bucket.rate = rate
+                if burst is not None:
+                    bucket.burst = max(burst, 1)
+                    bucket.tokens = min(bucket.tokens, bucket.burst)
+            self._cond.notify_all()
+        return previous
+
+    def backoff(self, url, seconds=None):
+        """Holds every request to url's host for seconds, or the next backoff step if None.
+
+        Buckets are emptied too, so requests resume at their rate rather than all at once.
+        """
+        host_name, cls = endpoint_class(url)
+        with self._cond:
+            host = self._host(host_name)
+            if seconds is None:
+                seconds = min(self.backoff_seconds * 2 ** host.strikes, self.max_backoff)
+            host.strikes += 1
+            host.backoffs += 1
+            now = time.monotonic()
+            host.blocked_until = max(host.blocked_until, now + seconds)
+            for bucket in host.buckets.values():
+                bucket.delay(now)
+                bucket.tokens = 0.0
+            self._cond.notify_all()
+        _limiter_backoffs.inc(host=host_name)
+        limiter_logger.warning('Backing off all requests to {} for {:.1f} seconds'.format(host_name, seconds))
+        return seconds
+
+    def succeeded(self, url):
+        """Records a successful request, so the next backoff starts from the shortest again."""
+        host_name, cls = endpoint_class(url)
+        with self._cond:
+            host = self._hosts.get(host_name)
+            if host is not None and host.strikes:
+                host.strikes = 0
+
+    def get_info(self):
+        """Returns per host backoff state, and per endpoint class bucket state and counts."""
+        now = time.monotonic()
+        info = {}
+        with self._cond:
+            for host_name, host in self._hosts.items():
+                waiting = {}
+                for priority, seq, bucket in host.waiters:
+                    waiting[priority] = waiting.get(priority, 0) + 1
+                buckets = {}
+                for cls, bucket in host.buckets.items():
+                    bucket.delay(now)
+                    buckets[cls] = bucket.get_info()
+                info[host_name] = {
+                    "backoff": round(max(host.blocked_until - now, 0.0), 3),
+                    "backoffs": host.backoffs,
+                    "waiting": waiting,
+                    "buckets": buckets,
+                }
+        return info
+
+
+_limiter = RateLimiter()
+
+
+def get_limiter():
+    """Returns the process-wide RateLimiter, or None if rate limiting is off."""
+    return _limiter
+
+
+def set_limiter(limiter):
+    """Replaces the process-wide RateLimiter, None turns rate limiting off. Returns the previous one."""
+    global _limiter
+    previous, _limiter = _limiter, limiter
+    return previous
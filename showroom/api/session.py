@@ -2,8 +2,16 @@ from requests import Session as _Session
 from requests.exceptions import ConnectionError, ChunkedEncodingError, Timeout, HTTPError
 from requests.adapters import HTTPAdapter
 import logging
+import threading
 import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from .breaker import get_breaker, is_failure
 from .cookiejar import ClientCookieJar
+from .hooks import current_event, instrument
+from .limiter import get_limiter, retry_after
+from .utils import error_response
+from showroom.metrics import REGISTRY
 
 try:
     from fake_useragent import UserAgent
@@ -17,6 +25,198 @@ else:
 
 session_logger = logging.getLogger('showroom.session')
 
+_http_requests = REGISTRY.counter('showroom_http_requests_total',
+                                  'HTTP requests made, by endpoint and status code or error',
+                                  ('endpoint', 'status'))
+_http_seconds = REGISTRY.histogram('showroom_http_request_seconds',
+                                   'HTTP request latency, by endpoint', ('endpoint',))
+_http_retries = REGISTRY.counter('showroom_http_retries_total',
+                                 'HTTP requests retried, by endpoint and reason', ('endpoint', 'reason'))
+_http_deadlines = REGISTRY.counter('showroom_http_deadline_exceeded_total',
+                                   'HTTP requests given up on at their deadline, by endpoint', ('endpoint',))
+
+_local = threading.local()
+
+
+class DeadlineExceeded(HTTPError):
+    """Raised when a GET, retries included, runs out of time.
+
+    An HTTPError carrying an empty 504 response, so callers handle it like any
+    other failed request. The last error retried, if any, is its __cause__.
+    """
+    def __init__(self, url):
+        super().__init__('Deadline exceeded while fetching {}'.format(url),
+                         response=error_response(url, 504, 'Deadline Exceeded'))
+
+
+@contextmanager
+def request_deadline(seconds):
+    """Gives every GET this thread makes inside the block until seconds from now, retries included.
+
+    Passes through endpoint methods, so e.g.
+
+        with request_deadline(10.0):
+            client.is_live(room_id)
+
+    raises DeadlineExceeded rather than retrying an outage for minutes. Nested
+    blocks keep the earliest deadline.
+    """
+    previous = current_deadline()
+    deadline = time.time() + seconds
+    _local.deadline = deadline if previous is None else min(previous, deadline)
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def current_deadline():
+    """Returns the POSIX time this thread's GETs must finish by, or None."""
+    return getattr(_local, 'deadline', None)
+
+
+@contextmanager
+def request_priority(priority):
+    """Gives every GET this thread makes inside the block priority on the rate limiter.
+
+    Lower goes first, see showroom.api.limiter.PRIORITIES. A priority passed to
+    get() itself takes precedence.
+    """
+    previous = current_priority()
+    _local.priority = priority
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def current_priority():
+    """Returns the rate limiter priority set for this thread's GETs, or None."""
+    return getattr(_local, 'priority', None)
+
+
+class RetryState(object):
+    """Decides whether, and after how long, a failed GET is retried.
+
+    Each method is called with the error of one failed attempt, updates wait to
+    the number of seconds to sleep before the next attempt, and returns False if
+    the error should be raised instead. Shared by ClientSession.get and
+    AsyncClientSession.get, so both retry in exactly the same way.
+
+    Given a RateLimiter, a 429 or Retry-After backs off every request to the
+    host through it, rather than only this one.
+
+    Given a deadline (POSIX time), attempts are cut short to end by it, and
+    expired() tells when there's no time left for another.
+    """
+    def __init__(self, url, max_delay=30.0, max_retries=20, limiter=None, deadline=None):
+        self.url = url
+        self.limiter = limiter
+        self.deadline = deadline
+        self.error = None
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.error_count = 0
+        self.timeouts = 0
+        self.wait = 0
+
+    def remaining(self):
+        """Returns seconds left until the deadline, or None if there is none."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.time()
+
+    def expired(self, wait=0.0):
+        """Returns whether the deadline will have passed after waiting wait seconds."""
+        remaining = self.remaining()
+        return remaining is not None and remaining <= wait
+
+    def request_timeout(self, connect=3.0, read=15.0):
+        """Returns the (connect, read) timeout of the next attempt, shortened to end by the deadline."""
+        remaining = self.remaining()
+        if remaining is None:
+            return connect, read
+        return min(connect, max(remaining, 0.1)), min(read, max(remaining, 0.1))
+
+    def timeout(self, e):
+        self.error = e
+        session_logger.debug('Timeout while fetching {}: {}'.format(self.url, e))
+        self.timeouts += 1
+        self.wait = min(2 * 1.5 ** self.timeouts, self.max_delay*4)
+
+        if self.timeouts > self.max_retries:
+            session_logger.error('Max timeouts exceeded while fetching {}: {}'.format(self.url, e))
+            # raise
+        elif self.timeouts > self.max_retries // 2:
+            session_logger.warning('{} timeouts while fetching {}: {}'.format(self.timeouts, self.url, e))
+        return True
+
+    def chunked_encoding_error(self, e):
+        self.error = e
+        session_logger.debug('Chunked encoding error while fetching {}: {}'.format(self.url, e))
+        self.error_count += 1
+        self.wait = min(self.wait + self.error_count, self.max_delay)
+
+        if self.error_count > self.max_retries:
+            session_logger.warning('Max retries exceeded while fetching {}: {}'.format(self.url, e))
+            return False
+        return True
+
+    def http_error(self, e):
+        self.error = e
+        url = self.url
+        status_code = e.response.status_code
+        session_logger.debug('{} while fetching {}: {}'.format(status_code, url, e))
+
+        self.error_count += 1
+        self.wait = min(self.wait + 2 + self.error_count, self.max_delay)
+        delay = retry_after(e.response)
+
+        # Some of these aren't recoverable
+        if status_code == 404:
+            session_logger.error('Getting {} failed permanently: 404 page not found'.format(url))
+            return False  # PageNotFoundError(e)  # ?
+        elif status_code == 403:
+            session_logger.error('Getting {} failed permanently: 403 permission denied'.format(url))
+            return False  # specific error?
+        elif status_code == 402:
+            session_logger.error('Getting {} failed permanently: '
+                                 '401 auth required (not implemented)'.format(url))
+            return False
+        elif status_code == 429:
+            session_logger.error('Too many requests while getting {}: {}'.format(url, e))
+            if self.limiter is not None:
+                self.limiter.backoff(url, delay)
+            else:
+                self.wait += delay or 5 * 60.0
+        elif 400 <= status_code < 500:
+            session_logger.error('Getting {} failed permanently: {}'.format(url, e))
+            return False
+        elif delay is not None:
+            # e.g. 503 Service Unavailable with Retry-After
+            if self.limiter is not None:
+                self.limiter.backoff(url, delay)
+            else:
+                self.wait = max(self.wait, delay)
+
+        if self.error_count > self.max_retries:
+            session_logger.warning('Max retries exceeded while fetching {}: {}'.format(url, e))
+            return False
+        return True
+
+    def connection_error(self, e):
+        self.error = e
+        session_logger.debug('ConnectionError while accessing {}: {}'.format(self.url, e))
+
+        self.error_count += 1
+        self.wait = min(self.wait + 2 * self.error_count, self.max_delay)
+
+        # ConnectionErrors are assumed to be always recoverable
+        # if self.error_count > self.max_retries:
+        #     session_logger.warning('Max retries exceeded while fetching {}: {}'.format(self.url, e))
+        #     return False
+        return True
+
 
 class ClientSession(_Session):
     """
@@ -26,90 +226,98 @@ class ClientSession(_Session):
 
     Overrides requests.Session.get() and increases max pool size
 
+    Every attempt first waits its turn on the process-wide RateLimiter, see
+    showroom.api.limiter, and fails fast if the process-wide CircuitBreaker has
+    opened its endpoint's circuit, see showroom.api.breaker.
+
+    A deadline, given to get() or set for the calling thread by request_deadline(),
+    bounds the whole retry loop. Likewise a rate limiter priority, by request_priority().
+
+    Each get(), retries included, is reported to the registered request hooks,
+    see showroom.api.hooks.
+
     Raises:
         May raise TimeoutError, ConnectionError, HTTPError, or ChunkedEncodingError
-        if retries are exceeded.
+        if retries are exceeded, and DeadlineExceeded or CircuitOpenError (both
+        HTTPErrors).
     """
 
     # TODO: set pool_maxsize based on config
-    def __init__(self, pool_maxsize=100):
+    def __init__(self, pool_maxsize=100, base_url='https://www.showroom-live.com'):
         super().__init__()
         self.cookies = ClientCookieJar()
         https_adapter = HTTPAdapter(pool_maxsize=pool_maxsize)
-        self.mount('https://www.showroom-live.com', https_adapter)
+        self.mount(base_url, https_adapter)
         self.headers = {"User-Agent": ua_str}
 
     # TODO: post
-    def get(self, url, params=None, max_delay=30.0, max_retries=20, **kwargs):
-        error_count = 0
-        wait = 0
-        timeouts = 0
+    def get(self, url, params=None, **kwargs):
+        with instrument("GET", urlsplit(url).path or '/', params) as event:
+            try:
+                r = self._retrying_get(url, params=params, **kwargs)
+            except HTTPError as e:
+                event.record(e.response, e)
+                raise
+            event.record(r)
+            return r
+
+    def _retrying_get(self, url, params=None, max_delay=30.0, max_retries=20, priority=None, deadline=None,
+                      **kwargs):
+        limiter = get_limiter()
+        breaker = get_breaker()
+        if current_deadline() is not None:
+            deadline = min(deadline or current_deadline(), current_deadline())
+        if priority is None:
+            priority = current_priority()
+        retry = RetryState(url, max_delay=max_delay, max_retries=max_retries, limiter=limiter, deadline=deadline)
+        endpoint = urlsplit(url).path or '/'
         while True:
+            if retry.expired() or (limiter is not None and
+                                   limiter.acquire(url, priority=priority, timeout=retry.remaining()) is None):
+                _http_deadlines.inc(endpoint=endpoint)
+                raise DeadlineExceeded(url) from retry.error
+            if breaker is not None:
+                breaker.before(url)
+            started = time.time()
+            status = None
             try:
-                r = super().get(url, params=params, timeout=(3.0, 15.0), **kwargs)
+                r = super().get(url, params=params, timeout=retry.request_timeout(), **kwargs)
+                status = r.status_code
                 r.raise_for_status()
             except Timeout as e:
-                session_logger.debug('Timeout while fetching {}: {}'.format(url, e))
-                timeouts += 1
-                wait = min(2 * 1.5 ** timeouts, max_delay*4)
-
-                if timeouts > max_retries:
-                    session_logger.error('Max timeouts exceeded while fetching {}: {}'.format(url, e))
-                    # raise
-                elif timeouts > max_retries // 2:
-                    session_logger.warning('{} timeouts while fetching {}: {}'.format(timeouts, url, e))
+                status = 'timeout'
+                retry.timeout(e)
 
             except ChunkedEncodingError as e:
-                session_logger.debug('Chunked encoding error while fetching {}: {}'.format(url, e))
-                error_count += 1
-                wait = min(wait + error_count, max_delay)
-
-                if error_count > max_retries:
-                    session_logger.warning('Max retries exceeded while fetching {}: {}'.format(url, e))
+                status = 'chunked_encoding_error'
+                if not retry.chunked_encoding_error(e):
                     raise
 
             except HTTPError as e:
-                status_code = e.response.status_code
-                session_logger.debug('{} while fetching {}: {}'.format(status_code, url, e))
-
-                error_count += 1
-                wait = min(wait + 2 + error_count, max_delay)
-
-                # Some of these aren't recoverable
-                if status_code == 404:
-                    session_logger.error('Getting {} failed permanently: 404 page not found'.format(url))
-                    raise  # PageNotFoundError(e)  # ?
-                elif status_code == 403:
-                    session_logger.error('Getting {} failed permanently: 403 permission denied'.format(url))
-                    raise  # specific error?
-                elif status_code == 402:
-                    session_logger.error('Getting {} failed permanently: '
-                                         '401 auth required (not implemented)'.format(url))
-                    raise
-                elif status_code == 429:
-                    session_logger.error('Too many requests while getting {}: {}'.format(url, e))
-                    wait += 5 * 60.0
-                elif 400 <= status_code < 500:
-                    session_logger.error('Getting {} failed permanently: {}'.format(url, e))
-                    raise
-
-                if error_count > max_retries:
-                    session_logger.warning('Max retries exceeded while fetching {}: {}'.format(url, e))
+                if not retry.http_error(e):
                     raise
 
             except ConnectionError as e:
-                session_logger.debug('ConnectionError while accessing {}: {}'.format(url, e))
-
-                error_count += 1
-                wait = min(wait + 2 * error_count, max_delay)
-
-                # ConnectionErrors are assumed to be always recoverable
-                # if error_count > max_retries:
-                #     session_logger.warning('Max retries exceeded while fetching {}: {}'.format(url, e))
-                #     raise
+                status = 'connection_error'
+                retry.connection_error(e)
 
             else:
+                if limiter is not None:
+                    limiter.succeeded(url)
                 return r
 
-            session_logger.debug('Retrying in {} seconds...'.format(wait))
-            time.sleep(wait)
\ No newline at end of file
+            finally:
+                _http_requests.inc(endpoint=endpoint, status=status or 'error')
+                _http_seconds.observe(time.time() - started, endpoint=endpoint)
+                if breaker is not None:
+                    breaker.record(url, is_failure(status))
+
+            if retry.expired(retry.wait):
+                _http_deadlines.inc(endpoint=endpoint)
+                raise DeadlineExceeded(url) from retry.error
+            if breaker is not None:
+                breaker.check(url)
+            _http_retries.inc(endpoint=endpoint, reason=status)
+            current_event().retries += 1
+            session_logger.debug('Retrying in {} seconds...'.format(retry.wait))
+            time.sleep(retry.wait)
@@ -1,4 +1,5 @@
 import re
+from requests import Request, Response
 
 _csrf_re = re.compile("SrGlobal.csrfToken = \\'([\\w\\d-]+)\\';")
 
@@ -10,3 +11,21 @@ def get_csrf_token(text):
     else:
         # TODO: error
         return
+
+
+def request_key(endpoint, params=None):
+    """Returns a hashable key identifying a GET, ignoring the order of params and
+    dropping params that are None, as requests does."""
+    return endpoint, tuple(sorted((k, str(v)) for k, v in (params or {}).items() if v is not None))
+
+
+def error_response(url, status_code, reason):
+    """Returns an empty requests.Response for a request that was never answered,
+    for errors raised in place of a real one, e.g. CircuitOpenError."""
+    r = Response()
+    r.status_code = status_code
+    r.reason = reason
+    r.url = url
+    r._content = b''
+    r.request = Request('GET', url).prepare()
+    return r
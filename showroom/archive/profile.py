@@ -1,19 +1,37 @@
 # profile pic downloader
-from showroom.api.session import ClientSession
+import os
+import re
+
+from showroom.prefetch import RoomPrefetcher
+from showroom.settings import settings
 from showroom.utils.media import save_from_url
 from .constants import ENGLISH_INDEX
 
-_session = ClientSession()
 _name_pattern = '{group} {team} {name}_{count:02d}.{ext}'
+_size_pattern = re.compile(r'_[ms](\.\w+)$')
+
+# requests per second while fetching every profile at once, rather than the
+# prefetcher's default 2: 1000 rooms take under a minute, not over eight
+PREFETCH_RATE = 20.0
+
+# profiles fetched for the whole index at once, and reused across runs
+_prefetcher = None
+
+
+def _get_prefetcher():
+    global _prefetcher
+    if _prefetcher is None:
+        _prefetcher = RoomPrefetcher(path=os.path.join(settings.directory.data, 'room_metadata.json'),
+                                     rate=PREFETCH_RATE)
+    return _prefetcher
 
 
 def get_profile_pic_url(room):
-    room_id = room.room_id
-    # TODO: use ShowroomClient.profile()['image'] instead, and replace the final _m (or _s?) with _l
-    r = _session.json('https://www.showroom-live.com/room/get_live_data', params={"room_id": room_id})
-    url = r.get('room').get('image_l')
+    profile = _get_prefetcher().get(room.room_id, 'profile') or {}
+    url = profile.get('image')
     if url:
-        return url.split('?')[0]
+        # the largest size, rather than the medium (or small) one the profile links
+        return _size_pattern.sub(r'_l\1', url.split('?')[0])
     else:
         return None
 
@@ -33,5 +51,6 @@ def save_profile_pic(room, dest, count):
 
 
 def scrape_profile_pics(profile_dir, photo_num=1):
+    _get_prefetcher().prefetch(ENGLISH_INDEX.room_dict, fields=('profile',))
     for room in ENGLISH_INDEX.room_dict.values():
-        save_profile_pic(room, profile_dir, photo_num)
+        save_profile_pic(room, profile_dir, int(photo_num))
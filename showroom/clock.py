@@ -0,0 +1,73 @@
+# Replaceable source of the current time
+import datetime
+import threading
+import time as _time
+
+from .constants import TOKYO_TZ
+
+
+class Clock(object):
+    """The wall clock. Scheduling code asks this module for the time rather than
+    calling time.time() or datetime.now() itself, so it can be run on a VirtualClock."""
+    def time(self):
+        return _time.time()
+
+    def now(self, tz=TOKYO_TZ):
+        return datetime.datetime.now(tz=tz)
+
+
+class VirtualClock(Clock):
+    """A clock that only moves when told to, see showroom.replay.
+
+    Args:
+        start: POSIX time to start at
+    """
+    def __init__(self, start=0.0):
+        self._time = float(start)
+        self._lock = threading.Lock()
+
+    def time(self):
+        return self._time
+
+    def now(self, tz=TOKYO_TZ):
+        return datetime.datetime.fromtimestamp(self._time, tz=tz)
+
+    def advance(self, seconds):
+        """Moves the clock forward, never backward."""
+        with self._lock:
+            self._time += max(seconds, 0.0)
+        return self._time
+
+    def advance_to(self, when):
+        with self._lock:
+            self._time = max(self._time, float(when))
+        return self._time
+
+
+_clock = Clock()
+
+
+def get_clock():
+    return _clock
+
+
+def set_clock(clock):
+    """Replaces the process-wide clock, returning the previous one.
+
+    Args:
+        clock: a Clock, or None to go back to the wall clock
+    """
+    global _clock
+    previous = _clock
+    _clock = clock or Clock()
+    return previous
+
+
+def time():
+    """Returns the current POSIX time."""
+    return _clock.time()
+
+
+def now(tz=TOKYO_TZ):
+    """Returns the current time as an aware datetime, in JST by default."""
+    return _clock.now(tz=tz)
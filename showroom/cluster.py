@@ -0,0 +1,283 @@
+# Lease-based room ownership for running several recorders at once
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+cluster_logger = logging.getLogger('showroom.cluster')
+
+
+class LeaseStore(object):
+    """Where leases are kept, shared by every node in the cluster.
+
+    A lease is a key held by one node until it expires. Implementations must make
+    acquire() atomic across nodes.
+    """
+    def acquire(self, key, node, ttl):
+        """Takes key for node for ttl seconds, if it is free, expired, or already node's.
+
+        Returns:
+            True if node now holds key
+        """
+        raise NotImplementedError
+
+    def release(self, key, node):
+        """Gives up key, if node holds it."""
+        raise NotImplementedError
+
+    def holder(self, key):
+        """Returns the node holding key, or None, also if the store couldn't be read."""
+        raise NotImplementedError
+
+
+class FileLeaseStore(LeaseStore):
+    """Keeps each lease as a small JSON file in a shared directory, e.g. over NFS/SMB.
+
+    Changes to a lease are serialised with a lock file created with O_EXCL, which
+    is atomic on local and (modern) network filesystems. Lock files left behind
+    by a crashed node are broken after stale_lock seconds.
+    """
+    def __init__(self, directory, stale_lock=10.0):
+        self.directory = directory
+        self.stale_lock = stale_lock
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, '{}.lease'.format(key))
+
+    def _lock(self, key):
+        path = self._path(key) + '.lock'
+        deadline = time.time() + self.stale_lock
+        while True:
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) > self.stale_lock:
+                        os.remove(path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.time() > deadline:
+                    return None
+                time.sleep(0.05)
+            else:
+                os.close(fd)
+                return path
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), encoding='utf8') as infp:
+                return json.load(infp)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def acquire(self, key, node, ttl):
+        lock = self._lock(key)
+        if lock is None:
+            return False
+        try:
+            lease = self._read(key)
+            now = time.time()
+            if lease and lease['node'] != node and lease['expires'] > now:
+                return False
+            temp = '{}.{}.tmp'.format(self._path(key), os.getpid())
+            with open(temp, 'w', encoding='utf8') as outfp:
+                json.dump({"node": node, "expires": now + ttl}, outfp)
+            os.replace(temp, self._path(key))
+            return True
+        finally:
+            os.remove(lock)
+
+    def release(self, key, node):
+        lock = self._lock(key)
+        if lock is None:
+            return
+        try:
+            lease = self._read(key)
+            if lease and lease['node'] == node:
+                os.remove(self._path(key))
+        finally:
+            os.remove(lock)
+
+    def holder(self, key):
+        lease = self._read(key)
+        if lease and lease['expires'] > time.time():
+            return lease['node']
+        return None
+
+
+class SQLiteLeaseStore(LeaseStore):
+    """Keeps leases in an SQLite database, for nodes on one machine or a shared disk."""
+    def __init__(self, path, timeout=10.0):
+        self.path = path
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS leases '
+                         '(key TEXT PRIMARY KEY, node TEXT NOT NULL, expires REAL NOT NULL)')
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+
+    def acquire(self, key, node, ttl):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            try:
+                # IMMEDIATE takes the write lock up front, so the check and the write are atomic
+                conn.execute('BEGIN IMMEDIATE')
+                row = conn.execute('SELECT node, expires FROM leases WHERE key = ?', (key,)).fetchone()
+                if row and row[0] != node and row[1] > now:
+                    conn.execute('ROLLBACK')
+                    return False
+                conn.execute('INSERT OR REPLACE INTO leases (key, node, expires) VALUES (?, ?, ?)',
+                             (key, node, now + ttl))
+                conn.execute('COMMIT')
+                return True
+            except sqlite3.Error as e:
+                cluster_logger.warn('Lease store error acquiring {}: {}'.format(key, e))
+                return False
+            finally:
+                conn.close()
+
+    def release(self, key, node):
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute('DELETE FROM leases WHERE key = ? AND node = ?', (key, node))
+            except sqlite3.Error as e:
+                cluster_logger.warn('Lease store error releasing {}: {}'.format(key, e))
+            finally:
+                conn.close()
+
+    def holder(self, key):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT node, expires FROM leases WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as e:
+            cluster_logger.warn('Lease store error reading {}: {}'.format(key, e))
+            return None
+        finally:
+            conn.close()
+        if row and row[1] > time.time():
+            return row[0]
+        return None
+
+
+class RoomLeases(object):
+    """Decides which rooms this node records, by holding per-room leases.
+
+    Each room has as many lease slots as copies wanted for its priority; a node
+    holds at most one slot per room, so N copies means N different nodes. Leases
+    are renewed while the node is alive, so when a node dies its leases expire
+    after ttl seconds and other nodes pick its rooms up the next time they see
+    them in onlives or upcoming.
+
+    Args:
+        store: a LeaseStore shared with the other nodes
+        node: this node's name, unique in the cluster
+        ttl: seconds a lease lasts without renewal
+        redundancy: list of [max_priority, copies] pairs, checked in order, e.g.
+            [[3, 2]] records rooms with priority 3 or less on two nodes. Rooms not
+            matched get one copy.
+    """
+    def __init__(self, store, node=None, ttl=60.0, redundancy=None):
+        self.store = store
+        self.node = node or '{}-{}'.format(socket.gethostname(), os.getpid())
+        self.ttl = ttl
+        self.redundancy = sorted(tuple(e) for e in redundancy or ())
+        self._held = {}  # room_id -> lease key
+        self._lock = threading.Lock()
+        self._renewed = time.time()
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Builds RoomLeases from the cluster settings, or returns None if disabled."""
+        cluster = settings.cluster
+        if not cluster or not cluster.enabled:
+            return None
+        if cluster.store == "sqlite":
+            store = SQLiteLeaseStore(cluster.path)
+        else:
+            store = FileLeaseStore(cluster.path)
+        return cls(store, node=cluster.node, ttl=cluster.ttl, redundancy=cluster.redundancy)
+
+    def copies(self, priority):
+        for max_priority, copies in self.redundancy:
+            if priority <= max_priority:
+                return copies
+        return 1
+
+    @staticmethod
+    def _key(room_id, slot):
+        return 'room_{}_{}'.format(room_id, slot)
+
+    def holds(self, room_id):
+        return room_id in self._held
+
+    def claim(self, room):
+        """Tries to take one of the room's lease slots.
+
+        Returns:
+            True if this node should record the room
+        """
+        room_id = room.room_id
+        with self._lock:
+            if room_id in self._held:
+                return True
+            for slot in range(self.copies(room.priority)):
+                key = self._key(room_id, slot)
+                if self.store.acquire(key, self.node, self.ttl):
+                    cluster_logger.debug('{} claimed {} (slot {})'.format(self.node, room.name, slot))
+                    self._held[room_id] = key
+                    return True
+            return False
+
+    def release(self, room_id):
+        with self._lock:
+            key = self._held.pop(room_id, None)
+        if key is not None:
+            self.store.release(key, self.node)
+
+    def release_all(self):
+        for room_id in list(self._held):
+            self.release(room_id)
+
+    def renew(self, force=False):
+        """Renews every held lease, at most every ttl/3 seconds unless forced.
+
+        A lease that couldn't be renewed, e.g. because the store was locked or
+        busy, is only given up if another node now holds it; otherwise it is kept,
+        and renewing is tried again on the next call.
+
+        Returns:
+            room_ids of leases another node took over
+        """
+        if not force and time.time() - self._renewed < self.ttl / 3:
+            return []
+        self._renewed = time.time()
+        lost = []
+        with self._lock:
+            for room_id, key in list(self._held.items()):
+                if self.store.acquire(key, self.node, self.ttl):
+                    continue
+                holder = self.store.holder(key)
+                if holder is not None and holder != self.node:
+                    cluster_logger.warn('{} lost its lease on room {} to {}'.format(self.node, room_id, holder))
+                    del self._held[room_id]
+                    lost.append(room_id)
+                else:
+                    cluster_logger.warn('{} could not renew its lease on room {}, retrying'.format(
+                        self.node, room_id))
+                    self._renewed = 0.0
+        return lost
@@ -0,0 +1,217 @@
+"""JSON encoding and decoding, through the fastest library installed.
+
+orjson is used if installed, then ujson, else the standard library's json.
+Whichever it is:
+    - loads() takes str or bytes, and raises json.JSONDecodeError on bad input
+    - dumps() never escapes non-ASCII, like json.dumps(ensure_ascii=False), and
+      indents by 2 unless compact, which leaves out all whitespace, for files
+      only ever read by programs
+
+Every backend writes JSON that decodes to the same values, but not always the
+same text: number formatting differs, e.g. orjson writes 1e20 where json and
+ujson write 1e+20, so files needn't be byte for byte identical across backends.
+
+e.g.
+    data = codec.loads(response.content)
+    with open(outfile, 'w', encoding='utf8') as outfp:
+        codec.dump(data, outfp, compact=settings.feedback.compact_json)
+
+Benchmark the installed backends on recorded comment logs (as written by
+CommentLogger) with:
+    python -m showroom.codec "path/to/* comments.json"
+"""
+import argparse
+import glob
+import json
+import random
+import time
+from json import JSONDecodeError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class _JsonBackend(object):
+    name = "json"
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+    @staticmethod
+    def dumps(obj, compact=False):
+        if compact:
+            return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+        return json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+class _OrjsonBackend(object):
+    name = "orjson"
+
+    @staticmethod
+    def loads(data):
+        # orjson.JSONDecodeError is already a json.JSONDecodeError
+        return orjson.loads(data)
+
+    @staticmethod
+    def dumps(obj, compact=False):
+        option = orjson.OPT_NON_STR_KEYS if compact else orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, option=option).decode('utf8')
+        except orjson.JSONEncodeError:
+            # e.g. ints too big for 64 bits, which json handles
+            return _JsonBackend.dumps(obj, compact)
+
+
+class _UjsonBackend(object):
+    name = "ujson"
+
+    @staticmethod
+    def loads(data):
+        try:
+            return ujson.loads(data)
+        except ValueError as e:
+            doc = data if isinstance(data, str) else data.decode('utf8', 'replace')
+            raise JSONDecodeError(str(e), doc, 0) from None
+
+    @staticmethod
+    def dumps(obj, compact=False):
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False, indent=0 if compact else 2)
+
+
+# available backends, fastest first
+BACKENDS = {backend.name: backend for backend, module in ((_OrjsonBackend, orjson),
+                                                           (_UjsonBackend, ujson),
+                                                           (_JsonBackend, json))
+            if module is not None}
+
+_backend = next(iter(BACKENDS.values()))
+
+
+def get_backend():
+    """Returns the name of the backend in use."""
+    return _backend.name
+
+
+def set_backend(name):
+    """Switches to another installed backend. Returns the name of the previous one.
+
+    Raises:
+        KeyError: if name isn't installed
+    """
+    global _backend
+    previous, _backend = _backend, BACKENDS[name]
+    return previous.name
+
+
+def loads(data):
+    """Decodes a JSON document from str or bytes."""
+    return _backend.loads(data)
+
+
+def load(fp):
+    return _backend.loads(fp.read())
+
+
+def dumps(obj, compact=False):
+    """Encodes obj as a str of JSON, indented by 2 unless compact."""
+    return _backend.dumps(obj, compact)
+
+
+def dump(obj, fp, compact=False):
+    fp.write(_backend.dumps(obj, compact))
+
+
+def _synthetic_comments(count, seed=0):
+    """Returns comments shaped like those CommentLogger records, for when no logs are given."""
+    rng = random.Random(seed)
+    words = ['かわいい', '初見です', 'こんばんは', '888888', 'おつかれさま', 'ｗｗｗ', '神回', 'Hello!', '🎉', '推し']
+    comments = []
+    for i in range(count):
+        comments.append({"av": rng.randrange(1, 1000000), "d": 0, "ac": 'ユーザー{}'.format(rng.randrange(10000)),
+                         "cm": ' '.join(rng.choice(words) for _ in range(rng.randrange(1, 5))),
+                         "u": rng.randrange(1000000, 9999999), "created_at": 1600000000 + i // 5,
+                         "at": 0, "t": "1"})
+    return comments
+
+
+def _frames(comments):
+    # as received over the bcsvr websocket, see CommentLogger.run
+    return ['MSG\tbcsvrkey\t' + json.dumps({key: value for key, value in comment.items() if key != 'received_at'},
+                                          ensure_ascii=False)
+            for comment in comments]
+
+
+def benchmark(comments, rounds=3):
+    """Times each backend decoding comments as websocket frames, and writing them out as a comment log.
+
+    Returns:
+        {backend: {"decode_us": per frame, "dump_ms": indented, "dump_compact_ms": compact}},
+        best of rounds
+    """
+    frames = _frames(comments)
+    results = {}
+    previous = get_backend()
+    try:
+        for name in BACKENDS:
+            set_backend(name)
+            decode = dump = dump_compact = float('inf')
+            for _ in range(rounds):
+                started = time.perf_counter()
+                for frame in frames:
+                    loads(frame[frame.find('{'):])
+                decode = min(decode, time.perf_counter() - started)
+                started = time.perf_counter()
+                dumps(comments)
+                dump = min(dump, time.perf_counter() - started)
+                started = time.perf_counter()
+                dumps(comments, compact=True)
+                dump_compact = min(dump_compact, time.perf_counter() - started)
+            results[name] = {"decode_us": decode / max(len(frames), 1) * 1e6,
+                             "dump_ms": dump * 1e3, "dump_compact_ms": dump_compact * 1e3}
+    finally:
+        set_backend(previous)
+    return results
+
+
+def format_benchmark(results, count):
+    baseline = results["json"]
+    lines = ['{} comments, speedups relative to json'.format(count),
+             '{:<8} {:>12} {:>10} {:>14} {:>10} {:>8}'.format('backend', 'decode (us)', 'dump (ms)', 'compact (ms)',
+                                                             'decode x', 'dump x')]
+    for name, result in results.items():
+        lines.append('{:<8} {:>12.2f} {:>10.1f} {:>14.1f} {:>10.1f} {:>8.1f}'.format(
+            name, result["decode_us"], result["dump_ms"], result["dump_compact_ms"],
+            baseline["decode_us"] / result["decode_us"], baseline["dump_ms"] / result["dump_ms"]))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the installed JSON backends on comment streams.')
+    parser.add_argument('logs', nargs='*', help='comment logs written by CommentLogger, globs allowed')
+    parser.add_argument('--synthetic', type=int, default=50000,
+                        help='number of made up comments to use if no logs are given')
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    comments = []
+    for pattern in args.logs:
+        for path in glob.glob(pattern):
+            with open(path, encoding='utf8') as infp:
+                data = json.load(infp)
+            # the old polling logger wraps the list in {"comment_log": [...]}
+            comments.extend(data["comment_log"] if isinstance(data, dict) else data)
+    if not comments:
+        comments = _synthetic_comments(args.synthetic)
+    print(format_benchmark(benchmark(comments, rounds=args.rounds), len(comments)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,5 @@
 # scraping comments
 import datetime
-import json
 import os
 import threading
 import time
@@ -13,7 +12,9 @@ from json import JSONDecodeError
 from websocket import ABNF
 from websocket import WebSocketConnectionClosedException
 
+from showroom import codec
 from showroom.constants import TOKYO_TZ, FULL_DATE_FMT
+from showroom.metrics import REGISTRY
 from showroom.utils import format_name
 from requests.exceptions import HTTPError
 
@@ -51,6 +52,9 @@ StatsLogger records just stats and telop
 
 cmt_logger = logging.getLogger('showroom.comments')
 
+_ws_messages = REGISTRY.counter('showroom_websocket_messages_total',
+                                'Comment websocket messages received, by message type', ('type',))
+
 
 def convert_comments_to_danmaku(startTime, commentList,
                                 fontsize=18, fontname='MS PGothic', alpha='1A',
@@ -245,13 +249,13 @@ class CommentLogger(object):
                 return
             message = message[idx:]
             try:
-                data = json.loads(message)
+                data = codec.loads(message)
             except JSONDecodeError as e:
                 # cmt_logger.debug('JSONDecodeError, broken message: {}'.format(message))
                 # try to fix
                 message += '","t":"1"}'
                 try:
-                    data = json.loads(message)
+                    data = codec.loads(message)
                 except JSONDecodeError:
                     cmt_logger.error('JSONDecodeError, failed to fix broken message: {}'.format(message))
                     return
@@ -271,6 +275,7 @@ class CommentLogger(object):
 
             # type of the message
             m_type = str(data['t'])  # could be integer or string
+            _ws_messages.inc(type=m_type)
 
             if m_type == '1':  # comment
                 comment = data['cm']
@@ -543,7 +548,7 @@ class CommentLogger(object):
         with open(outfile, 'w', encoding='utf8') as outfp:
             #            json.dump({"comment_log": sorted(self.comment_log, key=lambda x: x['created_at'], reverse=True)},
             #                      outfp, indent=2, ensure_ascii=False)
-            json.dump(self.comment_log, outfp, indent=2, ensure_ascii=False)
+            codec.dump(self.comment_log, outfp, compact=self.settings.feedback.compact_json)
 
         if len(self.comment_log) > 0:
             # convert comments to danmaku
@@ -559,15 +564,36 @@ class CommentLogger(object):
 
         self._isRecording = False
 
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
     def quit(self):
         """
         To quit comment logger anytime (to close WebSocket, save file and finish job)
         """
         self._isQuit = True
-        self._thread.join()
+        if self._thread is not None:
+            self._thread.join()
         if self._thread_interval is not None:
             self._thread_interval.join()
 
+    def stop(self):
+        """
+        Like quit, but returns without waiting for the logger to finish
+        """
+        self._isQuit = True
+
+    def close(self):
+        """
+        Forces the WebSocket closed, for a logger stuck waiting on it
+        """
+        self._isQuit = True
+        if self.ws is not None:
+            try:
+                self.ws.shutdown()
+            except Exception as e:
+                cmt_logger.debug('Error closing websocket for {}: {}'.format(self.room.name, e))
+
 
 class RoomScraper:
     comment_id_pattern = "{created_at}_{user_id}"
@@ -697,8 +723,8 @@ class RoomScraper:
             time.sleep(sleep_timer)
 
         with open(outfile, 'w', encoding='utf8') as outfp:
-            json.dump({"comment_log": sorted(self.comment_log, key=lambda x: x['created_at'], reverse=True)},
-                      outfp, indent=2, ensure_ascii=False)
+            codec.dump({"comment_log": sorted(self.comment_log, key=lambda x: x['created_at'], reverse=True)},
+                       outfp, compact=self.settings.feedback.compact_json)
 
     def record(self):
         pass
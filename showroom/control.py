@@ -10,10 +10,16 @@ from .message import ShowroomMessage
 from .settings import ShowroomSettings
 from .index import ShowroomIndex
 from .core import WatchManager
+from .shard import ShardedWatchManager
 from .exceptions import ShowroomStopRequest
+from .metrics import REGISTRY, MetricsServer
 
 control_logger = logging.getLogger("showroom.control")
 
+_loop_lag = REGISTRY.gauge('showroom_controller_loop_lag_seconds',
+                           'How late the controller last woke up for a scheduled tick')
+_tick_seconds = REGISTRY.histogram('showroom_controller_tick_seconds', 'Time spent in each manager tick')
+
 
 class BaseShowroomLiveController(object):
     def __init__(self, index: ShowroomIndex=None, settings: ShowroomSettings=None, record_all=False):
@@ -41,7 +47,13 @@ class BaseShowroomLiveController(object):
 
         self._instance = None
 
-        self.manager = WatchManager(self.index, self.settings)
+        if self.settings.system.shards and self.settings.system.shards > 1:
+            self.manager = ShardedWatchManager(self.index, self.settings)
+        else:
+            self.manager = WatchManager(self.index, self.settings)
+        # watchers changing state wake the run loop, see _wake()
+        self._wake_pending = False
+        self.manager.update_flag.add_callback(self._wake)
 
         self.counter = count()
         # aliases
@@ -66,7 +78,17 @@ class BaseShowroomLiveController(object):
 
         # start index update tasks (runs in separate thread)
         self.index.start()
+
+        # served from whichever process the controller runs in
+        metrics_server = MetricsServer.from_settings(self.settings)
+        if metrics_server is not None:
+            REGISTRY.add_collector(self.manager.collect_metrics)
+            metrics_server.start()
+
         while True:
+            # the loop blocks on the command queue, which receives a command, or a wake up
+            # token from _wake() when a watcher changes state, or else times out when the
+            # manager next has something to do
 
             # TODO: check if time for maintenance, if so do maintenance then schedule next
             # if self.resume_time > self.time.time() > self.end_time:
@@ -78,15 +100,31 @@ class BaseShowroomLiveController(object):
             #     self.scheduler.reset_ticks()
             #     time.sleep(sleep_seconds)
 
+            started = time.time()
             self.manager.tick()
+            _tick_seconds.observe(time.time() - started)
 
-            while not self.command_queue.empty():
-                control_logger.debug('Reading command queue')
+            block = True
+            while True:
                 try:
-                    ident, command, args, kwargs = self.command_queue.get(block=False)
+                    if block:
+                        timeout = self.manager.time_until_next_tick()
+                        due = time.time() + timeout
+                        item = self.command_queue.get(timeout=timeout)
+                    else:
+                        # drain anything else that arrived meanwhile before ticking again
+                        item = self.command_queue.get(block=False)
                 except QueueEmpty:
+                    if block:
+                        _loop_lag.set(max(time.time() - due, 0.0))
                     break
+                block = False
+                if item is None:
+                    self._wake_pending = False
+                    continue
                 else:
+                    control_logger.debug('Reading command queue')
+                    ident, command, args, kwargs = item
                     # TODO: check that command is valid and allowed
                     if command[0] == '_':
                         control_logger.warn('Forbidden command: {}'.format(command))
@@ -98,6 +136,9 @@ class BaseShowroomLiveController(object):
                         msg = getattr(self, '_' + cmd)(*(list(args) + args2), msg=msg, **kwargs)
                     except ShowroomStopRequest:
                         self.index.stop()
+                        if metrics_server is not None:
+                            REGISTRY.remove_collector(self.manager.collect_metrics)
+                            metrics_server.stop()
                         return
                     except AttributeError as e:
                         # invalid command
@@ -109,7 +150,14 @@ class BaseShowroomLiveController(object):
                         if msg is not None:
                             self.message_queue.put(msg)
 
-            time.sleep(0.2)
+    def _wake(self):
+        """Wakes the run loop so it ticks right away.
+
+        Called from watcher threads via the manager's update flag. At most one wake up
+        token is queued at a time."""
+        if not self._wake_pending:
+            self._wake_pending = True
+            self.command_queue.put(None)
 
     def send_command(self, command, *args, **kwargs):
         ident = next(self.counter)
@@ -210,9 +258,7 @@ class BaseShowroomLiveController(object):
     # TODO: Messages require a unique identifier given them by the caller
     # room list commands
     def _get_rooms_by_mode(self, mode):
-        rooms = []
-        for watch in self.manager.watchers.get_by_mode(mode):
-            rooms.append(watch.get_info())
+        rooms = self.manager.get_info_by_mode(mode)
         return sorted(rooms, key=lambda x: (x['start_time'], x['name']))
 
     # TODO: get these working again
@@ -239,6 +285,42 @@ class BaseShowroomLiveController(object):
             msg.set_content(self._get_rooms_by_mode("download"))
             return msg
 
+    def _admission(self, *args, msg=None, **kwargs):
+        if msg is not None:
+            # active and queued counts against the watch and download caps
+            msg.set_content(self.manager.get_admission_info())
+            return msg
+
+    def _reaper(self, *args, msg=None, **kwargs):
+        if msg is not None:
+            # threads and processes outliving their Watchers, and how many were ended
+            msg.set_content(self.manager.get_reaper_info())
+            return msg
+
+    def _latency(self, *args, msg=None, **kwargs):
+        if msg is not None:
+            # go-live latency histograms per stage, by room priority
+            msg.set_content(self.manager.get_latency_info())
+            return msg
+
+    def _limiter(self, *args, msg=None, **kwargs):
+        if msg is not None:
+            # rate limiter buckets and backoffs, by host and endpoint class
+            msg.set_content(self.manager.get_limiter_info())
+            return msg
+
+    def _circuits(self, *args, msg=None, **kwargs):
+        if msg is not None:
+            # circuit breaker state of every endpoint that has failed
+            msg.set_content(self.manager.get_circuit_info())
+            return msg
+
+    def _endpoints(self, *args, msg=None, **kwargs):
+        if msg is not None:
+            # request counts, latency percentiles and error rates, by endpoint
+            msg.set_content(self.manager.get_endpoint_info())
+            return msg
+
 
 class ShowroomLiveControllerThread(BaseShowroomLiveController):
     def start(self):
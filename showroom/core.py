@@ -101,9 +101,9 @@ FFmpeg compile requirements:
     libx264 (?)
 """
 # from sys import stdout, stdin, exit
+import asyncio
 import datetime
 import itertools
-import json
 import logging
 import re
 import threading
@@ -113,12 +113,28 @@ from collections import OrderedDict
 # import argparse
 from heapq import heapify, heappush, heappop
 from json.decoder import JSONDecodeError
-from queue import Queue  # Empty as QueueEmpty
 
-from requests.exceptions import HTTPError
+from requests.exceptions import HTTPError, RequestException
 
 from showroom.api import ShowroomClient
+from showroom.api.cache import ResponseCache
+from showroom.api.breaker import CircuitBreaker, get_breaker, set_breaker
+from showroom.api.hooks import EndpointStats, add_hook, remove_hook
+from showroom.api.limiter import PREWARM_PRIORITY, RateLimiter, get_limiter, set_limiter
+from showroom.api.session import request_deadline, request_priority
+from showroom.cluster import RoomLeases
 from showroom.downloader import Downloader
+from showroom.admission import AdmissionController
+from showroom.engine import AsyncWatcherEngine
+from showroom.latency import GoLiveTimer, LatencyStats
+from showroom.metrics import histogram_samples
+from showroom.reaper import Reaper
+from showroom.deadlines import DeadlineScheduler
+from showroom import clock, codec
+from showroom.liveboard import LiveBoard
+from showroom.throttle import AdaptiveRate
+from showroom.upcoming import ScheduleFetcher
+from showroom.timetable import TimeTableSource
 
 # from .message import ShowroomMessage
 # from .exceptions import ShowroomDownloadError
@@ -150,6 +166,38 @@ WATCHSECONDS = (600, 420, 360, 360, 300, 300, 240, 240, 180, 150)
 # currently this checks the onlive list for each of Music, Idol, and Talent/Model
 # schedules are still Idol only
 GENRE_IDS = {101, 102, 103, 104, 105, 106, 107, 200}
+# upcoming takes a request per genre, see schedule.upcoming_genres
+UPCOMING_GENRE_IDS = {102}
+
+# longest the controller sleeps between ticks when nothing else wakes it
+# bounds how late it notices adaptive rates speeding up
+MAX_TICK_WAIT = 30.0
+
+
+class UpdateFlag(threading.Event):
+    """Event that also calls back listeners whenever it is set.
+
+    Watchers set the manager's update flag whenever their state changes, and
+    besides the schedule writer thread waiting on it, the controller listens to
+    it to tick as soon as something happens rather than on its next poll.
+    """
+    def __init__(self):
+        super().__init__()
+        self._callbacks = []
+
+    def add_callback(self, callback):
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        try:
+            self._callbacks.remove(callback)
+        except ValueError:
+            pass
+
+    def set(self):
+        super().set()
+        for callback in list(self._callbacks):
+            callback()
 
 
 
@@ -192,13 +240,34 @@ class Watcher(object):
     """
     def __init__(self, room: Room, client: ShowroomClient, settings: ShowroomSettings,
                  update_flag: threading.Event=None, start_time: datetime.datetime=None,
-                 watch_duration: int=None):
+                 watch_duration: int=None, scheduler: DeadlineScheduler=None,
+                 board: LiveBoard=None, admission: AdmissionController=None,
+                 latency: LatencyStats=None):
         self._lock = threading.RLock()
         if update_flag:
             self._update_flag = update_flag
         else:
             self._update_flag = threading.Event()
 
+        # set by wake(), either directly or by the scheduler when a watch window opens or closes
+        self._scheduler = scheduler
+        self._wake_event = threading.Event()
+        self._loop = None
+        self._async_wake = None
+
+        # when set, live status is read from the manager's onlives snapshot where possible
+        self._board = board
+
+        # when set, watching and downloading must first be admitted by the manager's caps
+        self._admission = admission
+        self._queued = None
+        self._preempted = False
+
+        # times the way from going live to recording, see showroom.latency
+        self._latency = latency
+        self._golive = None
+        self._started_at = None
+
         self._room = room
         self._client = client
         self._settings = settings
@@ -215,7 +284,7 @@ class Watcher(object):
         if start_time:
             self.__start_time = start_time
         else:
-            self.__start_time = datetime.datetime.now(tz=TOKYO_TZ)
+            self.__start_time = clock.now()
 
         self._end_time = None
 
@@ -227,6 +296,9 @@ class Watcher(object):
         self.__live_time = datetime.datetime.fromtimestamp(0.0, tz=TOKYO_TZ)
 
         self.__mode = "schedule"
+        self._mode_listeners = []
+        if self._admission is not None:
+            self.add_mode_listener(self._admission.on_mode_change)
 
     # mainly used by hacked together priority heapq
     def __bool__(self):
@@ -298,16 +370,51 @@ class Watcher(object):
     @_mode.setter
     def _mode(self, new_mode):
         with self._lock:
+            old_mode = self.__mode
             self.__mode = new_mode
+            listeners = list(self._mode_listeners)
+        # called outside the lock, listeners may take their own
+        if new_mode != old_mode:
+            for callback in listeners:
+                callback(self)
+
+    def add_mode_listener(self, callback):
+        """Registers callback(watcher) to be called whenever the Watcher's mode changes."""
+        with self._lock:
+            self._mode_listeners.append(callback)
+
+    def remove_mode_listener(self, callback):
+        with self._lock:
+            try:
+                self._mode_listeners.remove(callback)
+            except ValueError:
+                pass
 
     @property
     def __watch_rate(self):
         return self._settings.throttle.rate.watch
 
+    @property
+    def __idle_timeout(self):
+        # with a scheduler this is only a safety net in case a wake up is missed
+        return 60.0 if self._scheduler is not None else 1.0
+
     @property
     def __live_rate(self):
         return self._settings.throttle.rate.live
 
+    @property
+    def __prewarm_rate(self):
+        return self._settings.throttle.prewarm.rate
+
+    @property
+    def __check_deadline(self):
+        # seconds a live check may take, retries included, never past the end of the watch window
+        seconds = self._settings.http.deadline.live_check
+        if self._mode == "watch":
+            seconds = min(seconds, max((self._watch_end_time - clock.now()).total_seconds(), 1.0))
+        return seconds
+
     @property
     def __download_timeout(self):
         return self._settings.throttle.timeout.downloads
@@ -324,6 +431,10 @@ class Watcher(object):
                 "end_time": self._end_time,
                 "live": self.is_live(),
                 "mode": self._mode,
+                # "watch" or "download" if waiting on a free slot
+                "queued": self._queued,
+                "preempted": self._preempted,
+                "latency": self._golive.get_info() if self._golive else None,
                 # this is kinda hokey, but it's needed often enough so...
                 "name": room_info['name'],
                 "room": room_info,
@@ -343,6 +454,95 @@ class Watcher(object):
                 watch_duration = self.watch_duration
             self._watch_start_time = watch_time - datetime.timedelta(seconds=watch_duration)
             self._watch_end_time = watch_time + datetime.timedelta(seconds=watch_duration*2.0)
+            if self._scheduler is not None:
+                self._scheduler.schedule((id(self), "watch_start"), self._watch_start_time, self.wake)
+                self._scheduler.schedule((id(self), "watch_end"), self._watch_end_time, self.wake)
+
+    def wake(self):
+        """Interrupts the Watcher's current wait, e.g. because its watch window has opened.
+
+        Safe to call from any thread."""
+        self._wake_event.set()
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._async_wake.set)
+
+    def _wait(self, timeout):
+        """Sleeps for up to timeout seconds, or until woken."""
+        self._wake_event.wait(timeout)
+        self._wake_event.clear()
+
+    async def _await_wake(self, timeout):
+        """Coroutine version of _wait()."""
+        # _wake_event catches wake ups that arrived before arun() attached to the loop
+        if not self._wake_event.is_set():
+            try:
+                await asyncio.wait_for(self._async_wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._wake_event.clear()
+        self._async_wake.clear()
+
+    def _admit(self, kind):
+        """Asks the admission controller, if any, for a watch or download slot.
+
+        If refused, the Watcher is queued and will be woken once it should ask again."""
+        if self._admission is None:
+            if kind == "download" and self._golive is not None:
+                self._golive.mark("admitted")
+            return True
+        # set from onlives, so a room already live needn't queue for a watch slot
+        live = self._started_at is not None
+        if self._admission.acquire(self, kind, live=live):
+            if kind == "download":
+                self._preempted = False
+                if self._golive is not None:
+                    self._golive.mark("admitted")
+            return True
+        return False
+
+    def _holds(self, kind):
+        """Returns whether the Watcher still holds a slot, i.e. hasn't been preempted."""
+        return self._admission is None or self._admission.holds(self, kind)
+
+    def _withdraw(self, kind):
+        """Gives up the Watcher's place in the admission queue, if it has one."""
+        if self._admission is not None and self._queued == kind:
+            self._admission.withdraw(self, kind)
+
+    def _set_queued(self, kind):
+        # called by the admission controller
+        self._queued = kind
+        self._update_flag.set()
+
+    def preempt(self):
+        """Stops downloading to make way for a higher priority room.
+
+        The Watcher stays in "live" mode and resumes downloading once readmitted.
+        If it was only about to start downloading, it notices the lost slot itself."""
+        core_logger.info('Pausing download of {} for a higher priority room'.format(self.name))
+        self._preempted = True
+        if self._mode == "download":
+            self._mode = "live"
+            if self._download.is_running():
+                self._download.stop()
+        self.wake()
+
+    def set_started_at(self, started_at):
+        """Records the POSIX time the room's current live started, according to onlives."""
+        self._started_at = started_at
+        if self._golive is not None:
+            self._golive.set_started_at(started_at)
+        if self._queued == "watch":
+            # now admitted past the watch cap
+            self.wake()
+
+    def _went_live(self):
+        """Starts timing the live's way to being recorded, once a live check comes back positive."""
+        on_complete = self._latency.record if self._latency is not None else None
+        self._golive = GoLiveTimer(self.priority, self._started_at, on_complete)
+        self._golive.mark("detected")
+        self._download.timer = self._golive
 
     def is_live(self):
         """Returns whether the stream is live or not.
@@ -353,30 +553,85 @@ class Watcher(object):
     def _watch_ready(self):
         # start watch_seconds before start_time
         # finish watch_seconds * 2 after start_time
-        curr_time = datetime.datetime.now(tz=TOKYO_TZ)
+        curr_time = clock.now()
 
         # TODO: is this noticeably slower than the old (int > (curr - start).totalseconds() > int)
         if (self._watch_start_time
-                < curr_time
+                <= curr_time
                 < self._watch_end_time):
             return True
         else:
             return False
 
+    def _prewarm_ready(self):
+        """Returns whether start_time is close enough to pre-warm the streaming urls.
+
+        Not once the onlives snapshot has shown the room live, or was taken after
+        start_time without it: check_live_status then answers without a request.
+        """
+        prewarm = self._settings.throttle.prewarm
+        if not prewarm or not prewarm.enabled:
+            return False
+        # seconds until (positive) or since (negative) start_time
+        time_diff = (self.__start_time - clock.now()).total_seconds()
+        if not -prewarm.lag <= time_diff <= prewarm.lead:
+            return False
+        if self._board is not None:
+            live = self._board.lookup(self.room_id)
+            if live or (live is not None and self._board.snapshot_time >= self.__start_time.timestamp()):
+                return False
+        return True
+
+    def prewarm(self):
+        """Fetches the room's streaming urls ahead of it going live.
+
+        streaming_url is only populated while a room is live, so this doubles as a
+        live check, one that leaves the Downloader ready to start ffmpeg without any
+        further requests. Polling it also keeps the client's connection open.
+
+        Returns:
+            True if the room is live
+        """
+        try:
+            with request_deadline(self.__check_deadline), request_priority(PREWARM_PRIORITY):
+                self._live = self._download.update_streaming_url()
+        except HTTPError as e:
+            core_logger.warn('Caught HTTPError while pre-warming streaming urls: {}'.format(e))
+            self._live = False
+        return self._live
+
+    def _live_wait(self):
+        """Returns seconds until _live_ready() is next true."""
+        elapsed = (clock.now() - self.__live_time).total_seconds()
+        # _live_ready() wants strictly more than live_rate
+        return max(self.__live_rate - elapsed, 0.0) + 0.01
+
     def _live_ready(self):
-        curr_time = datetime.datetime.now(tz=TOKYO_TZ)
+        curr_time = clock.now()
         if (curr_time - self.__live_time).total_seconds() > self.__live_rate:
             self.__live_time = curr_time
             return True
         else:
             return False
 
-    def check_live_status(self):
+    def check_live_status(self, since=None):
         """Checks if the stream is live or not.
 
-        This actually checks the website"""
+        This actually checks the website, unless the manager's onlives snapshot
+        (if any) is fresh enough to answer.
+
+        Args:
+            since: optional POSIX time the onlives snapshot must be newer than
+                for its answer to be used
+        """
+        if self._board is not None:
+            live = self._board.lookup(self.room_id, since=since)
+            if live is not None:
+                self._live = live
+                return self._live
         try:
-            self._live = self._client.is_live(self.room_id)
+            with request_deadline(self.__check_deadline):
+                self._live = self._client.is_live(self.room_id)
         except HTTPError as e:
             core_logger.warn('Caught HTTPError while checking room\'s live status: {}'.format(e))
             self._live = False
@@ -384,9 +639,11 @@ class Watcher(object):
 
     def stop(self):
         self._mode = "quitting"
+        self.wake()
         if self._download.is_running():
             self._download.stop()
-        self.comment_logger.quit()
+        if self.comment_logger:
+            self.comment_logger.quit()
 
     def kill(self):
         with self._lock:
@@ -424,25 +681,36 @@ class Watcher(object):
         # core_logger.debug('Entering {} mode for {}'.format(self.mode, self.name))
         while self._mode == "schedule":
             if self._watch_ready():
-                core_logger.info('Watching {}'.format(self.name))
-                self._mode = "watch"
+                if self._admit("watch"):
+                    core_logger.info('Watching {}'.format(self.name))
+                    self._mode = "watch"
+                else:
+                    # queued, woken when a watch slot frees up
+                    self._wait(self.__idle_timeout)
             else:
-                time.sleep(1.0)
+                # e.g. the window closed or was rescheduled while queued
+                self._withdraw("watch")
+                self._wait(self.__idle_timeout)
 
         # core_logger.debug('Entering {} mode for {}'.format(self.mode, self.name))
         while self._mode == "watch":
             if self._watch_ready():
-                if self.check_live_status():
-                    self._start_time = datetime.datetime.now(tz=TOKYO_TZ)
+                prewarming = self._prewarm_ready()
+                if self.prewarm() if prewarming else self.check_live_status():
+                    self._went_live()
+                    self._start_time = clock.now()
                     core_logger.info('{} is now live'.format(self.name))
-                    if self.room.is_wanted():
+                    if self.room.is_wanted() and self._admit("download"):
                         self._mode = "download"
                     else:
-                        self.download.update_streaming_url()
+                        # not wanted, or queued for a download slot
+                        if not self.download.has_fresh_urls():
+                            self.download.update_streaming_url()
                         self._mode = "live"
                 else:
                     # This is okay as long as watch rate is a short period of time
-                    time.sleep(self.__watch_rate)
+                    # the scheduler wakes us early if the watch window closes meanwhile
+                    self._wait(self.__prewarm_rate if prewarming else self.__watch_rate)
             else:
                 self._mode = "expired"
 
@@ -463,11 +731,19 @@ class Watcher(object):
                     # TODO: periodically update the streaming urls
                     if self.check_live_status():
                         if self.room.is_wanted():
-                            self._mode = "download"
+                            if self._admit("download"):
+                                self._mode = "download"
+                        else:
+                            self._withdraw("download")
                     else:
-                        self._end_time = datetime.datetime.now(tz=TOKYO_TZ)
+                        self._end_time = clock.now()
                         self._mode = "completed"
-                time.sleep(1.0)
+                elif self._queued == "download" and self.room.is_wanted():
+                    # woken because a download slot may have freed up
+                    if self._admit("download"):
+                        self._mode = "download"
+                # until the next live check, unless woken first, e.g. by admission or stop()
+                self._wait(self._live_wait())
 
             while self._mode == "download":
                 # this happens at the top here so that changing mode to "quitting"
@@ -475,18 +751,120 @@ class Watcher(object):
                 # check_live_status was moved to the end to avoid
                 # pinging the site twice whenever a download starts
                 if self.is_live():
-                    if self.room.is_wanted():
+                    if not self._holds("download"):
+                        self._mode = "live"
+                    elif self.room.is_wanted():
                         self.download.start()
+                        if self._mode != "download":
+                            # preempted or stopped while ffmpeg was starting
+                            self.download.stop()
                     else:
                         self._mode = "live"
                 else:
-                    self._end_time = datetime.datetime.now(tz=TOKYO_TZ)
+                    self._end_time = clock.now()
                     self._mode = 'completed'
 
                 # self.download.wait(timeout=self.__download_timeout)
                 self.download.wait()
+                ended = clock.time()
                 time.sleep(0.5)
-                self.check_live_status()
+                self.check_live_status(since=ended)
+
+        self._finish()
+
+    async def arun(self):
+        """
+        Coroutine version of run(), for use on an AsyncWatcherEngine.
+
+        Follows exactly the same flow as run(), but sleeps on the event loop and
+        awaits blocking client calls and ffmpeg instead of holding a thread.
+        """
+        loop = asyncio.get_event_loop()
+        self._async_wake = asyncio.Event()
+        self._loop = loop
+
+        def blocking(func, *args):
+            return loop.run_in_executor(None, func, *args)
+
+        self._update_flag.set()
+        while self._mode == "schedule":
+            if self._watch_ready():
+                if self._admit("watch"):
+                    core_logger.info('Watching {}'.format(self.name))
+                    self._mode = "watch"
+                else:
+                    await self._await_wake(self.__idle_timeout)
+            else:
+                self._withdraw("watch")
+                await self._await_wake(self.__idle_timeout)
+
+        while self._mode == "watch":
+            if self._watch_ready():
+                prewarming = self._prewarm_ready()
+                if await blocking(self.prewarm if prewarming else self.check_live_status):
+                    self._went_live()
+                    self._start_time = clock.now()
+                    core_logger.info('{} is now live'.format(self.name))
+                    if self.room.is_wanted() and self._admit("download"):
+                        self._mode = "download"
+                    else:
+                        if not self.download.has_fresh_urls():
+                            await blocking(self.download.update_streaming_url)
+                        self._mode = "live"
+                else:
+                    await self._await_wake(self.__prewarm_rate if prewarming else self.__watch_rate)
+            else:
+                self._mode = "expired"
+
+        if self.mode in ("live", "download"):
+            self._update_flag.set()
+            if self.comment_logger:
+                self.comment_logger.start()
+
+        while self._mode in ("live", "download"):
+            while self._mode == "live":
+                if self._live_ready():
+                    if await blocking(self.check_live_status):
+                        if self.room.is_wanted():
+                            if self._admit("download"):
+                                self._mode = "download"
+                        else:
+                            self._withdraw("download")
+                    else:
+                        self._end_time = clock.now()
+                        self._mode = "completed"
+                elif self._queued == "download" and self.room.is_wanted():
+                    if self._admit("download"):
+                        self._mode = "download"
+                await self._await_wake(self._live_wait())
+
+            while self._mode == "download":
+                if self.is_live():
+                    if not self._holds("download"):
+                        self._mode = "live"
+                    elif self.room.is_wanted():
+                        await blocking(self.download.start)
+                        if self._mode != "download":
+                            self.download.stop()
+                    else:
+                        self._mode = "live"
+                else:
+                    self._end_time = clock.now()
+                    self._mode = 'completed'
+
+                await self.download.wait_async()
+                ended = clock.time()
+                await asyncio.sleep(0.5)
+                await blocking(self.check_live_status, ended)
+
+        self._loop = None
+        self._finish()
+
+    def _finish(self):
+        """Settles the end state shared by run() and arun()."""
+        if self._scheduler is not None:
+            self._scheduler.cancel((id(self), "watch_start"))
+            self._scheduler.cancel((id(self), "watch_end"))
 
         # core_logger.debug('Entering {} mode for {}'.format(self.mode, self.name))
         # TODO: decide what to do with the three end states
@@ -515,9 +893,15 @@ class Watcher(object):
 class WatchQueue(object):
     """Priority heap queue that also permits iteration.
 
+    Also keeps an index of Watchers by mode, kept current by listening to each
+    Watcher's mode changes, so that get_by_mode() only visits matching Watchers
+    and count_by_mode() is O(1).
+
+    Removed entries are left in the heap as tombstones and compacted lazily, once
+    they outnumber the live entries or when rebuild() is called.
+
     TODO:
         Review need for this object
-        Write a proper docstring
         Decide how to quit
         Deal with downloads and lives in remove/prune methods.
         Review need for prune
@@ -536,7 +920,11 @@ class WatchQueue(object):
         self.entry_map = {}
         self._counter = itertools.count()
         self._dirty = False
+        self._removed = 0
         self._rlock = threading.RLock()
+        # mode -> {room_id: watcher}, and room_id -> mode it is indexed under
+        self._by_mode = {}
+        self._modes = {}
 
     def __len__(self):
         return len(self.entry_map)
@@ -557,6 +945,10 @@ class WatchQueue(object):
     def __getitem__(self, key):
         return self.entry_map[key][2]
 
+    def room_ids(self):
+        with self._rlock:
+            return set(self.entry_map)
+
     def __contains__(self, room_id):
         with self._rlock:
             if room_id in self.entry_map:
@@ -564,6 +956,12 @@ class WatchQueue(object):
             else:
                 return False
 
+    def _expand_mode(self, mode):
+        if mode in self.MODE_GROUPS:
+            return self.MODE_GROUPS[mode]
+        else:
+            return (mode,)
+
     # This looks nicer than ~7 different methods, but is it clearer?
     def get_by_mode(self, mode):
         """Returns an iterator through all Watchers with the given mode or mode group.
@@ -583,14 +981,18 @@ class WatchQueue(object):
             working: schedule, watch, live, download, quitting
             active: watch, live, download
             done: expired, completed
+
+        The matching Watchers are collected when iteration starts, and may have
+        changed mode by the time they are reached.
         """
-        if mode in self.MODE_GROUPS:
-            mode = self.MODE_GROUPS[mode]
-        else:
-            mode = (mode,)
+        with self._rlock:
+            found = [w for m in self._expand_mode(mode) for w in self._by_mode.get(m, {}).values()]
+        yield from found
 
+    def count_by_mode(self, mode):
+        """Returns the number of Watchers with the given mode or mode group."""
         with self._rlock:
-            yield from (i for i in self if i.mode in mode)
+            return sum(len(self._by_mode.get(m, ())) for m in self._expand_mode(mode))
 
     def ids(self):
         """Returns all room ids in the queue.
@@ -598,7 +1000,44 @@ class WatchQueue(object):
         Of debatable utility."""
         with self._rlock:
             return self.entry_map.copy().keys()
-    
+
+    def _index(self, item):
+        # listen first, so a mode change racing with this can't be missed
+        item.add_mode_listener(self._on_mode_change)
+        mode = item.mode
+        self._modes[item.room_id] = mode
+        self._by_mode.setdefault(mode, {})[item.room_id] = item
+
+    def _unindex(self, item):
+        item.remove_mode_listener(self._on_mode_change)
+        mode = self._modes.pop(item.room_id, None)
+        if mode is not None:
+            self._by_mode[mode].pop(item.room_id, None)
+
+    def _on_mode_change(self, item):
+        """Moves a Watcher to its current mode in the index.
+
+        Reads the Watcher's mode rather than trusting the notification, so
+        notifications that arrive out of order still leave the index correct."""
+        with self._rlock:
+            entry = self.entry_map.get(item.room_id)
+            if entry is None or entry[2] is not item:
+                return
+            old_mode = self._modes[item.room_id]
+            new_mode = item.mode
+            if old_mode != new_mode:
+                self._by_mode[old_mode].pop(item.room_id, None)
+                self._by_mode.setdefault(new_mode, {})[item.room_id] = item
+                self._modes[item.room_id] = new_mode
+
+    def _mark_removed(self, entry):
+        self._unindex(entry[2])
+        entry[2] = self.REMOVED
+        self._dirty = True
+        self._removed += 1
+        if self._removed > len(self.entry_map):
+            self.rebuild()
+
     def add(self, item):
         """Adds an item to the queue.
 
@@ -611,6 +1050,7 @@ class WatchQueue(object):
                 entry = [item.priority, count, item]
                 self.entry_map[item.room_id] = entry
                 heappush(self.queue, entry)
+                self._index(item)
                 return True
 
     def pop(self):
@@ -622,7 +1062,9 @@ class WatchQueue(object):
                 priority, count, item = heappop(self.queue)
                 if item is not self.REMOVED:
                     del self.entry_map[item.room_id]
+                    self._unindex(item)
                     return item
+                self._removed -= 1
 
     def replace(self, item):
         """Places an item on the queue and pops another from the front of the queue.
@@ -642,10 +1084,7 @@ class WatchQueue(object):
             if item.room_id in self.entry_map:
                 return self.pop()
             else:
-                count = next(self._counter)
-                entry = [item.priority, count, item]
-                self.entry_map[item.room_id] = entry
-                heappush(self.queue, entry)
+                self.add(item)
                 return self.pop()
 
     def peek(self):
@@ -672,28 +1111,28 @@ class WatchQueue(object):
         """
         if self._dirty:
             with self._rlock:
-                self.queue = [e for e in self.queue if e[2] != self.REMOVED]
+                self.queue = [e for e in self.queue if e[2] is not self.REMOVED]
                 heapify(self.queue)
+                self._dirty = False
+                self._removed = 0
 
     def remove(self, item):
         """Removes item from queue.
 
-        Heap should be rebuilt afterwards."""
+        Heap will be rebuilt once enough items have been removed."""
         with self._rlock:
             entry = self.entry_map.pop(item.room_id)
-            entry[2] = self.REMOVED
-            self._dirty = True
+            self._mark_removed(entry)
 
     def dirty_pop(self, item):
         """Pops a specific item from anywhere in the queue.
 
-        Heap should be rebuilt afterwards."""
+        Heap will be rebuilt once enough items have been removed."""
         with self._rlock:
             entry = self.entry_map.pop(item.room_id)
             if entry:
                 result = entry[2]
-                entry[2] = self.REMOVED
-                self._dirty = True
+                self._mark_removed(entry)
                 return result
             else:
                 return None
@@ -701,20 +1140,19 @@ class WatchQueue(object):
     def pop_end(self):
         """Removes the last item from the queue.
 
-        Heap should be rebuilt afterwards."""
+        Removing the last item of a heap leaves it intact, so no rebuild is needed."""
         with self._rlock:
             while self.queue:
                 priority, count, item = self.queue.pop(-1)
                 if item is not self.REMOVED:
                     del self.entry_map[item.room_id]
-                    self._dirty = True
+                    self._unindex(item)
                     return item
+                self._removed -= 1
 
     def prune(self, priority):
         """Removes a low priority item from the end of the queue.
 
-        Heap should be rebuilt afterwards.
-
         Note that "low" priority is a slight misnomer, since the lowest
         *value* priorities are actually the "highest", most resistant to pruning.
 
@@ -725,6 +1163,7 @@ class WatchQueue(object):
             while self.queue:
                 if self.queue[-1][2] is None:
                     self.queue.pop(-1)
+                    self._removed -= 1
                 elif self.queue[-1][2].priority > priority:
                     self.remove(self.queue[-1][2])
                     return True
@@ -733,30 +1172,81 @@ class WatchQueue(object):
 
 
 class WatchManager(object):
-    def __init__(self, index: ShowroomIndex, settings: ShowroomSettings):
+    def __init__(self, index: ShowroomIndex, settings: ShowroomSettings,
+                 client: ShowroomClient=None, engine: AsyncWatcherEngine=None):
         """
-        
+        Args:
+            index: rooms to watch
+            settings: ShowroomSettings
+            client: optional client to use instead of a new ShowroomClient,
+                e.g. a replay.ReplayClient
+            engine: optional AsyncWatcherEngine to run Watchers on, overriding
+                system.engine
         """
         # maintains a list?
         # does it still need a priority queue?
         # various permutations of the base list
         self.index = index
-        self.client = ShowroomClient()
+        self.client = client or ShowroomClient(cache=ResponseCache.from_settings(settings))
+        # one limiter and breaker for every request this process makes
+        set_limiter(RateLimiter.from_settings(settings))
+        set_breaker(CircuitBreaker.from_settings(settings))
+        # latency and error rates of every endpoint the process requests
+        self.endpoint_stats = EndpointStats.from_settings(settings)
+        if self.endpoint_stats is not None:
+            add_hook(self.endpoint_stats)
         self.settings = settings
         self.watchers = WatchQueue()
         self.completed = []
 
         self._threads = {}
         self._counter = itertools.count()
-        self._undead_threads = Queue()
-        # TODO: undead thread handler?
+        # ends threads and ffmpeg processes that outlive their Watchers
+        self.reaper = Reaper.from_settings(self.settings)
+
+        if self.settings.detection.mode == "onlives":
+            self.board = LiveBoard(max_age=self.settings.detection.max_age)
+        else:
+            self.board = None
+
+        # caps concurrent watches and downloads, admitting by priority
+        self.admission = AdmissionController(self.max_watches, self.max_downloads, self.max_priority)
+
+        # per-stage go-live latencies of recorded lives, by priority
+        self.latency = LatencyStats()
+
+        # in cluster mode, only rooms this node holds a lease on are watched
+        self.leases = RoomLeases.from_settings(self.settings)
+
+        # wakes watchers when their watch windows open and close
+        self.scheduler = DeadlineScheduler()
+        self.scheduler.start()
+
+        if engine is not None:
+            self._engine = engine
+        elif self.settings.system.engine == "asyncio":
+            self._engine = AsyncWatcherEngine(max_workers=self.settings.system.engine_workers or 64)
+        else:
+            self._engine = None
 
         self._completed_lock = threading.RLock()
 
         self.__schedule_time = datetime.datetime.fromtimestamp(0.0, tz=TOKYO_TZ)
         self.__lives_time = self.__schedule_time
 
-        self.update_flag = threading.Event()
+        # None when throttle.adaptive is disabled, in which case the fixed rates are used
+        self._lives_throttle = AdaptiveRate.from_settings(self.settings, "onlives")
+        self._schedule_throttle = AdaptiveRate.from_settings(self.settings, "upcoming")
+
+        # genres to follow in onlives, and to fetch upcoming lives for
+        self.genre_ids = set(self.settings.schedule.genres or GENRE_IDS)
+        upcoming_genre_ids = set(self.settings.schedule.upcoming_genres or UPCOMING_GENRE_IDS)
+        self.schedule_fetcher = ScheduleFetcher(self.client, sorted(upcoming_genre_ids),
+                                                time_tables=TimeTableSource.from_settings(self.settings,
+                                                                                          self.client),
+                                                workers=self.settings.schedule.workers or 4)
+
+        self.update_flag = UpdateFlag()
         
         self._next_maintenance = None
         self.schedule_next_maintenance()
@@ -787,7 +1277,6 @@ class WatchManager(object):
         self._tick_count = 0
     '''
 
-    # These three properties are not in use at the moment
     @property
     def output_dir(self):
         return self.settings.directory.output
@@ -800,10 +1289,17 @@ class WatchManager(object):
     def max_downloads(self):
         return self.settings.throttle.max.downloads
 
+    @property
+    def max_priority(self):
+        return self.settings.throttle.max.priority
+
     def _setup_thread(self, watcher):
         """
         Sets up, names, and starts a thread for the watcher.
 
+        With the asyncio engine, the watcher is instead started as a task on the
+        engine's event loop, and a thread-like handle is stored in its place.
+
         Args:
             A Watcher object ready to start.
 
@@ -815,13 +1311,20 @@ class WatchManager(object):
                 # TODO: handle this error
                 pass
         thread_name = "Watcher-{count}-{name}".format(name=watcher.name, count=next(self._counter))
-        t = threading.Thread(target=watcher.run, name=thread_name)
-        t.start()
+        if self._engine:
+            t = self._engine.submit(watcher.arun(), name=thread_name)
+        else:
+            t = threading.Thread(target=watcher.run, name=thread_name)
+            t.start()
         self._threads[watcher.room_id] = t
+        self.reaper.track(watcher, t)
 
     def update_lives(self):
-        """Looks for unexpected live rooms."""
+        """Looks for unexpected live rooms.
+
+        Also refreshes the onlives snapshot used for bulk live detection."""
         try:
+            snapshot_time = clock.time()
             onlives = self.client.onlives() or []
         except HTTPError as e:
             if not self.__onlives_warned:
@@ -834,33 +1337,56 @@ class WatchManager(object):
             return
         self.__onlives_warned = False
 
-        # temporary fix for getting multiple genres
+        if self._lives_throttle is not None:
+            self._lives_throttle.observe((str(e['room_id']), e.get('live_id'))
+                                         for e in self._indexed_lives(onlives))
+
+        self.apply_lives(onlives, snapshot_time)
+
+    def _indexed_lives(self, onlives):
+        """Yields the entries of an onlives response for indexed rooms in the watched genres."""
         for livelist in onlives:
-            if livelist['genre_id'] in GENRE_IDS:
-                for item in [e for e in livelist['lives'] if 'room_id' in e and str(e['room_id']) in self.index]:
-                    room_id = str(item['room_id'])
-                    # TODO: incorporate live_id into watchers
-                    # either as '{room_id}_{live_id}' or as (room_id, live_id)
-                    # TODO: store room_id and live_id as integers instead of strings
-                    live_id = str(item['live_id'])
-                    start_time = datetime.datetime.fromtimestamp(float(item['started_at']), tz=TOKYO_TZ)
-
-                    # core_logger.debug('Checking live room id {}'.format(room_id))
-                    if room_id in self.watchers:
-                        if self.watchers[room_id].mode == "schedule":
-                            self.watchers[room_id].reschedule(start_time)
-                            self.watchers[room_id].set_watch_time(datetime.datetime.now(tz=TOKYO_TZ))
-                            core_logger.debug('Early live for {} at {}'.format(self.watchers[room_id].name,
-                                                                               self.watchers[
-                                                                                   room_id].formatted_start_time))
-                    else:
-                        new = Watcher(self.index[room_id], self.client, self.settings,
-                                      update_flag=self.update_flag, start_time=start_time)
-                        new.set_watch_time(datetime.datetime.now(tz=TOKYO_TZ))
-                        info = new.get_info()
-                        core_logger.debug(
-                            'Unscheduled live for {} starting at {}'.format(info['name'], info['start_time']))
-                        self.add(new)
+            if livelist['genre_id'] in self.genre_ids:
+                yield from (e for e in livelist['lives'] if 'room_id' in e and str(e['room_id']) in self.index)
+
+    def apply_lives(self, onlives, snapshot_time=None):
+        """Adds or reschedules watchers for the rooms live in an onlives response.
+
+        Args:
+            onlives: the list returned by ShowroomClient.onlives()
+            snapshot_time: POSIX time onlives was fetched
+        """
+        if self.board is not None:
+            self.board.update(onlives, snapshot_time)
+
+        for item in self._indexed_lives(onlives):
+            room_id = str(item['room_id'])
+            # TODO: incorporate live_id into watchers
+            # either as '{room_id}_{live_id}' or as (room_id, live_id)
+            # TODO: store room_id and live_id as integers instead of strings
+            live_id = str(item['live_id'])
+            start_time = datetime.datetime.fromtimestamp(float(item['started_at']), tz=TOKYO_TZ)
+
+            # core_logger.debug('Checking live room id {}'.format(room_id))
+            if room_id in self.watchers:
+                self.watchers[room_id].set_started_at(float(item['started_at']))
+                if self.watchers[room_id].mode == "schedule":
+                    self.watchers[room_id].reschedule(start_time)
+                    self.watchers[room_id].set_watch_time(clock.now())
+                    core_logger.debug('Early live for {} at {}'.format(self.watchers[room_id].name,
+                                                                       self.watchers[
+                                                                           room_id].formatted_start_time))
+            elif self._claim(room_id):
+                new = Watcher(self.index[room_id], self.client, self.settings,
+                              update_flag=self.update_flag, start_time=start_time,
+                              scheduler=self.scheduler, board=self.board,
+                              admission=self.admission, latency=self.latency)
+                new.set_watch_time(clock.now())
+                new.set_started_at(float(item['started_at']))
+                info = new.get_info()
+                core_logger.debug(
+                    'Unscheduled live for {} starting at {}'.format(info['name'], info['start_time']))
+                self.add(new)
 
         # lives is a list of json objects (dicts)
         # representing items to include in the page
@@ -877,9 +1403,8 @@ class WatchManager(object):
 
     def update_schedule(self):
         """Checks the schedule and adds watchers for any new rooms found."""
-        # TODO: get multiple genres
         try:
-            upcoming = self.client.upcoming(genre_id=102) or []
+            upcoming = self.schedule_fetcher.fetch(watching=self.watched_room_ids())
         except HTTPError as e:
             if not self.__schedule_warned:
                 if e.response.status_code >= 500:
@@ -891,9 +1416,26 @@ class WatchManager(object):
                     core_logger.warn('Fetching onlives failed unexpectedly: {}'.format(e))
                 self.__schedule_warned = True
             return
+        except (RequestException, ValueError, KeyError) as e:
+            if not self.__schedule_warned:
+                core_logger.warn('Fetching schedule failed: {!r}'.format(e))
+                self.__schedule_warned = True
+            return
         self.__schedule_warned = False
 
-        for item in [e for e in upcoming if str(e['room_id']) in self.index]:
+        upcoming = [e for e in upcoming if str(e['room_id']) in self.index]
+        if self._schedule_throttle is not None:
+            self._schedule_throttle.observe((str(e['room_id']), e['next_live_start_at']) for e in upcoming)
+
+        self.apply_schedule(upcoming)
+
+    def watched_room_ids(self):
+        """Returns the room_ids that have a Watcher."""
+        return self.watchers.room_ids()
+
+    def apply_schedule(self, upcoming):
+        """Adds or reschedules watchers for the indexed rooms in an upcoming response."""
+        for item in upcoming:
             start_time = datetime.datetime.fromtimestamp(float(item['next_live_start_at']), 
                                                          tz=TOKYO_TZ)
             room_id = str(item['room_id'])
@@ -912,31 +1454,42 @@ class WatchManager(object):
                     self.watchers[room_id].reschedule(start_time)
                     core_logger.debug('{} rescheduled for {}'.format(self.watchers[room_id].name,
                                                                      self.watchers[room_id].formatted_start_time))
-            else:
+            elif self._claim(room_id):
                 new = Watcher(self.index[room_id], self.client, self.settings,
-                              update_flag=self.update_flag, start_time=start_time)
+                              update_flag=self.update_flag, start_time=start_time,
+                              scheduler=self.scheduler, board=self.board,
+                              admission=self.admission, latency=self.latency)
                 core_logger.info('{} scheduled for {}'.format(new.name, new.formatted_start_time))
                 self.add(new)
 
+    def _claim(self, room_id):
+        """Returns whether this node should watch a room, always True outside cluster mode."""
+        return self.leases is None or self.leases.claim(self.index[room_id])
+
+    def update_leases(self):
+        """Renews this node's room leases, and stops watching rooms another node took over."""
+        for room_id in self.leases.renew():
+            if room_id in self.watchers:
+                core_logger.info('Handing {} over to another node'.format(self.watchers[room_id].name))
+                self.watchers[room_id].stop()
+
     def update_completed(self):
         for watch in self.watchers.get_by_mode("done"):
             with self._completed_lock:
                 watch = self.watchers.dirty_pop(watch)
                 self.completed.append(watch)
-            try:
-                thread = self._threads.pop(watch.room_id)
-            except KeyError:
-                # TODO: handle this error
-                pass
-            # else:
-                # is this check necessary?
-                # is it too fast?
-                # if thread.is_alive():
-                    # TODO: log undead threads
-                    # TODO: handle undead threads elsewhere
-                    # self._undead_threads.put(thread)
+            if self.leases is not None:
+                self.leases.release(watch.room_id)
+            # the reaper keeps track of the thread until it ends
+            self._threads.pop(watch.room_id, None)
+
+    def reap(self):
+        """Ends threads and ffmpeg processes that outlived their Watchers, every reaper.interval."""
+        if self.reaper.ready():
+            self.reaper.sweep()
 
-        self.watchers.rebuild()
+    def get_reaper_info(self):
+        return self.reaper.get_info()
 
     def write_schedules(self):
         outfile = self.settings.file.schedule
@@ -969,45 +1522,51 @@ class WatchManager(object):
             # schedules should already be sorted
             core_logger.debug('Writing schedules to file')
             with open(outfile, 'w', encoding='utf8') as outfp:
-                json.dump(schedules, outfp, ensure_ascii=False, indent=2)
+                codec.dump(schedules, outfp, compact=self.settings.feedback.compact_json)
 
             # even if the update_flag gets set again we don't want to spit out another update so fast
             # TODO: make the sleep time here configurable?
             time.sleep(4.0)
 
+    def pop_completed_info(self):
+        """Returns info for every completed Watcher not yet written out, and forgets them."""
+        infos = []
+        with self._completed_lock:
+            for item in self.completed:
+                info = item.get_info()
+                for key in ('start_time', 'end_time'):
+                    info[key] = str(info[key])
+                infos.append(info)
+            self.completed = []
+        return infos
+
     def write_completed(self):
         """Called by the manager?"""
         # TODO: add today's date to the completed file, change it during nightly maintenance
 
         # dirty hack: no timezone, so we get the "correct" date even after midnight JST
-        datestr = datetime.datetime.now().strftime(FULL_DATE_FMT)[:10]
+        datestr = clock.now(tz=None).strftime(FULL_DATE_FMT)[:10]
         outfile = self.settings.file.completed.replace('.json', '_{}.json'.format(datestr))
         try:
             with open(outfile, 'r', encoding='utf8') as infp:
-                completed = json.load(infp)
+                completed = codec.load(infp)
         except FileNotFoundError:
             completed = []
         except JSONDecodeError:
             # TODO: backups
             raise
 
-        with self._completed_lock:
-            for item in self.completed:
-                info = item.get_info()
-                for key in ('start_time', 'end_time'):
-                    info[key] = str(info[key])
-                completed.append(info)
-            self.completed = []
+        completed.extend(self.pop_completed_info())
 
         with open(outfile, 'w', encoding='utf8') as outfp:
-            json.dump(completed, outfp, indent=2, ensure_ascii=False)
+            codec.dump(completed, outfp, compact=self.settings.feedback.compact_json)
 
     def schedule_next_maintenance(self, minutes=None):
         if minutes:
             maint_time = self._next_maintenance + datetime.timedelta(minutes=minutes)
 
         if not minutes or maint_time.hour > 5:
-            maint_time = (datetime.datetime.now(tz=TOKYO_TZ) + datetime.timedelta(days=1)).replace(hour=0, minute=5, second=0, microsecond=0)
+            maint_time = (clock.now() + datetime.timedelta(days=1)).replace(hour=0, minute=5, second=0, microsecond=0)
 
         self._next_maintenance = maint_time
 
@@ -1020,19 +1579,98 @@ class WatchManager(object):
     def get_working_list(self):
         """Returns a list of all currently scheduled and live rooms"""
         # Watchers that aren't in one of these 4 modes shouldn't be in the WatchQueue any more.
-        return sorted((e.get_info() for e in self.watchers.get_by_mode("working")),
+        return sorted(self.get_info_by_mode("working"),
                       key=lambda x: (x['start_time'], x['room']['name']))
 
+    def get_info_by_mode(self, mode):
+        """Returns get_info() for every Watcher with the given mode or mode group."""
+        return [e.get_info() for e in self.watchers.get_by_mode(mode)]
+
+    def count_by_mode(self, mode):
+        """Returns the number of Watchers with the given mode or mode group."""
+        return self.watchers.count_by_mode(mode)
+
+    def get_admission_info(self):
+        return self.admission.get_info()
+
+    def get_latency_info(self):
+        """Returns go-live latency histograms, see LatencyStats.get_info()."""
+        return self.latency.get_info()
+
+    def get_limiter_info(self):
+        """Returns the state of the process-wide rate limiter, see RateLimiter.get_info()."""
+        limiter = get_limiter()
+        return limiter.get_info() if limiter is not None else {}
+
+    def get_circuit_info(self):
+        """Returns the state of the process-wide circuit breaker, see CircuitBreaker.get_info()."""
+        breaker = get_breaker()
+        return breaker.get_info() if breaker is not None else {}
+
+    def get_endpoint_info(self):
+        """Returns per endpoint request stats, see EndpointStats.get_info()."""
+        return self.endpoint_stats.get_info() if self.endpoint_stats is not None else {}
+
+    def collect_metrics(self):
+        """Metrics collector describing the Watchers' current state, see showroom.metrics."""
+        working = self.get_info_by_mode("working")
+        modes = dict.fromkeys(WatchQueue.MODE_GROUPS["working"], 0)
+        restarts, pingouts = [], []
+        for info in working:
+            modes[info['mode']] = modes.get(info['mode'], 0) + 1
+            if info['mode'] in WatchQueue.MODE_GROUPS["live"]:
+                labels = {"room_id": info['room']['room_id'], "name": info['name']}
+                restarts.append(("", labels, info['download']['restarts']))
+                pingouts.append(("", labels, info['download']['pingouts']))
+
+        admission = self.get_admission_info()
+        reaper = self.get_reaper_info()
+        golive = [sample
+                  for priority, by_stage in self.get_latency_info().items()
+                  for stage, hist in by_stage.items()
+                  for sample in histogram_samples(hist, {"priority": priority, "stage": stage})]
+
+        return [
+            ("showroom_watchers", "gauge", "Watchers by mode",
+             [("", {"mode": mode}, count) for mode, count in modes.items()]),
+            ("showroom_ffmpeg_processes", "gauge", "Running ffmpeg processes",
+             [("", {}, sum(1 for info in working if info['download']['active']))]),
+            ("showroom_download_restarts", "gauge", "ffmpeg restarts during the current live, by room",
+             restarts),
+            ("showroom_download_pingouts", "gauge", "Consecutive downloads stopped by ping loops, by room",
+             pingouts),
+            ("showroom_admission_slots", "gauge", "Watch and download slots in use or queued for",
+             [("", {"kind": kind, "state": state}, admission[kind][state])
+              for kind in AdmissionController.KINDS for state in ("active", "queued")]),
+            ("showroom_golive_seconds", "histogram", "Go-live latency by room priority and stage", golive),
+            ("showroom_leaked_resources", "gauge", "Threads and processes outliving their Watchers",
+             [("", {"kind": kind}, reaper[kind])
+              for kind in ("watcher_threads", "comment_threads", "ffmpeg_processes")]),
+            ("showroom_reaped_total", "counter", "Leaked processes and loggers ended, by action",
+             [("", {"action": action}, reaper[action]) for action in ("terminated", "killed")]),
+        ]
+
     @property
     def __schedule_rate(self):
-        return self.settings.throttle.rate.upcoming
+        rate = self.settings.throttle.rate.upcoming
+        if self._schedule_throttle is not None:
+            rate = self._schedule_throttle.get_rate(rate)
+        return rate
 
     @property
     def __lives_rate(self):
-        return self.settings.throttle.rate.onlives
+        rate = self.settings.throttle.rate.onlives
+        if self._lives_throttle is not None:
+            rate = self._lives_throttle.get_rate(rate)
+        if self.board is not None:
+            # onlives stands in for every watching room's is_live checks,
+            # so poll it as often as they would have been polled
+            if self.count_by_mode("watch") > 0:
+                return min(rate, self.settings.throttle.rate.watch)
+        return rate
 
     def _schedule_ready(self):
-        curr_time = datetime.datetime.now(tz=TOKYO_TZ)
+        curr_time = clock.now()
         time_diff = (curr_time - self.__schedule_time).total_seconds()
         if time_diff > self.__schedule_rate:
             # core_logger.debug('Time difference of {} is greater than schedule rate of {}, '
@@ -1044,7 +1682,7 @@ class WatchManager(object):
             return False
 
     def _lives_ready(self):
-        curr_time = datetime.datetime.now(tz=TOKYO_TZ)
+        curr_time = clock.now()
         time_diff = (curr_time - self.__lives_time).total_seconds()
         if time_diff > self.__lives_rate:
             # core_logger.debug('Time difference of {} is greater than live rate of {}, '
@@ -1055,10 +1693,22 @@ class WatchManager(object):
             # core_logger.debug('Skipping live check')
             return False
 
+    def time_until_next_tick(self):
+        """Returns the number of seconds until tick() next has something to do.
+
+        Capped at MAX_TICK_WAIT, since the poll rates can change while waiting."""
+        curr_time = clock.now()
+        waits = (self.__lives_rate - (curr_time - self.__lives_time).total_seconds(),
+                 self.__schedule_rate - (curr_time - self.__schedule_time).total_seconds(),
+                 (self._next_maintenance - curr_time).total_seconds(),
+                 MAX_TICK_WAIT)
+        # the ready checks compare with >, so overshoot slightly
+        return max(min(waits), 0.0) + 0.01
+
     def _maintenance_ready(self):
-        curr_time = datetime.datetime.now(tz=TOKYO_TZ)
+        curr_time = clock.now()
         if self._next_maintenance < curr_time:
-            if len(list(self.watchers.get_by_mode("live"))) < 1:
+            if self.count_by_mode("live") < 1:
                 return True
             else:
                 # core_logger.debug('Live watcher prevents maintenance, rescheduling')
@@ -1073,6 +1723,9 @@ class WatchManager(object):
     def tick(self):
         """Periodic live and schedule check"""
 
+        if self.leases is not None:
+            self.update_leases()
+
         if self._lives_ready():
             # core_logger.debug('Checking lives')
 
@@ -1090,12 +1743,22 @@ class WatchManager(object):
         if self._maintenance_ready():
             self.do_maintenance()
 
+        self.reap()
+
     def stop(self):
         for watch in self.watchers:
             watch.stop()
         while self.watchers:
             self.update_completed()
             time.sleep(0.5)
+        if self.leases is not None:
+            self.leases.release_all()
+        self.schedule_fetcher.close()
+        if self._engine:
+            self._engine.stop()
+        self.scheduler.stop()
+        if self.endpoint_stats is not None:
+            remove_hook(self.endpoint_stats)
         # TODO: handle zombie threads/watchers
 
 
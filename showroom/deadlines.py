@@ -0,0 +1,121 @@
+# Central deadline scheduler for Watcher watch windows
+import itertools
+import logging
+import threading
+from heapq import heapify, heappush, heappop
+
+from . import clock
+
+deadline_logger = logging.getLogger('showroom.deadlines')
+
+
+class DeadlineScheduler(object):
+    """Wakes callers exactly when their deadlines arrive.
+
+    Deadlines live in a heap keyed by time, with an entry map so that a key can be
+    re-keyed (e.g. when a Watcher is rescheduled) without searching the heap. As in
+    WatchQueue, replaced entries are marked REMOVED and dropped lazily, so schedule,
+    cancel, and each fired deadline cost O(log n).
+
+    Callbacks are run on the scheduler's thread and must return quickly, e.g.
+    by setting an Event.
+    """
+    REMOVED = None
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._quitting = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def schedule(self, key, when, callback):
+        """Schedules callback() to be called at when, replacing any deadline with the same key.
+
+        Args:
+            key: any hashable identifying the deadline
+            when: either a POSIX timestamp or an aware datetime
+            callback: called with no arguments once the deadline has passed
+        """
+        if hasattr(when, 'timestamp'):
+            when = when.timestamp()
+        with self._cond:
+            self._remove(key)
+            entry = [when, next(self._counter), key, callback]
+            self._entries[key] = entry
+            heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                # new earliest deadline, the run loop needs to shorten its wait
+                self._cond.notify()
+
+    def cancel(self, key):
+        with self._cond:
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[3] = self.REMOVED
+            # compact once tombstones make up most of the heap
+            if len(self._heap) > 2 * len(self._entries) + 64:
+                self._heap = [e for e in self._heap if e[3] is not self.REMOVED]
+                heapify(self._heap)
+
+    def next_deadline(self):
+        """Returns the timestamp of the earliest pending deadline, or None."""
+        with self._cond:
+            while self._heap and self._heap[0][3] is self.REMOVED:
+                heappop(self._heap)
+            if self._heap:
+                return self._heap[0][0]
+            return None
+
+    def fire_due(self, now=None):
+        """Runs the callbacks of all deadlines that have passed.
+
+        Returns:
+            Number of callbacks run.
+        """
+        if now is None:
+            now = clock.time()
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                when, count, key, callback = heappop(self._heap)
+                if callback is not self.REMOVED:
+                    del self._entries[key]
+                    due.append(callback)
+        for callback in due:
+            try:
+                callback()
+            except Exception as e:
+                deadline_logger.error('Deadline callback failed: {}'.format(e), exc_info=e)
+        return len(due)
+
+    def run(self):
+        while not self._quitting:
+            with self._cond:
+                next_time = self.next_deadline()
+                if next_time is None:
+                    self._cond.wait()
+                else:
+                    timeout = next_time - clock.time()
+                    if timeout > 0:
+                        self._cond.wait(timeout)
+            self.fire_due()
+
+    def start(self):
+        if not self._thread or not self._thread.is_alive():
+            self._quitting = False
+            self._thread = threading.Thread(target=self.run, name="DeadlineScheduler")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._quitting = True
+            self._cond.notify()
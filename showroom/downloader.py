@@ -1,4 +1,5 @@
 # Showroom Downloader
+import asyncio
 import subprocess
 import threading
 import datetime
@@ -7,6 +8,7 @@ import time
 import os
 import shutil
 
+from . import clock
 from .constants import TOKYO_TZ, FULL_DATE_FMT
 from .utils import format_name, strftime
 
@@ -88,11 +90,21 @@ class Downloader(object):
         self._hls_url = ""
         self._lhls_url = ""
         self._stream_data = []
+        # when the urls above were last fetched, urls younger than _urls_max_age
+        # (e.g. fetched while pre-warming) are used by start() without refetching
+        self._urls_time = 0.0
+        self._urls_max_age = settings.throttle.prewarm.max_age or 0.0
 
         self._process = None
+        # every process started, including ones replaced by a restart, until they exit
+        self._processes = []
+        # GoLiveTimer set by the Watcher when its room goes live, see showroom.latency
+        self.timer = None
         # self._timeouts = 0
         # self._timed_out = False
         self._pingouts = 0
+        # ffmpeg processes started, every one after the first is a restart
+        self._starts = 0
 
         self._lock = threading.Lock()
 
@@ -132,8 +144,27 @@ class Downloader(object):
                     "active": self.is_running(),
                     "timeouts": 0,
                     "pingouts": self._pingouts,
+                    "restarts": max(self._starts - 1, 0),
                     "completed_files": self.all_files.copy()}
 
+    @property
+    def current_process(self):
+        return self._process
+
+    @property
+    def output_path(self):
+        """Path of the file currently being written, or None."""
+        with self._lock:
+            if not self.outfile:
+                return None
+            return os.path.join(self.tempdir, self.outfile)
+
+    def processes(self):
+        """Returns every ffmpeg process this Downloader started that is still running."""
+        with self._lock:
+            self._processes = [p for p in self._processes if p.poll() is None]
+            return list(self._processes)
+
     def is_running(self):
         """Checks if the child process is running."""
         if self._process:
@@ -184,6 +215,8 @@ class Downloader(object):
                 # TODO: add mpegts or other variants depending on the container settings? or no?
                 # if "Output #0, mp4" in line:
                 if "Output #0" in line:
+                    if self.timer is not None:
+                        self.timer.mark("output")
                     self._process.communicate()
                     self.move_to_dest()
                     self._pingouts = 0
@@ -247,6 +280,61 @@ class Downloader(object):
         # Is it possible for the process to end prematurely?
         return self._process.returncode
 
+    async def wait_async(self):
+        """
+        Coroutine version of wait(), for use on an AsyncWatcherEngine.
+
+        Reads ffmpeg's stderr from the event loop instead of blocking a thread.
+        Falls back to running wait() in the loop's executor where pipes can't be
+        attached to the loop (e.g. the selector loop on Windows).
+
+        Returns:
+            returncode of the child process, as wait()
+        """
+        if self._process.stderr.closed:
+            # already read to the end by a previous wait
+            return self._process.poll()
+
+        loop = asyncio.get_event_loop()
+        reader = asyncio.StreamReader()
+        try:
+            transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader),
+                                                        self._process.stderr)
+        except (NotImplementedError, ValueError, OSError):
+            return await loop.run_in_executor(None, self.wait)
+
+        num_pings = 0
+        # see wait() for the reasoning behind all of this
+        max_pings = 1 + self._pingouts
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode('utf8', errors='replace')
+                if "Output #0" in line:
+                    if self.timer is not None:
+                        self.timer.mark("output")
+                    # drain the rest of stderr, then wait for ffmpeg to exit
+                    while await reader.readline():
+                        pass
+                    while self._process.poll() is None:
+                        await asyncio.sleep(0.2)
+                    self.move_to_dest()
+                    self._pingouts = 0
+                    break
+                elif "HandleCtrl, Ping" in line:
+                    num_pings += 1
+                if num_pings > max_pings:
+                    download_logger.debug("Download pinged {} times: Stopping".format(num_pings))
+                    self._pingouts += 1
+                    self.stop()
+                    break
+        finally:
+            transport.close()
+
+        return self._process.returncode
+
     def stop(self):
         """Stop an active download.
 
@@ -292,14 +380,23 @@ class Downloader(object):
             else:
                 return destpath
 
+    def has_fresh_urls(self):
+        """Returns whether the streaming urls were fetched recently enough to use as is."""
+        return clock.time() - self._urls_time <= self._urls_max_age
+
     def update_streaming_url(self):
+        """Fetches the room's streaming urls.
+
+        Returns:
+            True if any urls were found, i.e. the room is live, else False
+        """
         data = self._client.streaming_url(self._room.room_id)
         self._stream_data = data
         download_logger.debug('{}'.format(self._stream_data))
 
         # TODO: it shouldn't still attempt to start up without a fresh url
         if not data:
-            return
+            return False
 
         rtmp_streams = []
         hls_streams = []
@@ -336,6 +433,8 @@ class Downloader(object):
             self._rtmp_url = new_rtmp_url
             self._hls_url = new_hls_url
             self._lhls_url = new_lhls_url
+            self._urls_time = clock.time()
+        return True
 
     # def update_streaming_url_web(self):
     #     """Updates streaming urls from the showroom website.
@@ -397,8 +496,8 @@ class Downloader(object):
         """
         Starts the download.
 
-        Refreshes the streaming url, generates a new file name, and starts a new ffmpeg
-        process.
+        Refreshes the streaming url (unless it was pre-warmed moments ago), generates a
+        new file name, and starts a new ffmpeg process.
 
         Returns:
             datetime object representing the time the download started
@@ -412,7 +511,12 @@ class Downloader(object):
         for key in ('http_proxy', 'https_proxy', 'HTTP_PROXY', 'HTTPS_PROXY'):
             env.pop(key, None)
 
-        self.update_streaming_url()
+        if not self.has_fresh_urls():
+            self.update_streaming_url()
+        if self.timer is not None:
+            self.timer.mark("urls", self._urls_time)
+        # each fetch is only good for one start, a restart always refetches
+        self._urls_time = 0.0
 
         # TODO: rework this whole process to include lhls, and make it configurable
         # and less braindead
@@ -476,4 +580,9 @@ class Downloader(object):
             stderr=subprocess.PIPE,  # ffmpeg sends all output to stderr
             universal_newlines=True,
             bufsize=1,
-            env=env)
\ No newline at end of file
+            env=env)
+        self._starts += 1
+        with self._lock:
+            self._processes.append(self._process)
+        if self.timer is not None:
+            self.timer.mark("popen")
\ No newline at end of file
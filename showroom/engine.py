@@ -0,0 +1,113 @@
+# Alternative Watcher engine: one event loop instead of one thread per Watcher
+import asyncio
+import concurrent.futures
+import logging
+import threading
+
+engine_logger = logging.getLogger('showroom.engine')
+
+
+class WatcherTask(object):
+    """Thread-like handle for a Watcher coroutine running on an AsyncWatcherEngine.
+
+    Exposes the parts of the threading.Thread interface that WatchManager uses,
+    so threads and tasks can be tracked side by side.
+    """
+    def __init__(self, future: concurrent.futures.Future, name: str):
+        self._future = future
+        self.name = name
+
+    def is_alive(self):
+        return not self._future.done()
+
+    def join(self, timeout=None):
+        try:
+            self._future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            pass
+        except Exception:
+            # already logged by the engine
+            pass
+
+
+class AsyncWatcherEngine(object):
+    """Runs Watcher coroutines on a single event loop in a dedicated thread.
+
+    Scheduled rooms cost a pending timer on the loop rather than a thread, so
+    thread count and idle CPU stay flat as the number of rooms grows.
+    Blocking calls (the requests based ShowroomClient, starting ffmpeg) are handed
+    to a small, bounded executor; ffmpeg output is read from the loop itself.
+
+    Started lazily by the first call to submit().
+
+    Args:
+        max_workers: size of the executor for blocking calls
+        loop_factory: optional callable returning the event loop to run, e.g. a
+            replay.VirtualTimeLoop, defaults to asyncio.new_event_loop
+    """
+    def __init__(self, max_workers=64, loop_factory=None):
+        self._max_workers = max_workers
+        self._loop_factory = loop_factory or asyncio.new_event_loop
+        self._loop = None
+        self._executor = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        return self._loop
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.is_running():
+                return
+            self._loop = self._loop_factory()
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._max_workers,
+                                                                   thread_name_prefix='WatcherEngine-IO')
+            self._loop.set_default_executor(self._executor)
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(ready,), name="WatcherEngine")
+            self._thread.daemon = True
+            self._thread.start()
+            ready.wait()
+
+    def _run(self, ready):
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_soon(ready.set)
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    def submit(self, coro, name=None):
+        """Schedules a coroutine on the engine's loop.
+
+        Args:
+            coro: coroutine object, e.g. Watcher.arun()
+            name: name for the returned handle, used in logging
+
+        Returns:
+            A WatcherTask wrapping the coroutine
+        """
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+        def log_exception(fut):
+            if not fut.cancelled() and fut.exception() is not None:
+                engine_logger.error('{} failed: {}'.format(name, fut.exception()),
+                                    exc_info=fut.exception())
+
+        future.add_done_callback(log_exception)
+        return WatcherTask(future, name)
+
+    def stop(self, timeout=None):
+        with self._lock:
+            if not self.is_running():
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=timeout)
+            self._executor.shutdown(wait=False)
+            self._thread = None
@@ -7,6 +7,7 @@ import logging
 import datetime
 import time
 import re
+from . import codec
 from .constants import TOKYO_TZ
 
 __all__ = ['ShowroomIndex']
@@ -89,6 +90,16 @@ class Room(object):
     def __bool__(self):
         return bool(self._room_info)
 
+    # Rooms are sent to other processes in sharded mode, locks can't be pickled
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = RLock()
+
     def set_priority(self, new_priority, mod_time):
         with self._lock:
             self._mod_time = mod_time
@@ -346,7 +357,7 @@ class ShowroomIndex(object):
             # open the jdex
             try:
                 with open(jdex, encoding='utf8') as infp:
-                    temp_data = json.load(infp)
+                    temp_data = codec.load(infp)
             except json.JSONDecodeError as e:
                 index_logger.warning('{} could not be read: {}'.format(jdex, e))
                 continue
@@ -402,7 +413,7 @@ class ShowroomIndex(object):
             mod_time = self.known_files[jdex]['mod_time']
             try:
                 with open(jdex, encoding='utf8') as infp:
-                    temp_data = json.load(infp)
+                    temp_data = codec.load(infp)
             except json.JSONDecodeError:
                 index_logger.warning('{} could not be read'.format(jdex))
                 continue
@@ -445,7 +456,7 @@ class ShowroomIndex(object):
         if not update_url:
             update_url = "https://wlerin.github.io/showroom-index/list.json"
 
-        update_data = self.session.get(update_url).json()
+        update_data = codec.loads(self.session.get(update_url).content)
         # TODO: Catch the error this raises when decoding fails
 
         # TODO: finish this method
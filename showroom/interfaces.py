@@ -3,16 +3,16 @@ import logging
 import os
 import sys
 import threading
-import time
 from argparse import ArgumentParser
 from io import UnsupportedOperation
-from queue import Queue, Empty as QueueEmpty
+from queue import Queue
 
 # This seems like a waste of an import
 from .constants import TOKYO_TZ, HHMM_FMT
 from .control import ShowroomLiveControllerThread as ShowroomController
 from .exceptions import ShowroomStopRequest
 from .index import ShowroomIndex
+from .message import ShowroomMessage
 from .settings import ShowroomSettings, DEFAULTS
 
 # build settings and index objects from arguments
@@ -174,7 +174,10 @@ class BasicCLI(object):
         cli_logger.debug('Index has {} rooms'.format(len(self.index)))
 
         self.control_thread = ShowroomController(self.index, self.settings)
+        # holds both lines typed by the user and messages from the controller,
+        # so run() only has to wait on one queue
         self.input_queue = InputQueue()
+        self._message_thread = None
 
         if args.record_all:
             self.control_thread.index.filter_all()
@@ -195,13 +198,22 @@ class BasicCLI(object):
         print('Starting up Showroom Watcher...')
         self.input_queue.start()
         self.control_thread.start()
+        if not self._message_thread or not self._message_thread.is_alive():
+            self._message_thread = threading.Thread(target=self.forward_messages, name="MessageForwarder")
+            self._message_thread.daemon = True
+            self._message_thread.start()
         # Is this the best place to put this message?
 
     def run(self):
         """Do stuff."""
         while True:
+            # wakes on either a line of input or a message from the controller
+            item = self.input_queue.get()
+            if isinstance(item, ShowroomMessage):
+                self.parse_message(item)
+                continue
             try:
-                self.read_commands()
+                self.parse_command(item)
             except ShowroomStopRequest:
                 print("Exiting...")
                 return
@@ -213,18 +225,12 @@ class BasicCLI(object):
             #     print(curr_time.strftime("\n\n%H:%M"))
             #     self.control_thread.send_command('schedule')
 
-            time.sleep(0.2)
-
-            self.get_messages()
-
-    def read_commands(self):
-        while not self.input_queue.empty():
-            try:
-                line = self.input_queue.get(block=False)
-            except QueueEmpty:
-                break
-            else:
-                self.parse_command(line)
+    def forward_messages(self):
+        """Moves messages from the controller onto the input queue as they arrive."""
+        while True:
+            msg = self.control_thread.message_queue.get()
+            if msg:
+                self.input_queue.put(msg)
 
     # TODO: CommandHandler class?
     def parse_command(self, line):
@@ -336,11 +342,6 @@ The following commands are recognised:
             ct.join()
             raise ShowroomStopRequest
 
-    def get_messages(self):
-        messages = self.control_thread.get_messages()
-        for msg in messages:
-            self.parse_message(msg)
-
     def parse_message(self, msg):
         query = msg.query
         message = msg.content
@@ -367,9 +368,10 @@ class InputQueue(Queue):
             except ValueError:
                 # tried to read from a closed STDIN
                 return
-            if line:
-                self.put(line)
-            time.sleep(0.1)
+            if not line:
+                # EOF, there will never be more input
+                return
+            self.put(line)
 
     def start(self):
         # make an alias of stdin so that we can close it later
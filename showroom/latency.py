@@ -0,0 +1,169 @@
+# Go-live latency instrumentation
+import bisect
+import logging
+import threading
+
+from . import clock
+
+latency_logger = logging.getLogger('showroom.latency')
+
+# the order a live goes through on its way to being recorded
+MARKS = ("started", "detected", "admitted", "urls", "popen", "output")
+
+# stage -> (from mark, to mark)
+STAGES = (("detect", ("started", "detected")),
+          ("admit", ("detected", "admitted")),
+          ("urls", ("admitted", "urls")),
+          ("spawn", ("urls", "popen")),
+          ("output", ("popen", "output")),
+          ("total", ("started", "output")))
+
+# upper bounds in seconds, the last bucket catches everything above
+BUCKETS = (0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 15.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class GoLiveTimer(object):
+    """Timestamps of one live's path from going live to ffmpeg writing output.
+
+    Marks, all POSIX times:
+        started: the live's started_at according to onlives, if known
+        detected: first positive live check (or pre-warm)
+        admitted: download slot granted
+        urls: streaming urls fetched, possibly while pre-warming
+        popen: ffmpeg process spawned
+        output: first "Output #0" line from ffmpeg
+
+    The Watcher creates a timer when it sees the room go live, its Downloader
+    marks the rest, and marking "output" completes the timer and calls
+    on_complete(timer). Marks made after that are ignored, so restarts of the
+    same live don't count again.
+    """
+    def __init__(self, priority=None, started_at=None, on_complete=None):
+        self.priority = priority
+        self.marks = dict.fromkeys(MARKS)
+        self.marks["started"] = started_at
+        self._on_complete = on_complete
+        self._done = False
+
+    @property
+    def done(self):
+        return self._done
+
+    def mark(self, name, when=None):
+        if self._done:
+            return
+        self.marks[name] = when or clock.time()
+        if name == "output":
+            self._done = True
+            if self._on_complete is not None:
+                self._on_complete(self)
+
+    def set_started_at(self, started_at):
+        if self.marks["started"] is None:
+            self.marks["started"] = started_at
+
+    def durations(self):
+        """Returns seconds spent in each stage, None where a mark is missing.
+
+        Stages that overlap (e.g. urls fetched while pre-warming, before detection)
+        count as 0 rather than negative.
+        """
+        result = {}
+        for stage, (start, end) in STAGES:
+            if self.marks[start] is None or self.marks[end] is None:
+                result[stage] = None
+            else:
+                result[stage] = max(self.marks[end] - self.marks[start], 0.0)
+        return result
+
+    def get_info(self):
+        return {"marks": dict(self.marks), "durations": self.durations()}
+
+
+def percentile(values, q):
+    """Returns the q-th percentile (0-100) of sorted values, None if empty."""
+    if not values:
+        return None
+    return values[min(int(q / 100.0 * len(values)), len(values) - 1)]
+
+
+class LatencyHistogram(object):
+    """Cumulative histogram of durations, in the style of Prometheus histograms."""
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def get_info(self):
+        """Returns the histogram as a dict, with buckets as [[upper bound, cumulative count], ...]."""
+        cumulative, buckets = 0, []
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            buckets.append([bound, cumulative])
+        return {"buckets": buckets, "count": self.count, "sum": self.sum,
+                "min": self.min, "max": self.max}
+
+
+class LatencyStats(object):
+    """Aggregates completed GoLiveTimers into per-stage histograms by room priority.
+
+    Lives that were already underway when stats began (e.g. when showroom was
+    started mid-live) are left out of the detect and total stages, which would
+    otherwise measure the downtime rather than the detection latency.
+    """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.since = clock.time()
+        self._lock = threading.Lock()
+        # priority -> stage -> LatencyHistogram
+        self._histograms = {}
+
+    def record(self, timer):
+        durations = timer.durations()
+        started = timer.marks["started"]
+        if started is not None and started < self.since:
+            durations["detect"] = durations["total"] = None
+        with self._lock:
+            by_stage = self._histograms.setdefault(timer.priority, {})
+            for stage, seconds in durations.items():
+                if seconds is not None:
+                    by_stage.setdefault(stage, LatencyHistogram(self.buckets)).observe(seconds)
+        latency_logger.debug('Go-live latency for priority {}: {}'.format(
+            timer.priority, ', '.join('{} {:.2f}s'.format(k, v) for k, v in durations.items() if v is not None)))
+
+    def get_info(self):
+        """Returns {priority: {stage: histogram info}}, priorities as strings so it survives json."""
+        with self._lock:
+            return {str(priority): {stage: hist.get_info() for stage, hist in by_stage.items()}
+                    for priority, by_stage in self._histograms.items()}
+
+
+def merge_info(infos):
+    """Merges several LatencyStats.get_info() results, e.g. from different shards."""
+    merged = {}
+    for info in infos:
+        for priority, by_stage in info.items():
+            for stage, hist in by_stage.items():
+                total = merged.setdefault(priority, {}).get(stage)
+                if total is None:
+                    merged[priority][stage] = {"buckets": [list(e) for e in hist["buckets"]],
+                                               "count": hist["count"], "sum": hist["sum"],
+                                               "min": hist["min"], "max": hist["max"]}
+                    continue
+                for entry, other in zip(total["buckets"], hist["buckets"]):
+                    entry[1] += other[1]
+                total["count"] += hist["count"]
+                total["sum"] += hist["sum"]
+                total["min"] = min(e for e in (total["min"], hist["min"]) if e is not None)
+                total["max"] = max(e for e in (total["max"], hist["max"]) if e is not None)
+    return merged
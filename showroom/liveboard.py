@@ -0,0 +1,80 @@
+# Bulk live detection from /api/live/onlives
+import logging
+import threading
+
+from . import clock
+
+board_logger = logging.getLogger('showroom.liveboard')
+
+
+class LiveBoard(object):
+    """Latest onlives snapshot, used to resolve live status for every Watcher at once.
+
+    WatchManager feeds it each onlives response it fetches, and Watchers consult it
+    instead of calling /room/is_live themselves. A room is resolved as live if it
+    appears in any genre list of the snapshot, and as not live otherwise.
+
+    lookup() returns None when the snapshot can't be trusted to answer, in which case
+    the caller should fall back to checking the room directly:
+        - no snapshot has been taken yet
+        - the snapshot is older than max_age seconds
+        - the snapshot was taken before the caller's since time, e.g. when asking
+          whether a room is still live right after its download ended
+
+    NOTE: onlives takes about 30 seconds to drop a room after its live ends, so
+    "still live" answers lag behind is_live by about that much.
+    """
+    def __init__(self, max_age=15.0):
+        self.max_age = max_age
+        self._lives = {}
+        self._time = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._lives)
+
+    def __contains__(self, room_id):
+        return str(room_id) in self._lives
+
+    @property
+    def snapshot_time(self):
+        return self._time
+
+    def update(self, onlives, snapshot_time=None):
+        """Replaces the snapshot with a new onlives response.
+
+        Args:
+            onlives: the list returned by ShowroomClient.onlives(), i.e. one entry
+                per genre, each with a list of lives
+            snapshot_time: POSIX time the response was fetched, defaults to now
+        """
+        lives = {}
+        for livelist in onlives:
+            for item in livelist.get('lives', []):
+                # entries without a room_id are page formatting, e.g. headers
+                if 'room_id' in item:
+                    lives[str(item['room_id'])] = item
+        with self._lock:
+            self._lives = lives
+            self._time = snapshot_time or clock.time()
+
+    def get(self, room_id):
+        """Returns the onlives entry for a room, or None if it isn't in the snapshot."""
+        return self._lives.get(str(room_id))
+
+    def lookup(self, room_id, since=None):
+        """Resolves whether a room is live from the snapshot.
+
+        Args:
+            room_id: room to look up
+            since: optional POSIX time the snapshot must be newer than
+
+        Returns:
+            True or False if the snapshot can answer, else None
+        """
+        with self._lock:
+            if not self._time or clock.time() - self._time > self.max_age:
+                return None
+            if since is not None and self._time < since:
+                return None
+            return str(room_id) in self._lives
@@ -0,0 +1,255 @@
+# Runtime metrics, served in the Prometheus text format
+import logging
+import socketserver
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from .latency import LatencyHistogram
+
+metrics_logger = logging.getLogger('showroom.metrics')
+
+# for request latencies, rather than go-live latencies
+HTTP_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, _escape(v)) for k, v in sorted(labels.items())) + '}'
+
+
+def _format_value(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, float) and value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def histogram_samples(info, labels=None):
+    """Turns a LatencyHistogram.get_info() dict into (suffix, labels, value) samples."""
+    labels = labels or {}
+    samples = []
+    for bound, count in info["buckets"]:
+        le = bound if isinstance(bound, str) else _format_value(float(bound))
+        samples.append(("_bucket", dict(labels, le=le), count))
+    samples.append(("_sum", labels, info["sum"]))
+    samples.append(("_count", labels, info["count"]))
+    return samples
+
+
+def merge_families(families):
+    """Merges families with the same name, adding up samples with the same suffix and labels.
+
+    e.g. the same counter as counted by several processes, see ShardedWatchManager.
+    """
+    merged = OrderedDict()
+    for name, kind, documentation, samples in families:
+        if name not in merged:
+            merged[name] = (kind, documentation, OrderedDict())
+        values = merged[name][2]
+        for suffix, labels, value in samples:
+            key = (suffix, tuple(sorted(labels.items())))
+            if values.get(key) is None:
+                values[key] = value
+            elif value is not None:
+                values[key] += value
+    return [(name, kind, documentation, [(suffix, dict(labels), value) for (suffix, labels), value in values.items()])
+            for name, (kind, documentation, values) in merged.items()]
+
+
+class _Metric(object):
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [("", dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=HTTP_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = LatencyHistogram(self.buckets)
+            self._values[key].observe(value)
+
+    def samples(self):
+        with self._lock:
+            infos = [(dict(zip(self.labelnames, key)), hist.get_info()) for key, hist in self._values.items()]
+        return [sample for labels, info in infos for sample in histogram_samples(info, labels)]
+
+
+class MetricsRegistry(object):
+    """Holds metrics, and renders them in the Prometheus text exposition format.
+
+    Metrics updated as things happen (e.g. HTTP requests) are created once with
+    counter(), gauge(), or histogram(). State that is easier to read when scraped
+    (e.g. Watchers by mode) is supplied by collectors, callables returning a list
+    of (name, kind, documentation, samples) families, where samples is a list of
+    (suffix, labels, value). Families of the same name are merged, their
+    samples added up, see merge_families().
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=HTTP_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def add_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def remove_collector(self, collector):
+        with self._lock:
+            try:
+                self._collectors.remove(collector)
+            except ValueError:
+                pass
+
+    def reset(self):
+        """Forgets the values of every metric created here, e.g. in a forked process counting for itself."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            with metric._lock:
+                metric._values = {}
+
+    def snapshot(self):
+        """Returns the metrics created here, without the collectors', as families that can be pickled."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return [(m.name, m.kind, m.documentation, m.samples()) for m in metrics]
+
+    def collect(self):
+        """Returns every family as (name, kind, documentation, samples)."""
+        with self._lock:
+            collectors = list(self._collectors)
+        families = self.snapshot()
+        for collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                metrics_logger.warn('Metrics collector {} failed: {}'.format(collector, e))
+        return merge_families(families)
+
+    def render(self):
+        lines = []
+        for name, kind, documentation, samples in self.collect():
+            lines.append('# HELP {} {}'.format(name, documentation.replace('\n', ' ')))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for suffix, labels, value in samples:
+                lines.append('{}{}{} {}'.format(name, suffix, _format_labels(labels), _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+# the process-wide registry everything reports to
+REGISTRY = MetricsRegistry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        metrics_logger.debug('{} - {}'.format(self.address_string(), format % args))
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MetricsServer(object):
+    """Serves a registry at http://host:port/metrics from a background thread."""
+    def __init__(self, registry=REGISTRY, host='127.0.0.1', port=9477):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    @classmethod
+    def from_settings(cls, settings, registry=REGISTRY):
+        """Builds a MetricsServer from the metrics settings, or returns None if disabled."""
+        metrics = settings.metrics
+        if not metrics or not metrics.enabled:
+            return None
+        return cls(registry, host=metrics.host or '127.0.0.1', port=metrics.port)
+
+    @property
+    def address(self):
+        return self._server.server_address if self._server else None
+
+    def start(self):
+        self._server = _ThreadingHTTPServer((self.host, self.port), _MetricsHandler)
+        self._server.registry = self.registry
+        self._thread = threading.Thread(target=self._server.serve_forever, name="MetricsServer")
+        self._thread.daemon = True
+        self._thread.start()
+        metrics_logger.info('Serving metrics on http://{}:{}/metrics'.format(*self.address[:2]))
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
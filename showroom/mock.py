@@ -0,0 +1,709 @@
+"""A local stand-in for www.showroom-live.com, for testing and load testing offline.
+
+MockShowroomServer answers the endpoints the watcher depends on from fixture
+data, with configurable latency and injected 429s, 5xx and timeouts, and runs
+a fake bcsvr (comment websocket) that live_info points CommentLogger at.
+Point a client at it with ShowroomClient(base_url=server.url).
+
+Fixtures are a directory of JSON files holding raw API responses:
+    onlives.json        /api/live/onlives
+    upcoming.json       {genre_id: /api/live/upcoming}
+    time_tables.json    /api/time_table/time_tables
+    rooms.json          {room_id: {"is_live": ..., "live_info": ..., "streaming_url": ...,
+                                   "comment_log": ...}}
+made up by synthesize_fixtures(), or recorded from the real site with record_fixtures().
+
+Run the server, or a load benchmark of ShowroomClient against it, with:
+    python -m showroom.mock serve --port 8080 --latency 0.05 --error-rate 0.01
+    python -m showroom.mock bench --threads 32 --seconds 30 --throttle-rate 0.01
+    python -m showroom.mock fixtures path/to/fixtures [--record]
+"""
+import argparse
+import base64
+import hashlib
+import logging
+import os
+import random
+import socketserver
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+from . import codec
+from .latency import percentile
+
+mock_logger = logging.getLogger('showroom.mock')
+
+# path -> name, names being both the fixture and the ShowroomClient method
+ENDPOINTS = {
+    "/api/live/onlives": "onlives",
+    "/api/live/upcoming": "upcoming",
+    "/api/time_table/time_tables": "time_tables",
+    "/room/is_live": "is_live",
+    "/api/live/live_info": "live_info",
+    "/api/live/streaming_url": "streaming_url",
+    "/api/live/comment_log": "comment_log",
+}
+
+ROOM_ENDPOINTS = ("is_live", "live_info", "streaming_url", "comment_log")
+
+FIXTURE_FILES = ("onlives", "upcoming", "time_tables", "rooms")
+
+# time_tables entries returned per page
+TIME_TABLE_PAGE = 20
+
+GENRES = (101, 102, 103, 200)
+
+
+def synthesize_fixtures(rooms=200, live=40, comments=50, seed=0, now=None):
+    """Returns made up fixtures shaped like the real API's responses.
+
+    Args:
+        rooms: number of rooms, with ids from 100001 up
+        live: how many of them are live
+        comments: comments in each live room's comment log
+        seed: for the random names, genres and times
+        now: POSIX time lives started before and schedules start after, the current time if None
+    """
+    rng = random.Random(seed)
+    now = int(now or time.time())
+    words = ['かわいい', '初見です', 'こんばんは', '888888', 'おつかれさま', 'ｗｗｗ', 'Hello!', '推し']
+    onlives = {}
+    upcoming = {}
+    time_tables = []
+    room_fixtures = {}
+    for i in range(rooms):
+        room_id = 100001 + i
+        genre_id = rng.choice(GENRES)
+        room = {"room_id": room_id, "main_name": 'Room {}'.format(room_id),
+                "room_url_key": 'room_{}'.format(room_id), "genre_id": genre_id}
+        if i < live:
+            live_id = 9000000 + i
+            started_at = now - rng.randrange(60, 3600)
+            onlives.setdefault(genre_id, []).append(dict(room, live_id=live_id, started_at=started_at,
+                                                         view_num=rng.randrange(100, 20000)))
+            streams = [{"id": 1, "label": "original quality", "type": "rtmp", "is_default": True,
+                        "url": 'rtmp://127.0.0.1/liveedge', "stream_name": 'stream_{}'.format(room_id)},
+                       {"id": 2, "label": "original quality", "type": "hls", "is_default": True,
+                        "url": 'http://127.0.0.1/liveedge/stream_{}/playlist.m3u8'.format(room_id)}]
+            log = [{"av": rng.randrange(1, 1000000), "ac": 'user{}'.format(rng.randrange(10000)),
+                    "cm": rng.choice(words), "u": rng.randrange(1000000, 9999999),
+                    "created_at": started_at + j} for j in range(comments)]
+            room_fixtures[str(room_id)] = {
+                "is_live": {"ok": 1},
+                "live_info": {"room_id": room_id, "live_id": live_id, "live_status": 2,
+                              "room_name": room["main_name"], "bcsvr_key": '{:x}:{}'.format(live_id, room_id),
+                              "bcsvr_host": 'online.showroom-live.com', "bcsvr_port": 8080},
+                "streaming_url": {"streaming_url_list": streams},
+                "comment_log": {"comment_log": log},
+            }
+        else:
+            start = now + rng.randrange(600, 7 * 86400)
+            upcoming.setdefault(genre_id, []).append(dict(room, next_live_start_at=start))
+            time_tables.append(dict(room, started_at=start, live_id=0, is_pickup=False))
+            room_fixtures[str(room_id)] = {
+                "is_live": {"ok": 0},
+                "live_info": {"room_id": room_id, "live_id": 0, "live_status": 1,
+                              "room_name": room["main_name"], "bcsvr_key": '', "bcsvr_host": '',
+                              "bcsvr_port": 0},
+                "streaming_url": {},
+                "comment_log": {"comment_log": []},
+            }
+    return {
+        "onlives": {"onlives": [{"genre_id": genre_id, "lives": lives} for genre_id, lives in onlives.items()]},
+        "upcoming": {str(genre_id): {"upcomings": upcomings} for genre_id, upcomings in upcoming.items()},
+        "time_tables": {"time_tables": sorted(time_tables, key=lambda e: e["started_at"])},
+        "rooms": room_fixtures,
+    }
+
+
+def record_fixtures(client, room_ids=None, genres=GENRES):
+    """Returns fixtures recorded from the real site, through a ShowroomClient.
+
+    Args:
+        client: ShowroomClient pointed at the real site
+        room_ids: rooms to record the per room endpoints of, by default every room now live
+        genres: genre ids to record upcoming for
+    """
+    onlives = client._api_get("/api/live/onlives")
+    if room_ids is None:
+        room_ids = [live["room_id"] for genre in onlives.get("onlives", []) for live in genre.get("lives", [])]
+    rooms = {}
+    for room_id in room_ids:
+        rooms[str(room_id)] = {name: client._api_get(path, params={"room_id": room_id}, raise_error=False,
+                                                     default={})
+                               for path, name in ENDPOINTS.items() if name in ROOM_ENDPOINTS}
+    return {
+        "onlives": onlives,
+        "upcoming": {str(genre_id): client._api_get("/api/live/upcoming", params={"genre_id": genre_id})
+                     for genre_id in genres},
+        "time_tables": client._api_get("/api/time_table/time_tables", params={"started_at": int(time.time())}),
+        "rooms": rooms,
+    }
+
+
+def load_fixtures(directory):
+    fixtures = {}
+    for name in FIXTURE_FILES:
+        try:
+            with open(os.path.join(directory, name + '.json'), encoding='utf8') as infp:
+                fixtures[name] = codec.load(infp)
+        except FileNotFoundError:
+            mock_logger.warning('No {}.json in {}, serving empty responses'.format(name, directory))
+            fixtures[name] = {}
+    return fixtures
+
+
+def write_fixtures(fixtures, directory):
+    os.makedirs(directory, exist_ok=True)
+    for name in FIXTURE_FILES:
+        with open(os.path.join(directory, name + '.json'), 'w', encoding='utf8') as outfp:
+            codec.dump(fixtures.get(name, {}), outfp)
+
+
+class Faults(object):
+    """What the mock server does to requests besides answering them.
+
+    Each request draws at most one fault: a 429, else a 5xx, else a timeout.
+
+    Args:
+        latency: seconds every response is delayed by
+        jitter: up to this many seconds more, at random
+        error_rate: fraction of requests answered with one of error_codes
+        error_codes: status codes to pick errors from
+        throttle_rate: fraction of requests answered 429, with a Retry-After of retry_after
+        retry_after: seconds, None to leave the header out
+        timeout_rate: fraction of requests never answered, their connection held for hang seconds
+        hang: seconds
+        seed: for the random draws, None for a random seed
+    """
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_codes=(500, 502, 503),
+                 throttle_rate=0.0, retry_after=1, timeout_rate=0.0, hang=30.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """Returns (delay, fault) for a request, fault being a status code, "timeout", or None."""
+        with self._lock:
+            delay = self.latency + (self._rng.random() * self.jitter if self.jitter else 0.0)
+            roll = self._rng.random()
+            if roll < self.throttle_rate:
+                return delay, 429
+            roll -= self.throttle_rate
+            if roll < self.error_rate:
+                return delay, self._rng.choice(self.error_codes)
+            roll -= self.error_rate
+            if roll < self.timeout_rate:
+                return delay, "timeout"
+            return delay, None
+
+    def get_info(self):
+        return {"latency": self.latency, "jitter": self.jitter, "error_rate": self.error_rate,
+                "throttle_rate": self.throttle_rate, "timeout_rate": self.timeout_rate}
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    # keep-alive, as the real site does, so clients reuse their connections
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out in separate writes, which Nagle would hold up for an ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        mock = self.server.mock
+        parts = urlsplit(self.path)
+        name = ENDPOINTS.get(parts.path)
+        delay, fault = mock.faults.draw()
+        if delay:
+            time.sleep(delay)
+        if name is not None and fault is not None:
+            mock.record(name, str(fault))
+            if fault == "timeout":
+                # say nothing, then hang up
+                time.sleep(mock.faults.hang)
+                self.close_connection = True
+                return
+            headers = {}
+            if fault == 429 and mock.faults.retry_after is not None:
+                headers['Retry-After'] = str(mock.faults.retry_after)
+            self._send(fault, {"errors": [{"message": 'injected {}'.format(fault)}]}, headers)
+            return
+        status, body = mock.respond(name, dict(parse_qsl(parts.query)))
+        mock.record(name or parts.path, str(status))
+        self._send(status, body)
+
+    def _send(self, status, body, headers=None):
+        data = codec.dumps(body, compact=True).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        mock_logger.debug('{} - {}'.format(self.address_string(), format % args))
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+_WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+def _ws_frame(text, opcode=0x1):
+    """Returns a final, unmasked websocket frame, as servers send them."""
+    payload = text.encode('utf8')
+    header = bytearray([0x80 | opcode])
+    if len(payload) < 126:
+        header.append(len(payload))
+    elif len(payload) < 65536:
+        header.append(126)
+        header += struct.pack('!H', len(payload))
+    else:
+        header.append(127)
+        header += struct.pack('!Q', len(payload))
+    return bytes(header) + payload
+
+
+def _ws_read_frame(rfile):
+    """Returns (opcode, payload) of the next frame from a client, or (None, None) at EOF."""
+    head = rfile.read(2)
+    if len(head) < 2:
+        return None, None
+    opcode, length = head[0] & 0x0f, head[1] & 0x7f
+    if length == 126:
+        length = struct.unpack('!H', rfile.read(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', rfile.read(8))[0]
+    mask = rfile.read(4) if head[1] & 0x80 else None
+    payload = rfile.read(length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+
+class _BroadcastHandler(socketserver.StreamRequestHandler):
+    """Speaks enough of bcsvr for CommentLogger: SUB, then MSG frames until the live ends."""
+    def handle(self):
+        key = None
+        for line in iter(self.rfile.readline, b''):
+            line = line.decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'sec-websocket-key':
+                key = value.strip()
+        if key is None:
+            return
+        accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode('ascii')).digest()).decode('ascii')
+        self.wfile.write('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                         'Sec-WebSocket-Accept: {}\r\n\r\n'.format(accept).encode('ascii'))
+
+        subscribed = threading.Event()
+        closed = threading.Event()
+        keys = []
+
+        def read():
+            try:
+                while not closed.is_set():
+                    opcode, payload = _ws_read_frame(self.rfile)
+                    if opcode is None or opcode == 0x8:
+                        break
+                    text = payload.decode('utf8', 'replace')
+                    if opcode == 0x1 and text.startswith('SUB\t'):
+                        keys.append(text.split('\t', 1)[1])
+                        subscribed.set()
+            except (OSError, ValueError):
+                # the handler hung up first
+                pass
+            closed.set()
+            subscribed.set()
+
+        reader = threading.Thread(target=read, name="MockBroadcastReader")
+        reader.daemon = True
+        reader.start()
+
+        mock = self.server.mock
+        subscribed.wait(mock.hang_up_after)
+        if not keys:
+            return
+        bcsvr_key = keys[0]
+        comments = mock.comments_for(bcsvr_key) or [{"ac": 'user', "cm": 'hello', "u": 1, "av": 1}]
+        ends = time.time() + mock.live_seconds
+        try:
+            for i in range(int(mock.live_seconds * mock.comment_rate)):
+                if closed.wait(1.0 / mock.comment_rate) or time.time() >= ends:
+                    break
+                comment = dict(comments[i % len(comments)], t='1', created_at=int(time.time()))
+                self.wfile.write(_ws_frame('MSG\t{}\t{}'.format(bcsvr_key, codec.dumps(comment, compact=True))))
+                mock.record("bcsvr", "comment")
+            if not closed.is_set():
+                self.wfile.write(_ws_frame('MSG\t{}\t{}'.format(bcsvr_key, codec.dumps(
+                    {"t": 101, "created_at": int(time.time())}, compact=True))))
+                mock.record("bcsvr", "live_ended")
+                self.wfile.write(_ws_frame('', opcode=0x8))
+        except OSError:
+            pass
+        finally:
+            closed.set()
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MockShowroomServer(object):
+    """Serves fixtures as the Showroom API from background threads, with a fake bcsvr alongside.
+
+    live_info responses for live rooms point at the fake bcsvr, which streams
+    each subscriber comment_rate comments a second (taken from the room's
+    comment_log fixture) for live_seconds, then the live ended message.
+
+    e.g.
+        with MockShowroomServer(faults=Faults(latency=0.05, throttle_rate=0.01)) as server:
+            client = ShowroomClient(base_url=server.url)
+            client.is_live(100001)
+
+    Args:
+        fixtures: as returned by load_fixtures(), synthesize_fixtures() if None
+        host: to listen on
+        port: for the API, 0 picks a free one
+        faults: Faults to inject, none if None
+        bcsvr: whether to run the fake bcsvr
+        comment_rate: comments a second the fake bcsvr sends each subscriber
+        live_seconds: seconds before it ends each live
+    """
+    def __init__(self, fixtures=None, host='127.0.0.1', port=0, faults=None, bcsvr=True,
+                 comment_rate=5.0, live_seconds=60.0):
+        self.fixtures = fixtures if fixtures is not None else synthesize_fixtures()
+        self.host = host
+        self.port = port
+        self.faults = faults or Faults()
+        self.bcsvr = bcsvr
+        self.comment_rate = comment_rate
+        self.live_seconds = live_seconds
+        # seconds the fake bcsvr waits for a SUB before dropping a connection
+        self.hang_up_after = 10.0
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._server = None
+        self._bcsvr = None
+        self._threads = []
+        self._comments = {}
+        for room in self.fixtures.get("rooms", {}).values():
+            key = (room.get("live_info") or {}).get("bcsvr_key")
+            if key:
+                self._comments[key] = (room.get("comment_log") or {}).get("comment_log") or []
+
+    @property
+    def address(self):
+        return self._server.server_address if self._server else None
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.address[:2]) if self._server else None
+
+    @property
+    def bcsvr_address(self):
+        return self._bcsvr.server_address if self._bcsvr else None
+
+    def set_faults(self, faults):
+        """Replaces the faults injected from the next request on. Returns the previous ones."""
+        previous, self.faults = self.faults, faults or Faults()
+        return previous
+
+    def record(self, name, outcome):
+        with self._lock:
+            counts = self._counts.setdefault(name, {})
+            counts[outcome] = counts.get(outcome, 0) + 1
+
+    def comments_for(self, bcsvr_key):
+        return self._comments.get(bcsvr_key)
+
+    def respond(self, name, params):
+        """Returns (status, body) answering a request to endpoint name."""
+        fixtures = self.fixtures
+        if name is None:
+            return 404, {"errors": [{"message": "not found"}]}
+        if name == "onlives":
+            return 200, fixtures.get("onlives") or {"onlives": []}
+        if name == "upcoming":
+            return 200, fixtures.get("upcoming", {}).get(params.get("genre_id"), {"upcomings": []})
+        if name == "time_tables":
+            try:
+                started_at = int(params.get("started_at") or 0)
+            except ValueError:
+                started_at = 0
+            entries = [e for e in (fixtures.get("time_tables") or {}).get("time_tables", [])
+                       if e.get("started_at", 0) >= started_at]
+            return 200, {"time_tables": entries[:TIME_TABLE_PAGE]}
+        room = fixtures.get("rooms", {}).get(params.get("room_id"))
+        if room is None:
+            return 404, {"errors": [{"message": "room not found"}]}
+        if name == "is_live":
+            return 200, room.get("is_live") or {"ok": 0}
+        if name == "live_info":
+            info = dict(room.get("live_info") or {})
+            if self._bcsvr is not None and info.get("bcsvr_key"):
+                info["bcsvr_host"], info["bcsvr_port"] = self.bcsvr_address[:2]
+            return 200, info
+        return 200, room.get(name) or {}
+
+    def start(self):
+        self._server = _ThreadingHTTPServer((self.host, self.port), _MockHandler)
+        self._server.mock = self
+        servers = [("MockShowroomServer", self._server)]
+        if self.bcsvr:
+            self._bcsvr = _ThreadingTCPServer((self.host, 0), _BroadcastHandler)
+            self._bcsvr.mock = self
+            servers.append(("MockBroadcastServer", self._bcsvr))
+        for name, server in servers:
+            thread = threading.Thread(target=server.serve_forever, name=name)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        mock_logger.info('Serving mock Showroom API on {}{}'.format(
+            self.url, ', bcsvr on {}:{}'.format(*self.bcsvr_address[:2]) if self._bcsvr else ''))
+
+    def stop(self):
+        for server in (self._server, self._bcsvr):
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+        self._server = self._bcsvr = None
+        self._threads = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def get_info(self):
+        """Returns, per endpoint, how many requests got each status or injected fault."""
+        with self._lock:
+            return {name: dict(counts) for name, counts in self._counts.items()}
+
+
+# relative weights of the endpoints in a benchmark, roughly those of a watcher's steady state
+DEFAULT_MIX = {
+    "is_live": 10,
+    "streaming_url": 3,
+    "live_info": 2,
+    "onlives": 1,
+    "upcoming": 1,
+    "time_tables": 1,
+    "comment_log": 1,
+}
+
+
+def _retry_counts():
+    from .api.session import _http_retries
+    counts = {}
+    for suffix, labels, value in _http_retries.samples():
+        counts[labels["reason"]] = counts.get(labels["reason"], 0) + value
+    return counts
+
+
+def run_benchmark(server, threads=16, seconds=10.0, mix=None, deadline=10.0, cache=False, seed=0):
+    """Hammers a running MockShowroomServer with ShowroomClient calls from threads.
+
+    Every thread shares one client, as the watcher's threads do, and so its
+    connection pool, and whatever limiter and breaker the process has set.
+
+    Args:
+        server: a started MockShowroomServer
+        threads: number of threads making calls
+        seconds: how long to run for
+        mix: {endpoint name: weight}, DEFAULT_MIX if None
+        deadline: seconds each call gets, retries included, see request_deadline
+        cache: whether the client uses a response cache
+        seed: for picking endpoints and rooms
+
+    Returns:
+        {"calls", "seconds", "calls_per_second", "latency_ms": {"p50", "p90", "p99", "max"},
+         "outcomes": {"ok" or exception name: n}, "retries": {reason: n},
+         "endpoints": EndpointStats.get_info() of the run, "server": server.get_info()}
+    """
+    from .api import ShowroomClient
+    from .api.hooks import EndpointStats, add_hook, remove_hook
+    from .api.session import request_deadline
+
+    mix = mix or DEFAULT_MIX
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    room_ids = list(server.fixtures.get("rooms", {})) or ['0']
+    genres = list(server.fixtures.get("upcoming", {})) or [str(GENRES[0])]
+    client = ShowroomClient(cache=True if cache else None, base_url=server.url)
+
+    def call(name, rng):
+        if name in ROOM_ENDPOINTS:
+            return getattr(client, name)(rng.choice(room_ids))
+        elif name == "upcoming":
+            return client.upcoming(rng.choice(genres))
+        elif name == "time_tables":
+            return client.time_tables(started_at=int(time.time()))
+        return getattr(client, name)()
+
+    lock = threading.Lock()
+    latencies = []
+    outcomes = {}
+    retries_before = _retry_counts()
+    ends = time.monotonic() + seconds
+
+    def work(n):
+        rng = random.Random(seed + n)
+        mine = []
+        mine_outcomes = {}
+        while time.monotonic() < ends:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                with request_deadline(deadline):
+                    call(name, rng)
+                outcome = "ok"
+            except Exception as e:
+                outcome = type(e).__name__
+            mine.append(time.perf_counter() - started)
+            mine_outcomes[outcome] = mine_outcomes.get(outcome, 0) + 1
+        with lock:
+            latencies.extend(mine)
+            for outcome, count in mine_outcomes.items():
+                outcomes[outcome] = outcomes.get(outcome, 0) + count
+
+    stats = EndpointStats(window=seconds + deadline)
+    add_hook(stats)
+    started = time.monotonic()
+    workers = [threading.Thread(target=work, args=(n,), name='MockBenchmark-{}'.format(n)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.monotonic() - started
+    remove_hook(stats)
+
+    latencies = sorted(latency * 1e3 for latency in latencies)
+    retries_after = _retry_counts()
+    return {
+        "calls": len(latencies),
+        "seconds": round(elapsed, 3),
+        "calls_per_second": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {"p50": percentile(latencies, 50), "p90": percentile(latencies, 90),
+                       "p99": percentile(latencies, 99), "max": latencies[-1] if latencies else None},
+        "outcomes": outcomes,
+        "retries": {reason: count - retries_before.get(reason, 0) for reason, count in retries_after.items()
+                    if count - retries_before.get(reason, 0)},
+        "endpoints": stats.get_info(),
+        "server": server.get_info(),
+    }
+
+
+def format_benchmark(results):
+    latency = {key: '{:.1f}'.format(value) if value is not None else '-'
+               for key, value in results["latency_ms"].items()}
+    lines = ['{} calls in {:.1f}s, {:.1f} calls/s'.format(results["calls"], results["seconds"],
+                                                          results["calls_per_second"]),
+             'latency (ms)  p50 {p50}  p90 {p90}  p99 {p99}  max {max}'.format(**latency),
+             'outcomes      ' + '  '.join('{} {}'.format(k, v) for k, v in sorted(results["outcomes"].items())),
+             'retries       ' + ('  '.join('{} {}'.format(k, v) for k, v in sorted(results["retries"].items()))
+                                 or 'none'),
+             '{:<28} {:>7} {:>9} {:>9} {:>7} {:>8}'.format('endpoint', 'calls', 'p50 (ms)', 'p99 (ms)',
+                                                           'errors', 'retries')]
+    for name, info in sorted(results["endpoints"].items()):
+        window = info["window"]
+        lines.append('{:<28} {:>7} {:>9} {:>9} {:>6.1%} {:>8}'.format(
+            name, info["requests"], window["latency_ms"]["p50"], window["latency_ms"]["p99"],
+            window["error_rate"], info["retries"]))
+    lines.append('server')
+    for name, counts in sorted(results["server"].items()):
+        lines.append('  {:<14} '.format(name) + '  '.join('{} {}'.format(k, v) for k, v in sorted(counts.items())))
+    return '\n'.join(lines)
+
+
+def _faults_from_args(args):
+    return Faults(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                  throttle_rate=args.throttle_rate, retry_after=args.retry_after,
+                  timeout_rate=args.timeout_rate, hang=args.hang, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock Showroom API server, and a client load benchmark against it.')
+    commands = parser.add_subparsers(dest='command')
+    serve = commands.add_parser('serve', help='run the mock server until interrupted')
+    bench = commands.add_parser('bench', help='run the mock server and load test ShowroomClient against it')
+    fixtures = commands.add_parser('fixtures', help='write fixtures to a directory')
+    fixtures.add_argument('directory')
+    fixtures.add_argument('--record', action='store_true', help='record from the real site instead of making up')
+    fixtures.add_argument('--rooms', type=int, default=200)
+    fixtures.add_argument('--live', type=int, default=40)
+
+    for command in (serve, bench):
+        command.add_argument('--fixtures', help='directory to load fixtures from, made up if not given')
+        command.add_argument('--host', default='127.0.0.1')
+        command.add_argument('--port', type=int, default=0)
+        command.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+        command.add_argument('--jitter', type=float, default=0.0, help='up to this many seconds more')
+        command.add_argument('--error-rate', type=float, default=0.0, help='fraction answered 5xx')
+        command.add_argument('--throttle-rate', type=float, default=0.0, help='fraction answered 429')
+        command.add_argument('--retry-after', type=int, default=1, help='Retry-After sent with each 429')
+        command.add_argument('--timeout-rate', type=float, default=0.0, help='fraction never answered')
+        command.add_argument('--hang', type=float, default=30.0, help='seconds unanswered requests are held')
+        command.add_argument('--comment-rate', type=float, default=5.0, help='comments a second from the bcsvr')
+        command.add_argument('--seed', type=int, default=None)
+    bench.add_argument('--threads', type=int, default=16)
+    bench.add_argument('--seconds', type=float, default=10.0)
+    bench.add_argument('--deadline', type=float, default=10.0, help='seconds each call gets, retries included')
+    bench.add_argument('--cache', action='store_true', help='give the client a response cache')
+    bench.add_argument('--limiter', action='store_true', help='keep the default rate limiter on')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s: %(message)s')
+
+    if args.command == 'fixtures':
+        if args.record:
+            from .api import ShowroomClient
+            data = record_fixtures(ShowroomClient(cache=None))
+        else:
+            data = synthesize_fixtures(rooms=args.rooms, live=args.live)
+        write_fixtures(data, args.directory)
+        return
+
+    if args.command not in ('serve', 'bench'):
+        parser.print_help()
+        return
+
+    server = MockShowroomServer(load_fixtures(args.fixtures) if args.fixtures else None,
+                                host=args.host, port=args.port, faults=_faults_from_args(args),
+                                comment_rate=args.comment_rate)
+    with server:
+        if args.command == 'serve':
+            try:
+                while True:
+                    time.sleep(60)
+            except KeyboardInterrupt:
+                pass
+        else:
+            if not args.limiter:
+                # the limiter's rates are meant for the real site, and would be all this measures
+                from .api.limiter import set_limiter
+                set_limiter(None)
+            print(format_benchmark(run_benchmark(server, threads=args.threads, seconds=args.seconds,
+                                                 deadline=args.deadline, cache=args.cache)))
+
+
+if __name__ == '__main__':
+    main()
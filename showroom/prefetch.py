@@ -0,0 +1,199 @@
+# Bulk room metadata prefetcher with an on-disk cache
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from requests.exceptions import RequestException
+
+from . import codec
+from .api import ShowroomClient
+from .api.limiter import TokenBucket
+
+prefetch_logger = logging.getLogger('showroom.prefetch')
+
+# seconds each field is trusted for, fields being the ShowroomClient methods fetched per room
+DEFAULT_MAX_AGES = {
+    "profile": 86400.0,
+    "room_settings": 86400.0,
+    "event_and_support": 3600.0,
+    "next_live": 600.0,
+}
+
+FIELDS = tuple(DEFAULT_MAX_AGES)
+
+
+class RoomPrefetcher(object):
+    """Fetches metadata for many rooms at once, and keeps it in an on-disk cache.
+
+    prefetch() takes the rooms of a ShowroomIndex (its room_dict, or just room ids)
+    and fetches, concurrently, every field that is missing or older than its
+    max age. Everything else is served from the cache, so refreshing a whole
+    index only fetches what went stale since the last time. get() then looks up
+    a single room's field, fetching it only if it isn't fresh.
+
+    The cache is a single compact JSON file mapping room_id to
+    {field: [POSIX time fetched, result]}, written by save() (and at the end of
+    every prefetch) and read back on creation.
+
+    Fetches are held to the prefetcher's own rate, whatever the concurrency, so
+    how fast a cold cache fills is up to its caller and leaves every other
+    request in the process alone. They still go through the client's session,
+    and so also the process-wide rate limiter.
+
+    e.g.
+        prefetcher = RoomPrefetcher(path=os.path.join(settings.directory.data, 'room_metadata.json'))
+        prefetcher.prefetch(index.room_dict, fields=('profile', 'next_live'))
+        image = prefetcher.get(room_id, 'profile')['image']
+
+    Args:
+        client: ShowroomClient to fetch with, a new one (without a response cache) if None
+        path: cache file, None to keep results in memory only
+        max_ages: {field: seconds}, merged over DEFAULT_MAX_AGES
+        concurrency: most requests in flight at once
+        rate: requests per second to make at most, None for no limit of its own
+    """
+    def __init__(self, client=None, path=None, max_ages=None, concurrency=16, rate=2.0):
+        self._client = client or ShowroomClient(cache=None)
+        self.path = path
+        self.max_ages = dict(DEFAULT_MAX_AGES)
+        self.max_ages.update(max_ages or {})
+        self.concurrency = concurrency
+        self.rate = rate
+        self._lock = threading.Lock()
+        # up to a second's worth at once
+        self._bucket = TokenBucket(rate, min(concurrency, int(rate))) if rate else None
+        # room_id -> {field: [fetched, result]}
+        self._entries = {}
+        self._dirty = False
+        self.requests = 0
+        self.failures = 0
+        if path:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf8') as infp:
+                entries = codec.load(infp)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            prefetch_logger.warning('{} could not be read, starting empty: {}'.format(self.path, e))
+            return
+        with self._lock:
+            self._entries = entries
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = codec.dumps(self._entries, compact=True)
+            self._dirty = False
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(temp, 'w', encoding='utf8') as outfp:
+            outfp.write(data)
+        os.replace(temp, self.path)
+
+    def _entry(self, room_id, field):
+        with self._lock:
+            return self._entries.get(str(room_id), {}).get(field)
+
+    def is_fresh(self, room_id, field):
+        entry = self._entry(room_id, field)
+        return entry is not None and time.time() - entry[0] <= self.max_ages.get(field, 0)
+
+    def lookup(self, room_id, field):
+        """Returns the cached result however old, or None if there is none."""
+        entry = self._entry(room_id, field)
+        return entry[1] if entry is not None else None
+
+    def _throttle(self):
+        """Waits until the prefetcher's own rate allows another request."""
+        if self._bucket is None:
+            return
+        while True:
+            with self._lock:
+                wait = self._bucket.delay(time.monotonic())
+                if wait == 0:
+                    self._bucket.tokens -= 1
+                    self._bucket.granted += 1
+                    return
+            time.sleep(wait)
+
+    def _fetch(self, room_id, field):
+        """Fetches and stores one field, returns whether it succeeded."""
+        self._throttle()
+        try:
+            result = getattr(self._client, field)(room_id)
+        except (RequestException, ValueError) as e:
+            # ValueError being a body that isn't JSON
+            prefetch_logger.debug('Fetching {} of {} failed: {}'.format(field, room_id, e))
+            with self._lock:
+                self.requests += 1
+                self.failures += 1
+            return False
+        with self._lock:
+            self.requests += 1
+            self._entries.setdefault(str(room_id), {})[field] = [time.time(), result]
+            self._dirty = True
+        return True
+
+    def get(self, room_id, field):
+        """Returns one field of a room, from the cache if fresh, else fetched.
+
+        A stale cached result is returned if fetching fails, None if there is none.
+        """
+        if not self.is_fresh(room_id, field):
+            self._fetch(room_id, field)
+        # after a failed fetch, a stale result still beats none
+        return self.lookup(room_id, field)
+
+    def prefetch(self, rooms, fields=FIELDS, force=False):
+        """Fetches every given field of every room that isn't fresh in the cache.
+
+        Args:
+            rooms: ShowroomIndex.room_dict, or any iterable of room ids
+            fields: names of ShowroomClient methods taking a room_id, see DEFAULT_MAX_AGES
+            force: fetch everything, fresh or not
+
+        Returns:
+            {field: {"cached": n, "fetched": n, "failed": n}}
+        """
+        room_ids = [str(room_id) for room_id in rooms]
+        counts = {field: {"cached": 0, "fetched": 0, "failed": 0} for field in fields}
+        stale = []
+        for room_id in room_ids:
+            for field in fields:
+                if not force and self.is_fresh(room_id, field):
+                    counts[field]["cached"] += 1
+                else:
+                    stale.append((room_id, field))
+
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = executor.map(lambda item: self._fetch(*item), stale)
+            for (room_id, field), ok in zip(stale, results):
+                counts[field]["fetched" if ok else "failed"] += 1
+        self.save()
+
+        prefetch_logger.info('Prefetched {} of {} fields for {} rooms in {:.1f}s'.format(
+            len(stale), len(room_ids) * len(fields), len(room_ids), time.time() - started))
+        return counts
+
+    def get_info(self):
+        """Returns the number of rooms cached and, per field, how many results are fresh and stale."""
+        now = time.time()
+        info = {"rooms": 0, "requests": self.requests, "failures": self.failures, "fields": {}}
+        with self._lock:
+            info["rooms"] = len(self._entries)
+            for fields in self._entries.values():
+                for field, (fetched, result) in fields.items():
+                    counts = info["fields"].setdefault(field, {"fresh": 0, "stale": 0})
+                    counts["fresh" if now - fetched <= self.max_ages.get(field, 0) else "stale"] += 1
+        return info
@@ -0,0 +1,184 @@
+# Reaper for Watcher threads, comment logger threads, and ffmpeg processes
+import logging
+import os
+import threading
+
+from . import clock
+
+reaper_logger = logging.getLogger('showroom.reaper')
+
+DONE_MODES = ("expired", "completed")
+
+
+class Reaper(object):
+    """Tracks every Watcher's thread, comment logger, and ffmpeg processes, and ends
+    those that outlive their purpose.
+
+    A resource is a suspect when:
+        - a Watcher thread (or task) is still running grace seconds after its
+          Watcher was done or told to quit
+        - a comment logger thread is still running grace seconds after its Watcher
+          was done
+        - an ffmpeg process is still running grace seconds after its Watcher left
+          "download" mode, or was replaced by a newer process (e.g. after a ping out)
+        - an ffmpeg process in "download" mode hasn't grown its output file for
+          stall seconds, i.e. is hung
+
+    Suspect ffmpeg processes are terminated, then killed kill_after seconds later
+    if still running. Suspect comment loggers are told to quit, then have their
+    websocket closed under them. Python threads can't be killed, but a Watcher
+    thread stuck in Downloader.wait() returns once its ffmpeg process is gone.
+
+    Watchers are forgotten once their thread, comment logger, and processes have
+    all ended, so the reaper's footprint stays proportional to the working list.
+    """
+    def __init__(self, grace=60.0, kill_after=30.0, stall=180.0, interval=30.0):
+        self.grace = grace
+        self.kill_after = kill_after
+        self.stall = stall
+        self.interval = interval
+        self._lock = threading.Lock()
+        # id(watcher) -> [watcher, thread]
+        self._tracked = {}
+        # resource key -> POSIX time it was first seen outliving its mode
+        self._suspects = {}
+        # resource key -> POSIX time it was asked to end
+        self._terminated = {}
+        # pid -> [output size, POSIX time it last changed]
+        self._progress = {}
+        self._last_sweep = 0.0
+        self._leaks = {"watcher_threads": 0, "comment_threads": 0, "ffmpeg_processes": 0}
+        self._totals = {"terminated": 0, "killed": 0}
+
+    @classmethod
+    def from_settings(cls, settings):
+        reaper = settings.reaper
+        if not reaper:
+            return cls()
+        return cls(grace=reaper.grace, kill_after=reaper.kill_after, stall=reaper.stall,
+                   interval=reaper.interval)
+
+    def __len__(self):
+        return len(self._tracked)
+
+    def track(self, watcher, thread):
+        """Starts tracking a Watcher and the thread (or WatcherTask) running it."""
+        with self._lock:
+            self._tracked[id(watcher)] = [watcher, thread]
+
+    def ready(self, now=None):
+        now = now or clock.time()
+        return now - self._last_sweep >= self.interval
+
+    def _outlived(self, key, now):
+        """Returns seconds since key was first seen outliving its mode."""
+        first = self._suspects.setdefault(key, now)
+        return now - first
+
+    def _escalate(self, key, now, terminate, kill, name):
+        """Asks a suspect to end, and forces it once kill_after has passed."""
+        asked = self._terminated.get(key)
+        if asked is None:
+            reaper_logger.warn('Terminating {}'.format(name))
+            terminate()
+            self._terminated[key] = now
+            self._totals["terminated"] += 1
+        elif now - asked >= self.kill_after:
+            reaper_logger.warn('Killing {}'.format(name))
+            kill()
+            # try again after another kill_after if it still won't die
+            self._terminated[key] = now
+            self._totals["killed"] += 1
+
+    def _stalled(self, process, path, now):
+        """Returns whether a download process has stopped writing its output."""
+        try:
+            size = os.path.getsize(path) if path else -1
+        except OSError:
+            size = -1
+        progress = self._progress.get(process.pid)
+        if progress is None or progress[0] != size:
+            self._progress[process.pid] = [size, now]
+            return False
+        return now - progress[1] >= self.stall
+
+    def _sweep_processes(self, watcher, now, live):
+        download = watcher.download
+        current = download.current_process
+        leaked = 0
+        for process in download.processes():
+            key = ('ffmpeg', process.pid)
+            live.add(key)
+            if process is current and watcher.mode == "download":
+                if not self._stalled(process, download.output_path, now):
+                    self._suspects.pop(key, None)
+                    continue
+                reaper_logger.debug('ffmpeg for {} stalled'.format(watcher.name))
+            elif self._outlived(key, now) < self.grace:
+                continue
+            leaked += 1
+            self._escalate(key, now, process.terminate, process.kill,
+                           'ffmpeg (pid {}) for {}'.format(process.pid, watcher.name))
+        return leaked
+
+    def sweep(self, now=None):
+        """Checks every tracked Watcher, ending what has outlived its mode.
+
+        Returns:
+            dict of resources currently leaking, as in get_info()
+        """
+        now = now or clock.time()
+        self._last_sweep = now
+        leaks = dict.fromkeys(self._leaks, 0)
+        live = set()
+        with self._lock:
+            tracked = list(self._tracked.items())
+
+        for ident, (watcher, thread) in tracked:
+            mode = watcher.mode
+            finished = mode in DONE_MODES or mode == "quitting"
+
+            leaks["ffmpeg_processes"] += self._sweep_processes(watcher, now, live)
+
+            logger = watcher.comment_logger
+            logger_alive = logger is not None and logger.is_alive()
+            if logger_alive and mode in DONE_MODES:
+                key = ('comments', ident)
+                live.add(key)
+                if self._outlived(key, now) >= self.grace:
+                    leaks["comment_threads"] += 1
+                    self._escalate(key, now, logger.stop, logger.close,
+                                   'comment logger for {}'.format(watcher.name))
+
+            thread_alive = thread.is_alive()
+            if thread_alive and finished:
+                key = ('watcher', ident)
+                live.add(key)
+                # nothing to do but report it, ending its ffmpeg process above is what frees it
+                if self._outlived(key, now) >= self.grace:
+                    leaks["watcher_threads"] += 1
+
+            if not thread_alive and not logger_alive and not watcher.download.processes():
+                with self._lock:
+                    self._tracked.pop(ident, None)
+
+        # forget resources that have ended or recovered
+        for table in (self._suspects, self._terminated):
+            for key in [k for k in table if k not in live]:
+                del table[key]
+        running = {key[1] for key in live if key[0] == 'ffmpeg'}
+        for pid in [pid for pid in self._progress if pid not in running]:
+            del self._progress[pid]
+
+        self._leaks = leaks
+        if any(leaks.values()):
+            reaper_logger.warn('Leaking {watcher_threads} watcher threads, {comment_threads} comment threads, '
+                               '{ffmpeg_processes} ffmpeg processes'.format(**leaks))
+        return dict(leaks)
+
+    def get_info(self):
+        """Returns counts of tracked Watchers, current leaks, and resources ended so far."""
+        info = dict(self._leaks)
+        info.update(self._totals)
+        info["tracked"] = len(self._tracked)
+        return info
@@ -0,0 +1,539 @@
+# Offline replay of recorded API traffic against WatchManager, on a virtual clock
+import argparse
+import asyncio
+import bisect
+import logging
+import random
+import selectors
+import tempfile
+import time
+
+from . import clock, codec
+from .clock import VirtualClock
+from .core import WatchManager, GENRE_IDS
+from .engine import AsyncWatcherEngine
+from .index import Room
+from .latency import percentile
+from .settings import ShowroomSettings, DEFAULTS
+
+replay_logger = logging.getLogger('showroom.replay')
+
+# endpoints recorded by TraceRecorder and answered by ReplayClient
+ENDPOINTS = ("onlives", "upcoming", "is_live", "streaming_url")
+
+# how long select() blocks for real when the loop has nothing scheduled at all
+IDLE_WAIT = 0.05
+
+
+class TraceRecorder(object):
+    """Wraps a ShowroomClient, appending each response the scheduler relies on to a trace file.
+
+    Each line of the trace is a json object:
+        {"time": POSIX time, "endpoint": "onlives", "key": null, "response": ...}
+    where key is the genre_id for upcoming and the room_id for is_live and streaming_url.
+
+    Pass one to WatchManager as its client to record production traffic for replay.
+    Every other attribute is looked up on the wrapped client.
+    """
+    def __init__(self, client, path):
+        self._client = client
+        self._outfp = open(path, 'a', encoding='utf8')
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _record(self, endpoint, key, response):
+        line = codec.dumps({"time": time.time(), "endpoint": endpoint, "key": key, "response": response},
+                           compact=True)
+        # one write per line, calls come from several threads
+        self._outfp.write(line + '\n')
+        return response
+
+    def onlives(self):
+        return self._record("onlives", None, self._client.onlives())
+
+    def upcoming(self, genre_id):
+        return self._record("upcoming", genre_id, self._client.upcoming(genre_id=genre_id))
+
+    def is_live(self, room_id):
+        return self._record("is_live", str(room_id), self._client.is_live(room_id))
+
+    def streaming_url(self, room_id):
+        return self._record("streaming_url", str(room_id), self._client.streaming_url(room_id))
+
+    def close(self):
+        self._outfp.close()
+
+
+def load_trace(path):
+    """Reads a trace written by TraceRecorder (or dump_trace), sorted by time."""
+    records = []
+    with open(path, encoding='utf8') as infp:
+        for line in infp:
+            line = line.strip()
+            if line:
+                records.append(codec.loads(line))
+    records.sort(key=lambda r: r['time'])
+    return records
+
+
+def dump_trace(records, path):
+    with open(path, 'w', encoding='utf8') as outfp:
+        for record in records:
+            outfp.write(codec.dumps(record, compact=True) + '\n')
+
+
+def synthesize_lives(rooms=200, start=None, hours=24.0, seed=0, genres=(101, 102)):
+    """Makes up a day of lives, for when there is no recorded trace at hand.
+
+    Each room goes live 0 to 3 times. Most lives are announced, starting within a
+    couple of minutes of a scheduled :00 or :30, the rest start unannounced.
+
+    Returns:
+        list of dicts with room_id, live_id, genre_id, started_at, ended_at, and
+        for announced lives, scheduled_at and announced_at
+    """
+    rng = random.Random(seed)
+    if start is None:
+        start = clock.time()
+    end = start + hours * 3600
+    lives = []
+    live_ids = iter(range(1, 10 ** 9))
+    for n in range(rooms):
+        room_id = str(100000 + n)
+        genre_id = genres[n % len(genres)]
+        begin = start
+        for _ in range(rng.randint(0, 3)):
+            when = rng.uniform(begin, end)
+            live = {"room_id": room_id, "live_id": next(live_ids), "genre_id": genre_id}
+            if rng.random() < 0.7:
+                scheduled = when - when % 1800 + 1800
+                live["scheduled_at"] = scheduled
+                live["announced_at"] = max(start, scheduled - rng.uniform(3600, 86400))
+                live["started_at"] = scheduled + rng.uniform(-60.0, 120.0)
+            else:
+                live["started_at"] = when
+            live["ended_at"] = live["started_at"] + rng.uniform(600.0, 5400.0)
+            if live["ended_at"] >= end:
+                break
+            lives.append(live)
+            begin = live["ended_at"] + 300
+    return lives
+
+
+def synthesize_trace(lives, start, end, onlives_every=7.0, upcoming_every=180.0):
+    """Turns lives (see synthesize_lives) into a trace, as if recorded by a poller.
+
+    onlives and upcoming are sampled every onlives_every and upcoming_every
+    seconds, while is_live is recorded exactly when each live starts and ends,
+    so the trace knows the true start of every live.
+    """
+    genres = sorted({live["genre_id"] for live in lives})
+
+    def entry(live):
+        return {"room_id": int(live["room_id"]), "live_id": live["live_id"], "genre_id": live["genre_id"],
+                "main_name": "Room {}".format(live["room_id"]),
+                "room_url_key": "room_{}".format(live["room_id"])}
+
+    records = []
+    t = start
+    while t < end:
+        by_genre = {genre_id: [] for genre_id in genres}
+        for live in lives:
+            if live["started_at"] <= t < live["ended_at"]:
+                by_genre[live["genre_id"]].append(dict(entry(live), started_at=int(live["started_at"])))
+        records.append({"time": t, "endpoint": "onlives", "key": None,
+                        "response": [{"genre_id": g, "lives": entries} for g, entries in by_genre.items()]})
+        t += onlives_every
+
+    t = start
+    while t < end:
+        for genre_id in genres:
+            upcoming = [dict(entry(live), next_live_start_at=int(live["scheduled_at"]))
+                        for live in lives
+                        if live["genre_id"] == genre_id and "scheduled_at" in live
+                        and live["announced_at"] <= t < live["started_at"]]
+            records.append({"time": t, "endpoint": "upcoming", "key": genre_id, "response": upcoming})
+        t += upcoming_every
+
+    for live in lives:
+        records.append({"time": live["started_at"], "endpoint": "is_live", "key": live["room_id"], "response": True})
+        records.append({"time": live["ended_at"], "endpoint": "is_live", "key": live["room_id"], "response": False})
+
+    records.sort(key=lambda r: r['time'])
+    return records
+
+
+class _Timeline(object):
+    """Values that change over time, looked up as of a given time."""
+    def __init__(self):
+        self.times = []
+        self.values = []
+
+    def append(self, when, value):
+        self.times.append(when)
+        self.values.append(value)
+
+    def at(self, when, default=None):
+        i = bisect.bisect_right(self.times, when)
+        return self.values[i - 1] if i else default
+
+
+class ReplayTrace(object):
+    """Indexes a trace for lookups as of any point in time.
+
+    A room's live status comes from its is_live and streaming_url records, and
+    from every onlives snapshot it appears in or drops out of, whichever is most
+    recent. The lives to measure detection latency against are taken from the
+    started_at of onlives entries.
+    """
+    def __init__(self, records):
+        records = sorted(records, key=lambda r: r['time'])
+        self.start = records[0]['time'] if records else 0.0
+        self.end = records[-1]['time'] if records else 0.0
+        self.onlives = _Timeline()
+        self.upcoming = {}
+        self.status = {}
+        # room_id -> sorted started_at of each live
+        self.lives = {}
+        self.rooms = {}
+
+        live_before = set()
+        starts = {}
+        for record in records:
+            endpoint, key, response, when = record['endpoint'], record.get('key'), record['response'], record['time']
+            if endpoint == "onlives":
+                self.onlives.append(when, response)
+                live_now = set()
+                for livelist in response or []:
+                    for item in livelist.get('lives', []):
+                        if 'room_id' not in item:
+                            continue
+                        room_id = str(item['room_id'])
+                        live_now.add(room_id)
+                        self.rooms.setdefault(room_id, item)
+                        if item.get('started_at'):
+                            starts.setdefault(room_id, set()).add(float(item['started_at']))
+                for room_id in live_now - live_before:
+                    self._status(room_id).append(when, True)
+                for room_id in live_before - live_now:
+                    self._status(room_id).append(when, False)
+                live_before = live_now
+            elif endpoint == "upcoming":
+                self.upcoming.setdefault(str(key), _Timeline()).append(when, response)
+                for item in response or []:
+                    self.rooms.setdefault(str(item['room_id']), item)
+            elif endpoint in ("is_live", "streaming_url"):
+                self._status(str(key)).append(when, bool(response))
+        self.lives = {room_id: sorted(s) for room_id, s in starts.items()}
+
+    def _status(self, room_id):
+        if room_id not in self.status:
+            self.status[room_id] = _Timeline()
+        return self.status[room_id]
+
+    def is_live(self, room_id, when):
+        timeline = self.status.get(str(room_id))
+        return bool(timeline and timeline.at(when, False))
+
+    def live_started(self, room_id, when):
+        """Returns the start of the room's latest live to begin at or before when, or None."""
+        starts = self.lives.get(str(room_id), [])
+        i = bisect.bisect_right(starts, when)
+        return starts[i - 1] if i else None
+
+
+class ReplayClient(object):
+    """Answers the scheduler's API calls from a ReplayTrace, as of the current (virtual) time.
+
+    Counts the calls made to each endpoint in requests.
+    """
+    def __init__(self, trace: ReplayTrace):
+        self.trace = trace
+        self.requests = dict.fromkeys(ENDPOINTS + ("time_tables",), 0)
+
+    def onlives(self):
+        self.requests["onlives"] += 1
+        return self.trace.onlives.at(clock.time(), [])
+
+    def upcoming(self, genre_id):
+        self.requests["upcoming"] += 1
+        timeline = self.trace.upcoming.get(str(genre_id))
+        return timeline.at(clock.time(), []) if timeline else []
+
+    def is_live(self, room_id):
+        self.requests["is_live"] += 1
+        return self.trace.is_live(room_id, clock.time())
+
+    def streaming_url(self, room_id):
+        self.requests["streaming_url"] += 1
+        if self.trace.is_live(room_id, clock.time()):
+            return [{"type": "hls", "quality": 1, "url": "replay://{}/playlist.m3u8".format(room_id)}]
+        return []
+
+    def time_tables(self, started_at=None, order=None):
+        self.requests["time_tables"] += 1
+        return {"time_tables": []}
+
+
+class _VirtualSelector(selectors.BaseSelector):
+    """Selector that skips ahead on the virtual clock instead of blocking.
+
+    Real file descriptors (the loop's self-pipe) are still polled, so calls made
+    from other threads are picked up.
+    """
+    def __init__(self, advance):
+        self._advance = advance
+        self._selector = selectors.DefaultSelector()
+
+    def register(self, fileobj, events, data=None):
+        return self._selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self._selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self._selector.modify(fileobj, events, data)
+
+    def get_map(self):
+        return self._selector.get_map()
+
+    def close(self):
+        self._selector.close()
+
+    def select(self, timeout=None):
+        ready = self._selector.select(0)
+        if ready or timeout == 0:
+            return ready
+        if timeout is None:
+            # nothing scheduled, only another thread can give the loop work
+            return self._selector.select(IDLE_WAIT)
+        self._advance(timeout)
+        return []
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Event loop running on a VirtualClock.
+
+    Whenever every coroutine is waiting, the clock jumps straight to the next
+    timer, so a day of asyncio.sleep() and Watcher waits takes as long as the work
+    done in between. Blocking calls handed to run_in_executor() are run right
+    away on the loop, they are expected to be fast fakes like ReplayClient.
+    """
+    def __init__(self, clock_: VirtualClock):
+        self._clock = clock_
+        # loop time counts from zero, as POSIX times are too coarse for the loop
+        # to tell a timer that is due from one a clock resolution away
+        self._epoch = clock_.time()
+        self._elapsed = 0.0
+        super().__init__(_VirtualSelector(self._advance))
+
+    def _advance(self, seconds):
+        self._elapsed += seconds
+        self._clock.advance_to(self._epoch + self._elapsed)
+
+    def time(self):
+        return self._elapsed
+
+    def run_in_executor(self, executor, func, *args):
+        future = self.create_future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def replay_settings(settings=None):
+    """Returns a copy of settings fit for replay.
+
+    Comments, schedule files, time_tables, metrics, and cluster mode are turned off,
+    and files (e.g. completed lives written out during maintenance) go to a
+    temporary directory. Everything else, in particular the throttle settings
+    being evaluated, is kept.
+    """
+    settings = ShowroomSettings(settings.to_dict() if settings is not None else DEFAULTS)
+    settings.directory.data = tempfile.mkdtemp(prefix='showroom-replay-')
+    settings.directory.output = settings.directory.data
+    settings.system.engine = "asyncio"
+    settings.comments.record = False
+    settings.feedback.write_schedules_to_file = False
+    settings.schedule.time_tables.enabled = False
+    settings.metrics.enabled = False
+    settings.cluster.enabled = False
+    return settings
+
+
+class ReplayHarness(object):
+    """Replays a trace against a WatchManager and its Watchers on a virtual clock.
+
+    The manager's tick() is driven from the same event loop as the Watchers'
+    arun(), so the whole replay is deterministic and runs as fast as the CPU
+    allows. Rooms are never wanted, so Watchers go from detecting a live to
+    following it in "live" mode without starting ffmpeg. Watch windows are woken
+    by firing the manager's DeadlineScheduler from the loop.
+
+    Args:
+        trace: a ReplayTrace
+        settings: settings to evaluate, see replay_settings()
+        priority: priority of rooms not in priorities
+        priorities: optional {room_id: priority}
+        genres: genre_ids of rooms in the trace to index, defaults to all
+    """
+    def __init__(self, trace: ReplayTrace, settings=None, priority=5, priorities=None, genres=None):
+        self.trace = trace
+        self.settings = replay_settings(settings)
+        self.index = {}
+        for room_id, item in trace.rooms.items():
+            if genres is not None and item.get('genre_id') not in genres:
+                continue
+            name = item.get('main_name') or item.get('room_name') or room_id
+            info = {"room_id": room_id, "engName": name, "jpnName": name, "engTeam": "", "jpnTeam": "",
+                    "priority": (priorities or {}).get(room_id, priority),
+                    "web_url": '/' + (item.get('room_url_key') or room_id)}
+            self.index[room_id] = Room(info, wanted=False)
+
+    async def _drive(self, manager, clock_, end, detected, hours):
+        loop_start = clock_.time()
+        hour = {"hour": 0, "cpu_seconds": 0.0, "requests": 0}
+        cpu, requests = time.process_time(), 0
+
+        def close_hour():
+            hour["cpu_seconds"] = time.process_time() - cpu
+            hour["requests"] = sum(manager.client.requests.values()) - requests
+            hours.append(dict(hour))
+
+        while clock_.time() < end:
+            manager.scheduler.fire_due()
+            manager.tick()
+            for info in manager.pop_completed_info():
+                detected.append(info)
+
+            now = clock_.time()
+            if now - loop_start >= (hour["hour"] + 1) * 3600:
+                close_hour()
+                hour["hour"] += 1
+                cpu, requests = time.process_time(), sum(manager.client.requests.values())
+
+            wait = manager.time_until_next_tick()
+            next_deadline = manager.scheduler.next_deadline()
+            if next_deadline is not None:
+                wait = min(wait, max(next_deadline - now, 0.0))
+            await asyncio.sleep(min(wait, end - now) if now < end else 0)
+        close_hour()
+        detected.extend(manager.get_info_by_mode("working"))
+
+    def run(self, start=None, end=None):
+        """Replays the trace, from start to end (defaults to the whole trace).
+
+        Returns:
+            report dict, see format_report()
+        """
+        start = self.trace.start if start is None else start
+        end = self.trace.end if end is None else end
+        clock_ = VirtualClock(start)
+        previous = clock.set_clock(clock_)
+        client = ReplayClient(self.trace)
+        engine = AsyncWatcherEngine(loop_factory=lambda: VirtualTimeLoop(clock_))
+        detected, hours = [], []
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            manager = WatchManager(self.index, self.settings, client=client, engine=engine)
+            # deadlines are fired from the loop instead, in virtual time
+            manager.scheduler.stop()
+            engine.start()
+            future = asyncio.run_coroutine_threadsafe(self._drive(manager, clock_, end, detected, hours),
+                                                      engine.loop)
+            try:
+                future.result()
+            finally:
+                manager.stop()
+        finally:
+            clock.set_clock(previous)
+
+        report = {"start": start, "end": end,
+                  "simulated_hours": (end - start) / 3600,
+                  "wall_seconds": time.perf_counter() - wall,
+                  "cpu_seconds": time.process_time() - cpu,
+                  "requests": dict(client.requests),
+                  "detection": self._detection(detected, start, end),
+                  "hours": hours}
+        return report
+
+    def _detection(self, infos, start, end):
+        """Matches each Watcher's first positive live check with the live it detected."""
+        latencies = {}
+        for info in infos:
+            marks = (info.get('latency') or {}).get('marks') or {}
+            if not marks.get('detected'):
+                continue
+            room_id = str(info['room']['room_id'])
+            started = self.trace.live_started(room_id, marks['detected'])
+            if started is None or started < start:
+                # already underway when the replay began, like LatencyStats.since
+                continue
+            key = (room_id, started)
+            latencies[key] = min(latencies.get(key, marks['detected'] - started), marks['detected'] - started)
+
+        lives = [(room_id, s) for room_id, starts in self.trace.lives.items() if room_id in self.index
+                 for s in starts if start <= s < end]
+        values = sorted(latencies.values())
+        return {"lives": len(lives),
+                "detected": len(values),
+                "missed": len(set(lives) - set(latencies)),
+                "mean": sum(values) / len(values) if values else None,
+                "p50": percentile(values, 50),
+                "p90": percentile(values, 90),
+                "p99": percentile(values, 99),
+                "max": values[-1] if values else None}
+
+
+def format_report(report):
+    """Renders a replay report as text."""
+    def seconds(value):
+        return '-' if value is None else '{:.1f}s'.format(value)
+
+    detection = report["detection"]
+    lines = ['Replayed {:.1f} hours in {:.1f}s ({:.1f}s CPU)'.format(
+                 report["simulated_hours"], report["wall_seconds"], report["cpu_seconds"]),
+             'Detected {} of {} lives, missed {}'.format(detection["detected"], detection["lives"],
+                                                         detection["missed"]),
+             'Detection latency: mean {} p50 {} p90 {} p99 {} max {}'.format(
+                 *(seconds(detection[k]) for k in ("mean", "p50", "p90", "p99", "max"))),
+             'Requests: ' + ', '.join('{} {}'.format(k, v) for k, v in report["requests"].items()),
+             '',
+             'Hour  Requests  CPU']
+    for hour in report["hours"]:
+        lines.append('{:>4}  {:>8}  {:.3f}s'.format(hour["hour"], hour["requests"], hour["cpu_seconds"]))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay recorded Showroom API traffic on a virtual clock')
+    parser.add_argument('trace', nargs='?', help='trace file written by TraceRecorder')
+    parser.add_argument('--config', help='settings file to evaluate')
+    parser.add_argument('--synthetic', type=int, metavar='ROOMS',
+                        help='replay a made up day for this many rooms instead of a trace')
+    parser.add_argument('--hours', type=float, default=24.0, help='length of the synthetic day')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--priority', type=int, default=5, help='priority given to every room')
+    parser.add_argument('--json', action='store_true', help='print the report as json')
+    args = parser.parse_args(argv)
+
+    if args.synthetic:
+        start = float(int(time.time()) - int(time.time()) % 86400)
+        lives = synthesize_lives(args.synthetic, start=start, hours=args.hours, seed=args.seed,
+                                 genres=sorted(GENRE_IDS)[:2])
+        records = synthesize_trace(lives, start, start + args.hours * 3600)
+    elif args.trace:
+        records = load_trace(args.trace)
+    else:
+        parser.error('either a trace or --synthetic is required')
+
+    settings = ShowroomSettings.from_file(args.config) if args.config else None
+    report = ReplayHarness(ReplayTrace(records), settings, priority=args.priority).run()
+    print(codec.dumps(report) if args.json else format_report(report))
+
+
+if __name__ == '__main__':
+    main()
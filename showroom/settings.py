@@ -56,6 +56,8 @@ DEFAULTS = {
         "max": {
             "downloads": 80,
             "watches": 50,
+            # only rooms with a priority up to this preempt lower priority downloads, or
+            # skip the watch cap when already live; the rest wait their turn
             "priority": 80
         },
         "rate": {
@@ -64,8 +66,37 @@ DEFAULTS = {
             "watch": 2.0,
             "live": 60.0
         },
+        # polls streaming_url instead of is_live from lead seconds before a scheduled
+        # start_time until lag seconds after, so ffmpeg can start as soon as urls appear;
+        # stops early once an onlives snapshot has shown the room live or been taken since
+        # start_time, leaving late starts to the LiveBoard
+        "prewarm": {
+            "enabled": True,
+            "lead": 60.0,
+            "lag": 60.0,
+            "rate": 1.0,
+            # seconds fetched urls stay usable without fetching them again
+            "max_age": 10.0
+        },
         "timeout": {
             "download": 23.0
+        },
+        # onlives and upcoming polling speeds up around :00 and :30 and after new lives
+        # are found, and slows down overnight and while nothing changes
+        "adaptive": {
+            "enabled": True,
+            # backoff_max caps backing off outside quiet_hours, so onlives never
+            # polls slower than throttle.rate.onlives and detection isn't delayed
+            "onlives": {"min": 4.0, "max": 60.0, "backoff_max": 7.0},
+            "upcoming": {"min": 60.0, "max": 900.0, "backoff_max": None},
+            # seconds either side of :00 and :30 to poll at the min rate
+            "boundary": 180.0,
+            # seconds to poll at the min rate after a poll finds something new
+            "boost": 300.0,
+            # rate multiplier for each consecutive poll that returned the same data
+            "backoff": 1.5,
+            # [start, end) hours JST to poll at the max rate
+            "quiet_hours": [3, 8]
         }
     },
     "ffmpeg": {
@@ -80,11 +111,125 @@ DEFAULTS = {
     },
     "feedback": {
         "console": False,  # this actually should be a loglevel
-        "write_schedules_to_file": True
+        "write_schedules_to_file": True,
+        # write schedules, completed lists and comment logs without indentation,
+        # smaller and faster when only programs read them
+        "compact_json": False
     },
     "system": {
         "make_symlinks": True,
-        "symlink_dirs": ('log', 'config')
+        "symlink_dirs": ('log', 'config'),
+        # "threads" (one thread per Watcher) or "asyncio" (all Watchers on one event loop)
+        "engine": "threads",
+        # with the asyncio engine, threads making blocking calls (live checks, starting
+        # ffmpeg) at once, e.g. for every room checked at a :00 boundary
+        "engine_workers": 64,
+        # number of worker processes to spread Watchers across, 0 or 1 for none
+        "shards": 0
+    },
+    "cluster": {
+        # when enabled, nodes sharing a lease store split rooms between them
+        "enabled": False,
+        # unique name of this node, defaults to hostname-pid
+        "node": None,
+        # "file" (a directory of lease files, e.g. on a network share) or "sqlite"
+        "store": "file",
+        "path": '{directory.data}/leases',
+        # seconds until a dead node's rooms are picked up by others
+        "ttl": 60.0,
+        # [max_priority, copies] pairs, e.g. [[3, 2]] records priority 1-3 rooms on two nodes
+        "redundancy": []
+    },
+    "reaper": {
+        # seconds a thread or ffmpeg process may outlive its Watcher's mode
+        "grace": 60.0,
+        # seconds between terminating a process and killing it
+        "kill_after": 30.0,
+        # seconds a download may go without its file growing before it's considered hung
+        "stall": 180.0,
+        # seconds between sweeps
+        "interval": 30.0
+    },
+    "metrics": {
+        # serves Prometheus metrics at http://host:port/metrics
+        "enabled": False,
+        "host": "127.0.0.1",
+        "port": 9477
+    },
+    "schedule": {
+        # genres to follow in onlives
+        "genres": [101, 102, 103, 104, 105, 106, 107, 200],
+        # genres to fetch upcoming lives for, one request each per poll, all at once,
+        # e.g. [101, 102] to also follow Music
+        "upcoming_genres": [102],
+        # also follow time_tables, which lists lives further ahead, see TimeTableSource;
+        # every room with a live within horizon gets a Watcher, so it's off by default
+        "time_tables": {
+            "enabled": False,
+            # fetched windows are cached here, keyed by their start time
+            "cache": '{directory.data}/time_tables',
+            # seconds per cached window
+            "window": 3600.0,
+            # seconds ahead that are re-fetched every time
+            "head": 7200.0,
+            # seconds ahead to schedule lives
+            "horizon": 86400.0,
+            # seconds cached windows after the head are reused for
+            "max_age": 1800.0
+        },
+        # threads fetching the above in parallel
+        "workers": 4
+    },
+    "http": {
+        # responses of slowly changing endpoints are reused for a few seconds, see ResponseCache
+        "cache": {
+            "enabled": True,
+            "max_entries": 1024,
+            # seconds each endpoint's responses stay fresh, e.g. {"/api/room/profile": 3600},
+            # on top of the defaults in showroom.api.cache, 0 to not cache an endpoint
+            "ttl": {}
+        },
+        # one 429 backs off every request to the host, and queued requests go in priority
+        # order, go-live checks first, shared by the whole process, see RateLimiter
+        "limiter": {
+            "enabled": True,
+            # requests per second by endpoint class, e.g. {"profile": 2.0}; classes not
+            # listed (all of them by default) aren't held to a rate
+            "rate": {},
+            # requests allowed at once after a quiet spell, e.g. {"detection": 40}
+            "burst": {},
+            # seconds every request waits after a 429 without Retry-After, doubling up to max_backoff
+            "backoff": 30.0,
+            "max_backoff": 300.0
+        },
+        # endpoints failing repeatedly fail fast for a while instead of retrying, see CircuitBreaker
+        "breaker": {
+            "enabled": True,
+            # consecutive timeouts, connection errors or 5xx that open an endpoint's circuit
+            "threshold": 5,
+            # seconds it stays open before a single probe request is let through
+            "cooldown": 30.0
+        },
+        # per endpoint request counts, latency percentiles and error rates, see the "endpoints" command
+        "stats": {
+            "enabled": True,
+            # seconds of recent requests the percentiles and rates are over
+            "window": 300.0,
+            # most recent requests kept per endpoint
+            "max_samples": 2000
+        },
+        # seconds a request may take, retries included, before giving up
+        "deadline": {
+            # a Watcher's is_live or streaming_url check, also cut short by the end of its watch window
+            "live_check": 30.0
+        }
+    },
+    "detection": {
+        # "is_live" (each watcher polls its own room) or
+        # "onlives" (one onlives poll resolves every watcher, is_live is only a fallback)
+        "mode": "is_live",
+        # onlives snapshots older than this many seconds aren't trusted
+        "max_age": 15.0
     },
     "comments": {
         "record": False,
@@ -134,6 +279,8 @@ DEFAULTS_NEW = {
         "max": {
             "downloads": 80,
             "watches": 50,
+            # only rooms with a priority up to this preempt lower priority downloads, or
+            # skip the watch cap when already live; the rest wait their turn
             "priority": 80
         },
         "rate": {
@@ -142,8 +289,37 @@ DEFAULTS_NEW = {
             "watch": 2.0,
             "live": 60.0
         },
+        # polls streaming_url instead of is_live from lead seconds before a scheduled
+        # start_time until lag seconds after, so ffmpeg can start as soon as urls appear;
+        # stops early once an onlives snapshot has shown the room live or been taken since
+        # start_time, leaving late starts to the LiveBoard
+        "prewarm": {
+            "enabled": True,
+            "lead": 60.0,
+            "lag": 60.0,
+            "rate": 1.0,
+            # seconds fetched urls stay usable without fetching them again
+            "max_age": 10.0
+        },
         "timeout": {
             "download": 23.0
+        },
+        # onlives and upcoming polling speeds up around :00 and :30 and after new lives
+        # are found, and slows down overnight and while nothing changes
+        "adaptive": {
+            "enabled": True,
+            # backoff_max caps backing off outside quiet_hours, so onlives never
+            # polls slower than throttle.rate.onlives and detection isn't delayed
+            "onlives": {"min": 4.0, "max": 60.0, "backoff_max": 7.0},
+            "upcoming": {"min": 60.0, "max": 900.0, "backoff_max": None},
+            # seconds either side of :00 and :30 to poll at the min rate
+            "boundary": 180.0,
+            # seconds to poll at the min rate after a poll finds something new
+            "boost": 300.0,
+            # rate multiplier for each consecutive poll that returned the same data
+            "backoff": 1.5,
+            # [start, end) hours JST to poll at the max rate
+            "quiet_hours": [3, 8]
         }
     },
     "ffmpeg": {
@@ -158,12 +334,126 @@ DEFAULTS_NEW = {
     },
     "feedback": {
         "console": False,  # this actually should be a loglevel
-        "write_schedules_to_file": True
+        "write_schedules_to_file": True,
+        # write schedules, completed lists and comment logs without indentation,
+        # smaller and faster when only programs read them
+        "compact_json": False
     },
     "system": {
         # TODO: Fix this to work with the new paths
         "make_symlinks": True,
-        "symlink_dirs": ('log', 'config')
+        "symlink_dirs": ('log', 'config'),
+        # "threads" (one thread per Watcher) or "asyncio" (all Watchers on one event loop)
+        "engine": "threads",
+        # with the asyncio engine, threads making blocking calls (live checks, starting
+        # ffmpeg) at once, e.g. for every room checked at a :00 boundary
+        "engine_workers": 64,
+        # number of worker processes to spread Watchers across, 0 or 1 for none
+        "shards": 0
+    },
+    "cluster": {
+        # when enabled, nodes sharing a lease store split rooms between them
+        "enabled": False,
+        # unique name of this node, defaults to hostname-pid
+        "node": None,
+        # "file" (a directory of lease files, e.g. on a network share) or "sqlite"
+        "store": "file",
+        "path": '{directory.data}/leases',
+        # seconds until a dead node's rooms are picked up by others
+        "ttl": 60.0,
+        # [max_priority, copies] pairs, e.g. [[3, 2]] records priority 1-3 rooms on two nodes
+        "redundancy": []
+    },
+    "reaper": {
+        # seconds a thread or ffmpeg process may outlive its Watcher's mode
+        "grace": 60.0,
+        # seconds between terminating a process and killing it
+        "kill_after": 30.0,
+        # seconds a download may go without its file growing before it's considered hung
+        "stall": 180.0,
+        # seconds between sweeps
+        "interval": 30.0
+    },
+    "metrics": {
+        # serves Prometheus metrics at http://host:port/metrics
+        "enabled": False,
+        "host": "127.0.0.1",
+        "port": 9477
+    },
+    "schedule": {
+        # genres to follow in onlives
+        "genres": [101, 102, 103, 104, 105, 106, 107, 200],
+        # genres to fetch upcoming lives for, one request each per poll, all at once,
+        # e.g. [101, 102] to also follow Music
+        "upcoming_genres": [102],
+        # also follow time_tables, which lists lives further ahead, see TimeTableSource;
+        # every room with a live within horizon gets a Watcher, so it's off by default
+        "time_tables": {
+            "enabled": False,
+            # fetched windows are cached here, keyed by their start time
+            "cache": '{directory.data}/time_tables',
+            # seconds per cached window
+            "window": 3600.0,
+            # seconds ahead that are re-fetched every time
+            "head": 7200.0,
+            # seconds ahead to schedule lives
+            "horizon": 86400.0,
+            # seconds cached windows after the head are reused for
+            "max_age": 1800.0
+        },
+        # threads fetching the above in parallel
+        "workers": 4
+    },
+    "http": {
+        # responses of slowly changing endpoints are reused for a few seconds, see ResponseCache
+        "cache": {
+            "enabled": True,
+            "max_entries": 1024,
+            # seconds each endpoint's responses stay fresh, e.g. {"/api/room/profile": 3600},
+            # on top of the defaults in showroom.api.cache, 0 to not cache an endpoint
+            "ttl": {}
+        },
+        # one 429 backs off every request to the host, and queued requests go in priority
+        # order, go-live checks first, shared by the whole process, see RateLimiter
+        "limiter": {
+            "enabled": True,
+            # requests per second by endpoint class, e.g. {"profile": 2.0}; classes not
+            # listed (all of them by default) aren't held to a rate
+            "rate": {},
+            # requests allowed at once after a quiet spell, e.g. {"detection": 40}
+            "burst": {},
+            # seconds every request waits after a 429 without Retry-After, doubling up to max_backoff
+            "backoff": 30.0,
+            "max_backoff": 300.0
+        },
+        # endpoints failing repeatedly fail fast for a while instead of retrying, see CircuitBreaker
+        "breaker": {
+            "enabled": True,
+            # consecutive timeouts, connection errors or 5xx that open an endpoint's circuit
+            "threshold": 5,
+            # seconds it stays open before a single probe request is let through
+            "cooldown": 30.0
+        },
+        # per endpoint request counts, latency percentiles and error rates, see the "endpoints" command
+        "stats": {
+            "enabled": True,
+            # seconds of recent requests the percentiles and rates are over
+            "window": 300.0,
+            # most recent requests kept per endpoint
+            "max_samples": 2000
+        },
+        # seconds a request may take, retries included, before giving up
+        "deadline": {
+            # a Watcher's is_live or streaming_url check, also cut short by the end of its watch window
+            "live_check": 30.0
+        }
+    },
+    "detection": {
+        # "is_live" (each watcher polls its own room) or
+        # "onlives" (one onlives poll resolves every watcher, is_live is only a fallback)
+        "mode": "is_live",
+        # onlives snapshots older than this many seconds aren't trusted
+        "max_age": 15.0
     },
     "comments": {
         "record": False,
@@ -344,6 +634,17 @@ class SettingsDict(dict):
     def keys(self):
         return self._dict.keys()
 
+    def to_dict(self):
+        """Returns the settings as plain nested dicts, unformatted.
+
+        e.g. to rebuild them in another process with ShowroomSettings(settings.to_dict())"""
+        result = {}
+        for key, val in self._dict.items():
+            if isinstance(val, SettingsDict):
+                val = val.to_dict()
+            result[key] = val
+        return result
+
     def items(self):
         for key in self._dict.keys():
             yield key, self[key]
@@ -0,0 +1,402 @@
+# Sharded WatchManager, spreading Watchers over worker processes
+import logging
+import math
+import threading
+import time
+import zlib
+from multiprocessing import Process, Queue
+from queue import Empty as QueueEmpty
+
+from .core import WatchManager, WatchQueue, MAX_TICK_WAIT
+from .api.limiter import DEFAULT_BURSTS
+from .latency import merge_info
+from .metrics import REGISTRY
+from .settings import ShowroomSettings
+
+shard_logger = logging.getLogger('showroom.shard')
+
+# fewest seconds between a worker's state reports, however often its Watchers wake it
+REPORT_INTERVAL = 1.0
+
+
+def shard_for(room_id, shards):
+    """Returns the shard a room belongs to, the same in every process."""
+    return zlib.crc32(str(room_id).encode('utf8')) % shards
+
+
+class ShardIndex(object):
+    """The rooms handed to a shard by its coordinator, standing in for ShowroomIndex.
+
+    Rooms arrive along with the lives and schedules that mention them. A room
+    already known is kept (Watchers hold on to it) and only its wanted status is
+    updated.
+    """
+    def __init__(self):
+        self.room_dict = {}
+
+    def __len__(self):
+        return len(self.room_dict)
+
+    def __contains__(self, room_id):
+        return room_id in self.room_dict
+
+    def __getitem__(self, room_id):
+        return self.room_dict.get(room_id)
+
+    def update_rooms(self, rooms):
+        for room in rooms:
+            if room.room_id in self.room_dict:
+                self.room_dict[room.room_id].set_wanted(room.is_wanted())
+            else:
+                self.room_dict[room.room_id] = room
+
+    def set_wanted(self, room_id, wanted):
+        if room_id in self.room_dict:
+            self.room_dict[room_id].set_wanted(wanted)
+
+
+class ShardWorker(object):
+    """Runs a WatchManager for one shard, in its own process.
+
+    The worker never polls onlives or upcoming itself. It applies whatever the
+    coordinator sends to its inbox, and reports its working list, admission
+    counts, metrics, and completed Watchers to the shared outbox.
+
+    Inbox messages:
+        ("lives", rooms, onlives, snapshot_time)
+        ("schedule", rooms, upcoming)
+        ("wanted", room_id, wanted)
+        ("stop",)
+    and None, used internally to wake the worker when a Watcher changes state.
+
+    Messages are handled in batches, everything queued at once, and state is
+    reported after each batch only if it changed, and at most every
+    REPORT_INTERVAL seconds. Completed Watchers are always reported straight away.
+
+    Outbox messages:
+        ("state", shard, working_info, admission_info, latency_info, reaper_info, limiter_info, circuit_info,
+         endpoint_info, metrics)
+        ("completed", shard, completed_info)
+        ("stopped", shard)
+    """
+    def __init__(self, shard, shards, settings_dict, inbox, outbox):
+        self.shard = shard
+        self.shards = shards
+        self._settings_dict = settings_dict
+        self.inbox = inbox
+        self.outbox = outbox
+        self._wake_pending = False
+        self._last_state = None
+        self._reported = 0.0
+        self._report_pending = False
+
+    def _wake(self):
+        if not self._wake_pending:
+            self._wake_pending = True
+            self.inbox.put(None)
+
+    def _build_settings(self):
+        settings = ShowroomSettings(self._settings_dict)
+        # the coordinator writes the schedule, and the caps are split between shards
+        settings.feedback.write_schedules_to_file = False
+        settings.system.shards = 0
+        for key in ('watches', 'downloads'):
+            if settings.throttle.max[key]:
+                settings.throttle.max[key] = int(math.ceil(settings.throttle.max[key] / self.shards))
+        # as is the rate limit, each shard being a process with a limiter of its own
+        if settings.http.limiter.enabled:
+            limiter = settings.http.limiter
+            for key, rate in dict(limiter.rate.items()).items():
+                limiter.rate[key] = rate / self.shards
+            for key, burst in dict(DEFAULT_BURSTS, **dict(limiter.burst.items())).items():
+                limiter.burst[key] = int(math.ceil(burst / self.shards))
+        # in cluster mode each shard claims its own rooms, as a node of its own
+        if settings.cluster.enabled and settings.cluster.node:
+            settings.cluster.node = '{}-shard{}'.format(settings.cluster.node, self.shard)
+        return settings
+
+    def _report(self, manager, force=False):
+        # workers never tick(), so their leases are renewed here, on every pass
+        if manager.leases is not None:
+            manager.update_leases()
+        manager.update_completed()
+        manager.reap()
+        completed = manager.pop_completed_info()
+        if completed:
+            self.outbox.put(("completed", self.shard, completed))
+        now = time.monotonic()
+        if not force and now - self._reported < REPORT_INTERVAL:
+            # sent once the interval is up, see _next_wait
+            self._report_pending = True
+            return
+        self._reported = now
+        self._report_pending = False
+        state = (manager.get_info_by_mode("working"), manager.get_admission_info(), manager.get_latency_info(),
+                 manager.get_reaper_info(), manager.get_limiter_info(), manager.get_circuit_info(),
+                 manager.get_endpoint_info(), REGISTRY.snapshot())
+        if state != self._last_state:
+            self._last_state = state
+            self.outbox.put(("state", self.shard) + state)
+
+    def _next_wait(self, wait):
+        if self._report_pending:
+            return max(min(wait, self._reported + REPORT_INTERVAL - time.monotonic()), 0.0)
+        return wait
+
+    def _drain(self):
+        """Returns every message already queued in the inbox, without waiting."""
+        messages = []
+        while True:
+            try:
+                messages.append(self.inbox.get_nowait())
+            except QueueEmpty:
+                return messages
+
+    def run(self):
+        # a forked worker starts with the coordinator's counts, which it reports too
+        REGISTRY.reset()
+        index = ShardIndex()
+        manager = WatchManager(index, self._build_settings())
+        manager.update_flag.add_callback(self._wake)
+        shard_logger.debug('Shard {} of {} running'.format(self.shard, self.shards))
+        # wakes often enough to renew leases well before they expire, even when idle
+        wait = MAX_TICK_WAIT if manager.leases is None else min(MAX_TICK_WAIT, manager.leases.ttl / 3)
+
+        while True:
+            try:
+                messages = [self.inbox.get(timeout=self._next_wait(wait))]
+            except QueueEmpty:
+                messages = [None]
+            messages.extend(self._drain())
+            for msg in messages:
+                if msg is None:
+                    self._wake_pending = False
+                elif msg[0] == "lives":
+                    index.update_rooms(msg[1])
+                    manager.apply_lives(msg[2], msg[3])
+                elif msg[0] == "schedule":
+                    index.update_rooms(msg[1])
+                    manager.apply_schedule(msg[2])
+                elif msg[0] == "wanted":
+                    index.set_wanted(msg[1], msg[2])
+                elif msg[0] == "stop":
+                    manager.update_flag.remove_callback(self._wake)
+                    manager.stop()
+                    self._report(manager, force=True)
+                    self.outbox.put(("stopped", self.shard))
+                    return
+            self._report(manager)
+
+
+def run_shard(shard, shards, settings_dict, inbox, outbox):
+    """Process target for a ShardWorker."""
+    ShardWorker(shard, shards, settings_dict, inbox, outbox).run()
+
+
+class ShardedWatchManager(WatchManager):
+    """WatchManager that fans its Watchers out to worker processes.
+
+    Acts as the coordinator: it polls onlives and upcoming exactly as a
+    WatchManager would, but instead of creating Watchers itself, it splits each
+    response by room_id hash and sends each part to the worker process owning
+    those rooms. The workers' working lists and completed Watchers are collected
+    back here, so that schedule.json, completed_*.json, and the controller's
+    commands look the same as with a single process.
+
+    Each worker enforces throttle.max.watches and throttle.max.downloads divided
+    by the number of shards, rather than the caps being shared.
+    """
+    def __init__(self, index, settings, shards=None):
+        self.shards = shards or settings.system.shards
+        self._state_lock = threading.RLock()
+        self._shard_info = [[] for _ in range(self.shards)]
+        self._shard_admission = [None] * self.shards
+        self._shard_latency = [{}] * self.shards
+        self._shard_reaper = [{}] * self.shards
+        self._shard_limiter = [{}] * self.shards
+        self._shard_circuits = [{}] * self.shards
+        self._shard_endpoints = [{}] * self.shards
+        # each worker's HTTP, websocket, limiter etc. metrics, see MetricsRegistry.snapshot()
+        self._shard_metrics = [[] for _ in range(self.shards)]
+        self._completed_info = []
+        # room_id -> wanted status last sent to its shard
+        self._sent_wanted = {}
+        self._stopped = threading.Condition(self._state_lock)
+        self._stopped_shards = set()
+
+        # workers are started before WatchManager starts any threads of its own
+        self._outbox = Queue()
+        self._inboxes = []
+        self._workers = []
+        settings_dict = settings.to_dict()
+        for shard in range(self.shards):
+            inbox = Queue()
+            worker = Process(target=run_shard, args=(shard, self.shards, settings_dict, inbox, self._outbox),
+                             name="WatchShard-{}".format(shard))
+            worker.start()
+            self._inboxes.append(inbox)
+            self._workers.append(worker)
+
+        super().__init__(index, settings)
+        # the workers hold any cluster leases, never the coordinator
+        self.leases = None
+
+        self._collector = threading.Thread(target=self._collect, name="ShardCollector")
+        self._collector.daemon = True
+        self._collector.start()
+
+    def _collect(self):
+        """Receives the workers' reports."""
+        while True:
+            msg = self._outbox.get()
+            kind, shard = msg[0], msg[1]
+            with self._state_lock:
+                if kind == "state":
+                    self._shard_info[shard] = msg[2]
+                    self._shard_admission[shard] = msg[3]
+                    self._shard_latency[shard] = msg[4]
+                    self._shard_reaper[shard] = msg[5]
+                    self._shard_limiter[shard] = msg[6]
+                    self._shard_circuits[shard] = msg[7]
+                    self._shard_endpoints[shard] = msg[8]
+                    self._shard_metrics[shard] = msg[9]
+                elif kind == "completed":
+                    self._completed_info.extend(msg[2])
+                elif kind == "stopped":
+                    self._shard_info[shard] = []
+                    self._stopped_shards.add(shard)
+                    self._stopped.notify_all()
+            self.update_flag.set()
+
+    def _send(self, shard, *msg):
+        self._inboxes[shard].put(msg)
+
+    def _rooms_for(self, room_ids):
+        rooms = []
+        for room_id in room_ids:
+            room = self.index[room_id]
+            rooms.append(room)
+            self._sent_wanted[room_id] = room.is_wanted()
+        return rooms
+
+    def apply_lives(self, onlives, snapshot_time=None):
+        # only indexed rooms are passed on, which is all any shard's Watchers or live board need
+        parts = [[] for _ in range(self.shards)]
+        room_ids = [set() for _ in range(self.shards)]
+        for livelist in onlives:
+            if livelist['genre_id'] in self.genre_ids:
+                lives = [[] for _ in range(self.shards)]
+                for item in livelist['lives']:
+                    if 'room_id' in item and str(item['room_id']) in self.index:
+                        shard = shard_for(item['room_id'], self.shards)
+                        lives[shard].append(item)
+                        room_ids[shard].add(str(item['room_id']))
+                for shard in range(self.shards):
+                    if lives[shard]:
+                        parts[shard].append({"genre_id": livelist['genre_id'], "lives": lives[shard]})
+        for shard in range(self.shards):
+            # sent even when empty, so the shard's live board stays fresh
+            self._send(shard, "lives", self._rooms_for(room_ids[shard]), parts[shard], snapshot_time)
+
+    def watched_room_ids(self):
+        return {info['room']['room_id'] for info in self._all_info()}
+
+    def apply_schedule(self, upcoming):
+        split = [[] for _ in range(self.shards)]
+        for item in upcoming:
+            split[shard_for(item['room_id'], self.shards)].append(item)
+        for shard, items in enumerate(split):
+            if items:
+                self._send(shard, "schedule", self._rooms_for(str(e['room_id']) for e in items), items)
+
+    def _sync_wanted(self):
+        """Passes wanted status changes (e.g. from index filter commands) on to the shards."""
+        for room_id, wanted in list(self._sent_wanted.items()):
+            now_wanted = self.index.wants(room_id)
+            if now_wanted != wanted:
+                self._sent_wanted[room_id] = now_wanted
+                self._send(shard_for(room_id, self.shards), "wanted", room_id, now_wanted)
+
+    def tick(self):
+        self._sync_wanted()
+        super().tick()
+
+    def pop_completed_info(self):
+        with self._state_lock:
+            infos, self._completed_info = self._completed_info, []
+        return infos
+
+    def _all_info(self):
+        with self._state_lock:
+            return [info for shard_info in self._shard_info for info in shard_info]
+
+    def get_info_by_mode(self, mode):
+        modes = WatchQueue.MODE_GROUPS.get(mode, (mode,))
+        return [info for info in self._all_info() if info['mode'] in modes]
+
+    def count_by_mode(self, mode):
+        return len(self.get_info_by_mode(mode))
+
+    def get_admission_info(self):
+        with self._state_lock:
+            reports = [e for e in self._shard_admission if e]
+        total = {key: sum(e[key] for e in reports) for key in ("preemptions", "overruns")}
+        for kind in ("watch", "download"):
+            total[kind] = {key: sum(e[kind][key] or 0 for e in reports)
+                           for key in ("limit", "active", "queued")}
+        return total
+
+    def get_latency_info(self):
+        with self._state_lock:
+            return merge_info(self._shard_latency)
+
+    def get_reaper_info(self):
+        with self._state_lock:
+            reports = list(self._shard_reaper)
+        # the coordinator runs no Watchers of its own
+        return {key: sum(e.get(key, 0) for e in reports) for key in self.reaper.get_info()}
+
+    def get_limiter_info(self):
+        # each shard is a process, with a limiter of its own
+        with self._state_lock:
+            info = {"shard{}".format(shard): e for shard, e in enumerate(self._shard_limiter)}
+        info["coordinator"] = super().get_limiter_info()
+        return info
+
+    def get_circuit_info(self):
+        with self._state_lock:
+            info = {"shard{}".format(shard): e for shard, e in enumerate(self._shard_circuits)}
+        info["coordinator"] = super().get_circuit_info()
+        return info
+
+    def get_endpoint_info(self):
+        # percentiles don't add up across processes, so each shard's are kept apart
+        with self._state_lock:
+            info = {"shard{}".format(shard): e for shard, e in enumerate(self._shard_endpoints)}
+        info["coordinator"] = super().get_endpoint_info()
+        return info
+
+    def collect_metrics(self):
+        # the metrics the workers count for themselves, which the registry adds to the coordinator's own
+        with self._state_lock:
+            families = [family for shard_metrics in self._shard_metrics for family in shard_metrics]
+        return super().collect_metrics() + families
+
+    def stop(self, timeout=None):
+        for shard in range(self.shards):
+            self._send(shard, "stop")
+        def done():
+            # a worker that died never reports back
+            return all(shard in self._stopped_shards or not worker.is_alive()
+                       for shard, worker in enumerate(self._workers))
+
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._stopped:
+            while not done():
+                if deadline is not None and time.time() > deadline:
+                    shard_logger.warn('Timed out waiting for shards to stop')
+                    break
+                self._stopped.wait(1.0)
+        for worker in self._workers:
+            worker.join(timeout)
+        super().stop()
@@ -0,0 +1,114 @@
+# Adaptive polling rates for onlives and upcoming
+import datetime
+import logging
+
+from . import clock
+from .constants import TOKYO_TZ
+
+throttle_logger = logging.getLogger('showroom.throttle')
+
+
+class AdaptiveRate(object):
+    """Picks the seconds between polls of an endpoint from recent activity.
+
+    Starting from a base rate (e.g. throttle.rate.onlives), the rate is:
+        - min_rate for boost seconds after a poll turns up something new
+        - max_rate during quiet_hours (JST), overnight when almost nothing starts
+        - min_rate within boundary seconds of :00 and :30 JST, when most lives start
+        - otherwise the base rate, multiplied by backoff for each consecutive poll
+          that returned exactly the same data as the one before it, up to backoff_max
+
+    and is always kept within [min_rate, max_rate]. backoff_max bounds how much
+    slower than usual polling gets outside quiet hours, e.g. onlives, which is
+    what detects lives, never backs off past its usual rate.
+
+    Callers report each poll's result to observe() as a set-like signature of
+    what they care about, e.g. the (room_id, live_id) pairs of indexed rooms.
+    """
+    def __init__(self, min_rate, max_rate, boundary=180.0, boost=300.0, backoff=1.5, quiet_hours=None,
+                 name="poll", backoff_max=None):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.backoff_max = backoff_max or max_rate
+        self.boundary = boundary
+        self.boost = boost
+        self.backoff = backoff
+        self.quiet_hours = tuple(quiet_hours) if quiet_hours else None
+        self.name = name
+
+        self._signature = None
+        self._repeats = 0
+        self._boost_until = None
+        self._last_rate = None
+
+    @classmethod
+    def from_settings(cls, settings, name):
+        """Builds the rate for throttle.adaptive.<name>, or returns None if disabled."""
+        adaptive = settings.throttle.adaptive
+        if not adaptive or not adaptive.enabled:
+            return None
+        return cls(adaptive[name].min, adaptive[name].max,
+                   boundary=adaptive.boundary, boost=adaptive.boost,
+                   backoff=adaptive.backoff, quiet_hours=adaptive.quiet_hours,
+                   name=name, backoff_max=adaptive[name].backoff_max)
+
+    @property
+    def repeats(self):
+        """Number of consecutive polls that returned the same data."""
+        return self._repeats
+
+    def observe(self, signature, now=None):
+        """Records the result of a poll.
+
+        Args:
+            signature: a set (or frozenset) describing the poll's result
+            now: aware datetime of the poll, defaults to now
+        """
+        if now is None:
+            now = clock.now()
+        signature = frozenset(signature)
+        if self._signature is not None:
+            if signature == self._signature:
+                self._repeats += 1
+            else:
+                self._repeats = 0
+                if signature - self._signature:
+                    self._boost_until = now + datetime.timedelta(seconds=self.boost)
+        self._signature = signature
+
+    def _near_boundary(self, now):
+        seconds = (now.minute % 30) * 60 + now.second
+        return seconds <= self.boundary or 1800 - seconds <= self.boundary
+
+    def _quiet(self, now):
+        if not self.quiet_hours:
+            return False
+        start, end = self.quiet_hours
+        if start <= end:
+            return start <= now.hour < end
+        else:
+            # e.g. (23, 6) wraps around midnight
+            return now.hour >= start or now.hour < end
+
+    def get_rate(self, base_rate, now=None):
+        """Returns the number of seconds to wait between polls right now."""
+        if now is None:
+            now = clock.now()
+        else:
+            now = now.astimezone(TOKYO_TZ)
+
+        if self._boost_until is not None and now < self._boost_until:
+            rate = self.min_rate
+        elif self._quiet(now):
+            rate = self.max_rate
+        elif self._near_boundary(now):
+            rate = self.min_rate
+        else:
+            # repeats is capped only to keep the power finite, max_rate applies long before
+            rate = min(base_rate * self.backoff ** min(self._repeats, 32), self.backoff_max)
+
+        rate = max(self.min_rate, min(self.max_rate, rate))
+        if rate != self._last_rate:
+            throttle_logger.debug('{} rate is now {:.1f}s'.format(self.name, rate))
+            self._last_rate = rate
+        return rate
@@ -0,0 +1,162 @@
+# Incremental schedule source paging through time_tables
+import logging
+import os
+
+from . import clock, codec
+from .upcoming import time_table_to_upcoming
+
+timetable_logger = logging.getLogger('showroom.timetable')
+
+# most requests made for a single window, in case paging stops advancing
+MAX_PAGES_PER_WINDOW = 10
+
+
+class TimeTableSource(object):
+    """Keeps an up to date schedule from time_tables, fetching as little as possible.
+
+    The time ahead of now is split into fixed windows of window seconds, aligned
+    to multiples of window so they keep the same bounds from one cycle to the next.
+    Each window is fetched by paging time_tables forward from the window's start,
+    and saved to the cache directory as {started_at}.json, keyed by the window start.
+
+    Each refresh() re-fetches only the head, the windows starting within head
+    seconds from now, where schedules still change often. Windows further ahead, up
+    to horizon seconds, are read from the cache until it is older than max_age.
+
+    refresh() returns only what changed since the last refresh, as upcoming
+    entries (with next_live_start_at): rooms newly scheduled, and rooms whose next
+    start moved, plus, if told which rooms have a Watcher, every room that has
+    none, e.g. because its Watcher expired or it wasn't claimed. Feed these to
+    WatchManager.apply_schedule(), which creates or reschedules Watchers accordingly.
+
+    Args:
+        client: a ShowroomClient
+        cache_dir: directory for cached windows, None to keep them in memory only
+        window: seconds covered by each cached window
+        head: seconds ahead of now that are always re-fetched
+        horizon: seconds ahead of now to follow the schedule
+        max_age: seconds cached windows beyond the head are trusted for
+    """
+    def __init__(self, client, cache_dir=None, window=3600.0, head=7200.0, horizon=86400.0, max_age=1800.0):
+        self._client = client
+        self.cache_dir = cache_dir
+        self.window = int(window)
+        self.head = head
+        self.horizon = horizon
+        self.max_age = max_age
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        # window start -> {"fetched": POSIX time, "entries": [...]}
+        self._windows = {}
+        # room_id -> next start, as last returned by refresh()
+        self._known = {}
+        self.requests = 0
+
+    @classmethod
+    def from_settings(cls, settings, client):
+        """Builds the source from schedule.time_tables, or returns None if disabled."""
+        config = settings.schedule.time_tables
+        if not config or not config.enabled:
+            return None
+        return cls(client, cache_dir=config.cache, window=config.window, head=config.head,
+                   horizon=config.horizon, max_age=config.max_age)
+
+    def _cache_path(self, start):
+        return os.path.join(self.cache_dir, '{}.json'.format(start))
+
+    def _load(self, start):
+        if start in self._windows:
+            return self._windows[start]
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._cache_path(start), encoding='utf8') as infp:
+                page = codec.load(infp)
+        except (FileNotFoundError, ValueError):
+            return None
+        self._windows[start] = page
+        return page
+
+    def _save(self, start, page):
+        self._windows[start] = page
+        if not self.cache_dir:
+            return
+        temp = self._cache_path(start) + '.tmp'
+        with open(temp, 'w', encoding='utf8') as outfp:
+            codec.dump(page, outfp, compact=True)
+        os.replace(temp, self._cache_path(start))
+
+    def _fetch_window(self, start, now):
+        """Pages through time_tables from start until past the end of the window."""
+        end = start + self.window
+        entries, seen = [], set()
+        started_at = start
+        for _ in range(MAX_PAGES_PER_WINDOW):
+            result = self._client.time_tables(started_at=started_at) or {}
+            self.requests += 1
+            page = [e for e in (time_table_to_upcoming(entry) for entry in result.get('time_tables') or [])
+                    if e is not None]
+            last = started_at
+            for item in page:
+                item_start = int(item['next_live_start_at'])
+                key = (str(item['room_id']), item.get('live_id'), item_start)
+                if start <= item_start < end and key not in seen:
+                    seen.add(key)
+                    entries.append(item)
+                last = max(last, item_start)
+            if not page or last >= end:
+                break
+            # every entry on the page started at the same time, step past it
+            started_at = last if last > started_at else started_at + 1
+        else:
+            timetable_logger.debug('Gave up paging time_tables window {} after {} pages'.format(
+                start, MAX_PAGES_PER_WINDOW))
+        return {"fetched": now, "entries": entries}
+
+    def _prune(self, first):
+        """Forgets windows that have ended."""
+        for start in [s for s in self._windows if s < first]:
+            del self._windows[start]
+            if self.cache_dir:
+                try:
+                    os.remove(self._cache_path(start))
+                except FileNotFoundError:
+                    pass
+
+    def refresh(self, now=None, watching=None):
+        """Brings the schedule up to date.
+
+        Args:
+            now: POSIX time to refresh at, defaults to now
+            watching: optional room_ids that have a Watcher, entries for any other
+                room are returned whether or not they changed
+
+        Returns:
+            upcoming entries for rooms that are new, whose next start changed, or
+            that aren't being watched
+        """
+        now = now or clock.time()
+        first = int(now) - int(now) % self.window
+        self._prune(first)
+
+        schedule = {}
+        for start in range(first, int(now + self.horizon), self.window):
+            page = self._load(start)
+            if page is None or start < now + self.head or now - page["fetched"] > self.max_age:
+                page = self._fetch_window(start, now)
+                self._save(start, page)
+            for item in page["entries"]:
+                room_id = str(item['room_id'])
+                item_start = float(item['next_live_start_at'])
+                if item_start < now:
+                    continue
+                if room_id not in schedule or item_start < float(schedule[room_id]['next_live_start_at']):
+                    schedule[room_id] = item
+
+        changes = [item for room_id, item in schedule.items()
+                   if self._known.get(room_id) != float(item['next_live_start_at'])
+                   or (watching is not None and room_id not in watching)]
+        self._known = {room_id: float(item['next_live_start_at']) for room_id, item in schedule.items()}
+        if changes:
+            timetable_logger.debug('{} new, rescheduled or unwatched lives in time_tables'.format(len(changes)))
+        return changes
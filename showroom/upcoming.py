@@ -0,0 +1,112 @@
+# Concurrent schedule ingestion from upcoming and time_tables
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from requests.exceptions import RequestException
+
+upcoming_logger = logging.getLogger('showroom.upcoming')
+
+
+def time_table_to_upcoming(entry):
+    """Converts a time_tables entry to the shape of an upcoming entry, or returns None.
+
+    time_tables entries have started_at where upcoming has next_live_start_at.
+    """
+    room_id = entry.get('room_id')
+    started_at = entry.get('started_at')
+    if room_id is None or not started_at:
+        return None
+    item = dict(entry)
+    item['next_live_start_at'] = started_at
+    return item
+
+
+def merge_upcoming(items):
+    """Deduplicates upcoming entries from several sources.
+
+    The same live shows up once per genre it is listed in, and again in time_tables.
+    As a room only ever has one Watcher, only each room's earliest start is kept.
+
+    Returns:
+        list of upcoming entries, one per room_id
+    """
+    by_room = {}
+    for item in items:
+        room_id = str(item['room_id'])
+        current = by_room.get(room_id)
+        if current is None or float(item['next_live_start_at']) < float(current['next_live_start_at']):
+            by_room[room_id] = item
+    return list(by_room.values())
+
+
+class ScheduleFetcher(object):
+    """Fetches the schedule from every configured source at once.
+
+    Each genre's upcoming list, and optionally time_tables, are requested in
+    parallel from a small thread pool, sharing the client's pooled session, so
+    adding genres doesn't add to the time a tick spends waiting on the network.
+
+    Args:
+        client: a ShowroomClient
+        genres: genre_ids to fetch upcoming for
+        time_tables: optional TimeTableSource, which only contributes the lives
+            that changed since the last fetch
+        workers: size of the thread pool
+    """
+    def __init__(self, client, genres, time_tables=None, workers=4):
+        self._client = client
+        self.genres = list(genres)
+        self.time_tables = time_tables
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ScheduleFetcher')
+
+    def _fetch_upcoming(self, genre_id):
+        items = self._client.upcoming(genre_id=genre_id) or []
+        # a changed payload fails this genre, rather than merge_upcoming and the whole fetch
+        for item in items:
+            if 'room_id' not in item or 'next_live_start_at' not in item:
+                raise KeyError('upcoming entry without room_id or next_live_start_at: {}'.format(item))
+        return items
+
+    def _fetch_time_tables(self, watching):
+        return self.time_tables.refresh(watching=watching)
+
+    def fetch(self, watching=None):
+        """Fetches and merges every source.
+
+        Args:
+            watching: optional room_ids that already have a Watcher, see TimeTableSource.refresh()
+
+        Sources that fail, whether the request failed or its response wasn't
+        what was expected, are logged and skipped, unless all of them fail.
+
+        Returns:
+            merged list of upcoming entries, see merge_upcoming()
+
+        Raises:
+            RequestException, ValueError or KeyError: the first source's error, if every source failed
+        """
+        futures = {self._executor.submit(self._fetch_upcoming, genre_id): 'upcoming {}'.format(genre_id)
+                   for genre_id in self.genres}
+        if self.time_tables is not None:
+            futures[self._executor.submit(self._fetch_time_tables, watching)] = 'time_tables'
+
+        items, errors = [], []
+        for future in as_completed(futures):
+            try:
+                items.extend(future.result())
+            except (RequestException, ValueError, KeyError) as e:
+                errors.append((futures[future], e))
+
+        if errors:
+            if len(errors) == len(futures):
+                raise errors[0][1]
+            for source, e in errors:
+                if isinstance(e, RequestException):
+                    upcoming_logger.debug('Fetching {} failed: {}'.format(source, e))
+                else:
+                    # not a network problem, the response may have changed shape
+                    upcoming_logger.warning('Unexpected response fetching {}: {!r}'.format(source, e))
+        return merge_upcoming(items)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,19 @@
+import pytest
+
+from showroom.index import Room
+from showroom.settings import ShowroomSettings, DEFAULTS
+
+
+@pytest.fixture
+def settings(tmp_path):
+    settings = ShowroomSettings(DEFAULTS)
+    settings.directory.data = str(tmp_path)
+    settings.directory.output = str(tmp_path)
+    settings.feedback.write_schedules_to_file = False
+    return settings
+
+
+def make_room(room_id, priority=5):
+    return Room({"room_id": str(room_id), "engName": "Room {}".format(room_id),
+                 "jpnName": "Room {}".format(room_id), "engTeam": "Team", "jpnTeam": "Team",
+                 "priority": priority, "web_url": "/room_{}".format(room_id)})
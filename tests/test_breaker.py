@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from showroom.api.breaker import CircuitBreaker, CircuitOpenError, is_failure
+
+ONLIVES = "https://www.showroom-live.com/api/live/onlives"
+
+
+def open_circuit(breaker, url=ONLIVES):
+    for _ in range(breaker.threshold):
+        breaker.before(url)
+        breaker.record(url, True)
+
+
+def state(breaker):
+    return breaker.get_info()["/api/live/onlives"]["state"]
+
+
+def test_is_failure():
+    assert is_failure(500) and is_failure(503)
+    assert not is_failure(200) and not is_failure(404) and not is_failure(429)
+    assert is_failure("timeout")
+
+
+def test_opens_after_threshold_failures_in_a_row():
+    breaker = CircuitBreaker(threshold=3, cooldown=60.0)
+    for _ in range(2):
+        breaker.record(ONLIVES, True)
+    breaker.record(ONLIVES, False)
+    breaker.record(ONLIVES, True)
+    breaker.record(ONLIVES, True)
+    assert state(breaker) == "closed"
+    breaker.record(ONLIVES, True)
+    assert state(breaker) == "open"
+    with pytest.raises(CircuitOpenError) as info:
+        breaker.before(ONLIVES)
+    assert info.value.response.status_code == 503
+    assert breaker.get_info()["/api/live/onlives"]["rejected"] == 1
+
+
+def test_other_endpoints_are_unaffected():
+    breaker = CircuitBreaker(threshold=1, cooldown=60.0)
+    open_circuit(breaker)
+    breaker.before("https://www.showroom-live.com/room/is_live")
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+    open_circuit(breaker)
+    time.sleep(0.06)
+    breaker.before(ONLIVES)
+    assert state(breaker) == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before(ONLIVES)
+
+
+def test_probe_success_closes():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+    open_circuit(breaker)
+    time.sleep(0.06)
+    breaker.before(ONLIVES)
+    breaker.record(ONLIVES, False)
+    assert state(breaker) == "closed"
+    breaker.before(ONLIVES)
+
+
+def test_probe_failure_reopens():
+    breaker = CircuitBreaker(threshold=5, cooldown=0.05)
+    open_circuit(breaker)
+    time.sleep(0.06)
+    breaker.before(ONLIVES)
+    breaker.record(ONLIVES, True)
+    info = breaker.get_info()["/api/live/onlives"]
+    assert (info["state"], info["opens"]) == ("open", 2)
+
+
+def test_check_never_lets_a_probe_through():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+    breaker.check(ONLIVES)
+    open_circuit(breaker)
+    time.sleep(0.06)
+    with pytest.raises(CircuitOpenError):
+        breaker.check(ONLIVES)
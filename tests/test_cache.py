@@ -0,0 +1,73 @@
+from requests import Response
+
+from showroom.api.cache import ResponseCache
+
+
+def make_response(**headers):
+    response = Response()
+    response.status_code = 200
+    response.headers.update(headers)
+    return response
+
+
+def test_lookup_fresh_then_stale():
+    cache = ResponseCache(ttls={"/api/live/onlives": 3.0})
+    response = make_response()
+    cache.store("/api/live/onlives", None, response, now=100.0)
+    assert cache.lookup("/api/live/onlives", now=102.0) == (response, True)
+    assert cache.lookup("/api/live/onlives", now=104.0) == (response, False)
+
+
+def test_lookup_miss():
+    cache = ResponseCache()
+    assert cache.lookup("/api/live/onlives", now=100.0) == (None, False)
+
+
+def test_params_order_and_none_are_ignored():
+    cache = ResponseCache()
+    response = make_response()
+    cache.store("/api/room/profile", {"room_id": 1, "b": 2, "c": None}, response, now=100.0)
+    assert cache.lookup("/api/room/profile", {"b": 2, "room_id": "1"}, now=101.0) == (response, True)
+    assert cache.lookup("/api/room/profile", {"room_id": 2}, now=101.0) == (None, False)
+
+
+def test_uncached_endpoint_is_never_fresh():
+    cache = ResponseCache()
+    assert cache.ttl("/room/is_live") == 0
+    cache.store("/room/is_live", None, make_response(), now=100.0)
+    assert cache.lookup("/room/is_live", now=100.0)[1] is False
+
+
+def test_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    for room_id in (1, 2):
+        cache.store("/api/room/profile", {"room_id": room_id}, make_response(), now=100.0)
+    # touching 1 makes 2 the least recently used
+    cache.lookup("/api/room/profile", {"room_id": 1}, now=100.0)
+    cache.store("/api/room/profile", {"room_id": 3}, make_response(), now=100.0)
+    assert cache.lookup("/api/room/profile", {"room_id": 2}, now=100.0) == (None, False)
+    assert cache.lookup("/api/room/profile", {"room_id": 1}, now=100.0)[0] is not None
+    assert cache.get_info()["evictions"] == 1
+
+
+def test_conditional_headers():
+    assert ResponseCache.conditional_headers(make_response()) is None
+    headers = ResponseCache.conditional_headers(make_response(**{"ETag": '"abc"',
+                                                                 "Last-Modified": "Sat, 17 Oct 2026 00:00:00 GMT"}))
+    assert headers == {"If-None-Match": '"abc"', "If-Modified-Since": "Sat, 17 Oct 2026 00:00:00 GMT"}
+
+
+def test_record_counts_outcomes():
+    cache = ResponseCache()
+    cache.record("/api/live/onlives", "hit")
+    cache.record("/api/live/onlives", "hit")
+    cache.record("/api/live/upcoming", "miss")
+    info = cache.get_info()
+    assert (info["hit"], info["miss"], info["revalidated"]) == (2, 1, 0)
+    assert info["endpoints"]["/api/live/onlives"]["hit"] == 2
+
+
+def test_from_settings(settings):
+    assert isinstance(ResponseCache.from_settings(settings), ResponseCache)
+    settings.http.cache.enabled = False
+    assert ResponseCache.from_settings(settings) is None
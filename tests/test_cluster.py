@@ -0,0 +1,71 @@
+import json
+
+from showroom.cluster import FileLeaseStore, RoomLeases
+
+from conftest import make_room
+
+
+def make_leases(tmp_path, node, **kwargs):
+    return RoomLeases(FileLeaseStore(str(tmp_path / "leases")), node=node, **kwargs)
+
+
+def test_one_node_per_slot(tmp_path):
+    a, b = make_leases(tmp_path, "a"), make_leases(tmp_path, "b")
+    room = make_room(1)
+    assert a.claim(room) and a.holds(room.room_id)
+    assert not b.claim(room)
+    # claiming again is a no-op for the holder
+    assert a.claim(room)
+
+
+def test_redundancy_gives_each_node_its_own_slot(tmp_path):
+    redundancy = [[3, 2]]
+    a, b, c = (make_leases(tmp_path, node, redundancy=redundancy) for node in "abc")
+    wanted, unwanted = make_room(1, priority=2), make_room(2, priority=10)
+    assert a.copies(wanted.priority) == 2 and a.copies(unwanted.priority) == 1
+    assert a.claim(wanted) and b.claim(wanted) and not c.claim(wanted)
+    assert a.claim(unwanted) and not b.claim(unwanted)
+
+
+def test_release_frees_the_slot(tmp_path):
+    a, b = make_leases(tmp_path, "a"), make_leases(tmp_path, "b")
+    room = make_room(1)
+    a.claim(room)
+    a.release(room.room_id)
+    assert not a.holds(room.room_id)
+    assert b.claim(room)
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    a, b = make_leases(tmp_path, "a", ttl=60.0), make_leases(tmp_path, "b", ttl=60.0)
+    room = make_room(1)
+    a.claim(room)
+    # a stops renewing, and its lease runs out
+    path = tmp_path / "leases" / "room_1_0.lease"
+    path.write_text(json.dumps({"node": "a", "expires": 0}))
+    assert b.claim(room)
+    assert a.renew(force=True) == ["1"]
+    assert not a.holds(room.room_id)
+
+
+def test_renew_keeps_leases_it_could_not_renew(tmp_path):
+    a = make_leases(tmp_path, "a")
+    room = make_room(1)
+    a.claim(room)
+    a.store.acquire = lambda key, node, ttl: False
+    assert a.renew(force=True) == []
+    assert a.holds(room.room_id)
+    # and tries again on the next call, not ttl/3 later
+    assert a._renewed == 0.0
+
+
+def test_renew_is_rate_limited(tmp_path):
+    a = make_leases(tmp_path, "a", ttl=60.0)
+    a.claim(make_room(1))
+    renewed = []
+    acquire = a.store.acquire
+    a.store.acquire = lambda key, node, ttl: renewed.append(key) or acquire(key, node, ttl)
+    a.renew()
+    assert renewed == []
+    a.renew(force=True)
+    assert renewed == ["room_1_0"]
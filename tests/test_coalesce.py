@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from showroom.api.coalesce import SingleFlight, FlightTimeout
+
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def func():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return object()
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", func)))
+    leader.start()
+    assert started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("key", func))) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    # the followers wait on the leader's flight
+    while flight.coalesced < 4:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+    assert len(calls) == 1
+    assert len(results) == 5 and all(r is results[0] for r in results)
+    assert flight.get_info() == {"calls": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_error_is_raised_to_everyone():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def func():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("key", func)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    while flight.coalesced < 1:
+        threading.Event().wait(0.01)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert len(errors) == 2 and errors[0] is errors[1]
+
+
+def test_nothing_is_remembered():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    assert flight.get_info() == {"calls": 2, "coalesced": 0, "in_flight": 0}
+
+
+def test_follower_timeout():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def func():
+        started.set()
+        release.wait(5)
+
+    leader = threading.Thread(target=flight.do, args=("key", func))
+    leader.start()
+    assert started.wait(5)
+    try:
+        with pytest.raises(FlightTimeout):
+            flight.do("key", func, timeout=0.05)
+    finally:
+        release.set()
+        leader.join(5)
@@ -0,0 +1,86 @@
+import pytest
+
+from showroom.api.limiter import TokenBucket, RateLimiter, endpoint_class, retry_after
+
+IS_LIVE = "https://www.showroom-live.com/room/is_live?room_id=1"
+PROFILE = "https://www.showroom-live.com/api/room/profile?room_id=1"
+
+
+def test_endpoint_class():
+    assert endpoint_class(IS_LIVE) == ("www.showroom-live.com", "detection")
+    assert endpoint_class("https://www.showroom-live.com/api/live/upcoming") == ("www.showroom-live.com", "schedule")
+    assert endpoint_class("https://www.showroom-live.com/api/live/telop") == ("www.showroom-live.com", "live")
+    assert endpoint_class(PROFILE) == ("www.showroom-live.com", "profile")
+
+
+def test_bucket_burst_then_rate():
+    bucket = TokenBucket(2.0, 3)
+    now = bucket._updated
+    for _ in range(3):
+        assert bucket.delay(now) == 0
+        bucket.tokens -= 1
+    assert bucket.delay(now) == pytest.approx(0.5)
+    # half a second later a token has been earned
+    assert bucket.delay(now + 0.5) == 0
+
+
+def test_bucket_refill_is_capped_at_burst():
+    bucket = TokenBucket(2.0, 3)
+    bucket.delay(bucket._updated + 3600)
+    assert bucket.tokens == 3
+
+
+def test_unlimited_bucket():
+    bucket = TokenBucket(None, 1)
+    now = bucket._updated
+    for _ in range(10):
+        assert bucket.delay(now) == 0
+        bucket.tokens -= 1
+
+
+def test_classes_without_a_rate_are_not_limited():
+    limiter = RateLimiter()
+    for _ in range(100):
+        assert limiter.acquire(PROFILE, timeout=0) is not None
+
+
+def test_acquire_times_out_once_burst_is_spent():
+    limiter = RateLimiter(rates={"profile": 0.01}, bursts={"profile": 2})
+    assert limiter.acquire(PROFILE, timeout=0) is not None
+    assert limiter.acquire(PROFILE, timeout=0) is not None
+    assert limiter.acquire(PROFILE, timeout=0.05) is None
+    # other classes have their own bucket
+    assert limiter.acquire(IS_LIVE, timeout=0) is not None
+
+
+def test_backoff_doubles_up_to_max():
+    limiter = RateLimiter(backoff=30.0, max_backoff=100.0)
+    assert [limiter.backoff(IS_LIVE) for _ in range(4)] == [30.0, 60.0, 100.0, 100.0]
+    limiter.succeeded(IS_LIVE)
+    assert limiter.backoff(IS_LIVE) == 30.0
+
+
+def test_backoff_holds_every_class_on_the_host():
+    limiter = RateLimiter()
+    assert limiter.backoff(IS_LIVE, seconds=60.0) == 60.0
+    assert limiter.acquire(PROFILE, timeout=0.05) is None
+    assert limiter.acquire(IS_LIVE, timeout=0.05) is None
+    assert limiter.acquire("https://other.example.com/room/is_live", timeout=0) is not None
+
+
+def test_set_rate_returns_previous():
+    limiter = RateLimiter(rates={"profile": 1.0})
+    assert limiter.set_rate("profile", 10.0, burst=50) == (1.0, 5)
+    assert limiter.set_rate("profile", None) == (10.0, 50)
+
+
+def test_retry_after():
+    class FakeResponse(object):
+        def __init__(self, value):
+            self.headers = {"Retry-After": value} if value is not None else {}
+
+    assert retry_after(None) is None
+    assert retry_after(FakeResponse(None)) is None
+    assert retry_after(FakeResponse("120")) == 120.0
+    assert retry_after(FakeResponse("soon")) is None
+    assert retry_after(FakeResponse("Thu, 01 Jan 1970 00:00:00 GMT")) == 0.0
@@ -0,0 +1,69 @@
+import random
+
+from showroom.core import Watcher, WatchQueue
+
+from conftest import make_room
+
+MODES = ("schedule", "watch", "live", "download", "quitting", "expired", "completed")
+
+
+def make_watchers(settings, count):
+    return [Watcher(make_room(i, priority=i % 7 + 1), None, settings) for i in range(count)]
+
+
+def test_counts_follow_mode_changes(settings):
+    queue = WatchQueue()
+    watchers = make_watchers(settings, 3)
+    for watcher in watchers:
+        queue.add(watcher)
+    assert queue.count_by_mode(watchers[0].mode) == 3
+    watchers[0]._mode = "live"
+    watchers[1]._mode = "download"
+    assert queue.count_by_mode("live") == 2
+    assert queue.count_by_mode("download") == 1
+    assert queue.count_by_mode("active") == 2
+    assert {w.room_id for w in queue.get_by_mode("live")} == {watchers[0].room_id, watchers[1].room_id}
+
+
+def test_removed_watchers_are_not_counted(settings):
+    queue = WatchQueue()
+    watchers = make_watchers(settings, 3)
+    for watcher in watchers:
+        queue.add(watcher)
+        watcher._mode = "watch"
+    queue.remove(watchers[0])
+    assert queue.dirty_pop(watchers[1]) is watchers[1]
+    assert queue.count_by_mode("watch") == 1
+    # and no longer followed
+    watchers[0]._mode = "live"
+    assert queue.count_by_mode("live") == 0
+
+
+def test_counts_match_a_full_scan(settings):
+    rng = random.Random(0)
+    queue = WatchQueue()
+    watchers = make_watchers(settings, 50)
+    for watcher in watchers:
+        queue.add(watcher)
+    for _ in range(500):
+        watcher = rng.choice(watchers)
+        if watcher.room_id not in queue:
+            continue
+        watcher._mode = rng.choice(MODES)
+        if rng.random() < 0.05:
+            queue.dirty_pop(watcher)
+    for mode in MODES + tuple(WatchQueue.MODE_GROUPS):
+        expected = sorted(w.room_id for w in queue if w.mode in queue._expand_mode(mode))
+        assert sorted(w.room_id for w in queue.get_by_mode(mode)) == expected, mode
+        assert queue.count_by_mode(mode) == len(expected), mode
+
+
+def test_pop_is_in_priority_order(settings):
+    queue = WatchQueue()
+    for watcher in make_watchers(settings, 20):
+        queue.add(watcher)
+    priorities = []
+    while queue:
+        priorities.append(queue.pop().priority)
+    assert priorities == sorted(priorities)
+    assert queue.count_by_mode("working") == 0